@@ -2,9 +2,12 @@ import os, config
 from flask import config, url_for
 import requests
 import base64
-import smtplib
+import logging
+import mailer
 from email.message import EmailMessage
 
+logger = logging.getLogger(__name__)
+
 def send_notification(notification_type, booking_id=None, name=None, phone=None, email=None,
                     check_in=None, check_out=None, guests=None, note=None, message=None, to_email=None):
     """
@@ -295,11 +298,11 @@ def send_notification(notification_type, booking_id=None, name=None, phone=None,
                 json=payload
             )
             if response.status_code in {200, 202}:
-                print(f"✅ {notification_type} email sent via Sender API")
+                logger.info("%s email sent via Sender API", notification_type)
             else:
-                print("❌ Failed via Sender:", response.status_code, response.text)
-        except Exception as e:
-            print("❌ Exception via Sender:", e)
+                logger.error("%s email failed via Sender: HTTP %s %s", notification_type, response.status_code, response.text[:500])
+        except Exception:
+            logger.exception("%s email failed via Sender", notification_type)
 
     else:
         # --- Local: SMTP ---
@@ -321,12 +324,7 @@ def send_notification(notification_type, booking_id=None, name=None, phone=None,
                     msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
 
             # Send email    
-            with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server: # type: ignore
-                    server.starttls()
-                    if config.SMTP_USER is not None and config.SMTP_PASS is not None:  # type: ignore
-                        server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore 
-                    server.send_message(msg)
-            server.send_message(msg)
-            print(f"✅ {notification_type} email sent via SMTP")
-        except Exception as e:
-            print("❌ Failed via SMTP:", e)
\ No newline at end of file
+            mailer.send(msg)
+            logger.info("%s email sent via SMTP", notification_type)
+        except Exception:
+            logger.exception("%s email failed via SMTP", notification_type)
\ No newline at end of file
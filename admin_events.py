@@ -0,0 +1,158 @@
+# Live admin events: one shared watcher fanned out to every open admin tab over SSE
+#
+# A single background thread follows bookings/feedbacks/contacts through a MongoDB
+# change stream (replica sets / Atlas). Standalone servers and mongomock cannot open
+# change streams, so the thread falls back to polling: new documents by _id, and
+# booking status changes by audit.updated_at (deletes are not visible when polling).
+# The thread runs only while at least one admin tab is subscribed.
+#
+# Each open tab holds its /admin/events response, and with it a worker thread, for as
+# long as it stays open. Under sync gunicorn workers every tab takes a whole worker away
+# from the public site, so run the app with threaded or gevent workers (e.g.
+# `gunicorn -k gthread --threads 8` or `-k gevent`) and keep ADMIN_EVENTS_MAX_STREAMS
+# (streams per process) below the thread count. A tab over the cap gets a 503 and its
+# script retries later; the lists still work, they just stop updating live.
+import json, queue, threading, time, logging
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+IST = ZoneInfo("Asia/Kolkata")
+
+# Fields sent to the browser for each collection
+SUMMARY_FIELDS = {
+    "bookings": ("name", "phone", "email", "check_in", "check_out", "guests", "status", "created_at"),
+    "feedbacks": ("name", "rating", "comments", "created_at"),
+    "contacts": ("name", "email", "message", "created_at"),
+}
+
+def _format(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(IST).strftime("%d-%m-%Y %I:%M %p")
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+def summarize(collection, doc):
+    return {field: _format(doc.get(field)) for field in SUMMARY_FIELDS[collection] if field in doc}
+
+def format_sse(event):
+    return f"event: {event['collection']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+class EventHub:
+    def __init__(self, db, collections=tuple(SUMMARY_FIELDS), poll_interval=3.0, queue_size=100, mode="auto"):
+        self.db = db
+        self.collections = list(collections)
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.mode = mode
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.dropped = 0
+
+    def subscribe(self, limit=0):
+        """A queue of events for one tab, or None when `limit` (0 = no limit) tabs already listen."""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if limit and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(q)
+            # A thread that crashed leaves _thread set but dead
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="admin-events", daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # A stalled tab must not hold up the others
+                self.dropped += 1
+
+    def _active(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def _run(self):
+        polling = self.mode == "poll"
+        while True:
+            if not polling:
+                try:
+                    self._watch()
+                except Exception as e:
+                    # Standalone mongod raises OperationFailure; mock clients have no watch() at all
+                    logger.warning("Change streams unavailable (%s), polling instead", e)
+                    polling = True
+            if polling:
+                self._poll()
+            # Checked under the lock subscribe() takes: a tab that subscribed after the loop
+            # saw no subscribers found this thread still alive and did not start another
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+
+    def _watch(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": self.collections},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        resume_token = None
+        while self._active():
+            try:
+                with self.db.watch(pipeline, full_document="updateLookup", resume_after=resume_token,
+                                   max_await_time_ms=1000) as stream:
+                    while self._active() and stream.alive:
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        self.publish(self._from_change(change))
+            except OperationFailure:
+                raise
+            except PyMongoError:
+                logger.exception("Admin change stream interrupted, resuming")
+                time.sleep(1)
+
+    def _from_change(self, change):
+        collection = change["ns"]["coll"]
+        op = "delete" if change["operationType"] == "delete" else (
+            "insert" if change["operationType"] == "insert" else "update")
+        doc = change.get("fullDocument") or {}
+        return {"collection": collection, "op": op, "id": str(change["documentKey"]["_id"]),
+                "doc": summarize(collection, doc) if doc else {}}
+
+    def _poll(self):
+        last_ids = {}
+        for name in self.collections:
+            latest = self.db[name].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+            last_ids[name] = latest["_id"] if latest else ObjectId.from_datetime(datetime.now(timezone.utc))
+        since = datetime.now(timezone.utc)
+        while self._active():
+            time.sleep(self.poll_interval)
+            try:
+                for name in self.collections:
+                    for doc in self.db[name].find({"_id": {"$gt": last_ids[name]}}).sort("_id", 1).limit(100):
+                        last_ids[name] = doc["_id"]
+                        self.publish({"collection": name, "op": "insert", "id": str(doc["_id"]), "doc": summarize(name, doc)})
+                checked = datetime.now(timezone.utc)
+                if "bookings" in self.collections:
+                    for doc in self.db.bookings.find({"audit.updated_at": {"$gt": since}}).limit(100):
+                        self.publish({"collection": "bookings", "op": "update", "id": str(doc["_id"]), "doc": summarize("bookings", doc)})
+                since = checked
+            except PyMongoError:
+                logger.exception("Admin event poll failed")
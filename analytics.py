@@ -0,0 +1,235 @@
+# Pre-aggregated occupancy and rating rollups for the admin dashboard
+#
+# rollup_nightly          _id "YYYY-MM-DD": guests.<Status>, bookings.<Status>
+# rollup_booking_monthly  _id "YYYY-MM" (check-in month): total, status.<Status>, guests.<Status>
+# rollup_rating_monthly   _id "YYYY-MM" (IST month of submission): count, sum, histogram.<0-10>
+#
+# Writes to bookings/feedbacks call apply_booking()/apply_feedback() with the document
+# before and after the change; the difference is applied as $inc upserts, so the
+# dashboard never scans or parses the raw collections. The rollups are derived data: a
+# failed update is logged and left for rebuild() rather than failing the write that
+# already committed. rebuild() recomputes every rollup from scratch with aggregation
+# pipelines over bookings plus archived bookings, into temporary collections that are
+# renamed over the live ones at the end, so the dashboard never reads a half-built set.
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+IST = ZoneInfo("Asia/Kolkata")
+NIGHTLY = "rollup_nightly"
+BOOKING_MONTHLY = "rollup_booking_monthly"
+RATING_MONTHLY = "rollup_rating_monthly"
+ARCHIVE_COLLECTION = "bookings_archive"  # retention.CollectionArchive
+REBUILD_SUFFIX = "_rebuild"
+
+def _nights(check_in, check_out):
+    try:
+        day = datetime.strptime(check_in, "%Y-%m-%d").date()
+        last = datetime.strptime(check_out, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return []
+    nights = []
+    while day < last:
+        nights.append(day.isoformat())
+        day += timedelta(days=1)
+    return nights
+
+def _booking_incs(booking, sign, incs):
+    if not booking:
+        return
+    status = booking.get("status") or "Pending"
+    guests = int(booking.get("guests") or 0)
+    for night in _nights(booking.get("check_in"), booking.get("check_out")):
+        incs[(NIGHTLY, night)][f"guests.{status}"] += sign * guests
+        incs[(NIGHTLY, night)][f"bookings.{status}"] += sign
+    month = (booking.get("check_in") or "")[:7]
+    if month:
+        incs[(BOOKING_MONTHLY, month)]["total"] += sign
+        incs[(BOOKING_MONTHLY, month)][f"status.{status}"] += sign
+        incs[(BOOKING_MONTHLY, month)][f"guests.{status}"] += sign * guests
+
+def _month_ist(value):
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:  # PyMongo hands back naive UTC
+        value = value.replace(tzinfo=ZoneInfo("UTC"))
+    return value.astimezone(IST).strftime("%Y-%m")
+
+def _feedback_incs(feedback, sign, incs):
+    if not feedback or feedback.get("rating") is None:
+        return
+    month = _month_ist(feedback.get("created_at"))
+    if not month:
+        return
+    rating = int(feedback["rating"])
+    incs[(RATING_MONTHLY, month)]["count"] += sign
+    incs[(RATING_MONTHLY, month)]["sum"] += sign * rating
+    incs[(RATING_MONTHLY, month)][f"histogram.{rating}"] += sign
+
+def _apply(db, incs, suffix=""):
+    by_collection = defaultdict(list)
+    for (collection, key), fields in incs.items():
+        fields = {field: delta for field, delta in fields.items() if delta}
+        if fields:
+            by_collection[collection + suffix].append(UpdateOne({"_id": key}, {"$inc": fields}, upsert=True))
+    for collection, ops in by_collection.items():
+        db[collection].bulk_write(ops, ordered=False)
+
+def _apply_logged(db, incs, what):
+    try:
+        _apply(db, incs)
+        return True
+    except PyMongoError:
+        logger.exception("Rollup update for %s failed; `flask rebuild-rollups` repairs it", what)
+        return False
+
+def apply_booking(db, old, new):
+    """Move a booking's contribution from `old` to `new` (either may be None); False if it failed."""
+    incs = defaultdict(lambda: defaultdict(int))
+    _booking_incs(old, -1, incs)
+    _booking_incs(new, 1, incs)
+    return _apply_logged(db, incs, f"booking {(new or old or {}).get('_id')}")
+
+def apply_feedback(db, old, new):
+    incs = defaultdict(lambda: defaultdict(int))
+    _feedback_incs(old, -1, incs)
+    _feedback_incs(new, 1, incs)
+    return _apply_logged(db, incs, f"feedback {(new or old or {}).get('_id')}")
+
+def _swap_in(db, collection):
+    temp = collection + REBUILD_SUFFIX
+    if temp in db.list_collection_names(filter={"name": temp}):
+        db[temp].rename(collection, dropTarget=True)
+    else:
+        db[collection].drop()  # nothing to aggregate
+
+def rebuild(db, archived=(), batch_size=500):
+    """Recompute every rollup from the raw collections (needs MongoDB 5.0+).
+
+    Bookings come from bookings, bookings_archive and `archived` (documents kept outside
+    Mongo, i.e. the file archive); a booking present in more than one counts once.
+    """
+    temps = [name + REBUILD_SUFFIX for name in (NIGHTLY, BOOKING_MONTHLY, RATING_MONTHLY)]
+    for temp in temps:
+        db[temp].drop()
+
+    status = {"$ifNull": ["$status", "Pending"]}
+    guests = {"$toInt": {"$ifNull": ["$guests", 0]}}
+    # Live bookings first, so one caught between archive write and delete counts as live
+    all_bookings = [
+        {"$unionWith": ARCHIVE_COLLECTION},
+        {"$group": {"_id": "$_id", "doc": {"$first": "$$ROOT"}}},
+        {"$replaceWith": "$doc"},
+    ]
+    db.bookings.aggregate(all_bookings + [
+        {"$match": {"check_in": {"$type": "string"}, "check_out": {"$type": "string"}}},
+        {"$set": {
+            "ci": {"$dateFromString": {"dateString": "$check_in", "format": "%Y-%m-%d", "onError": None}},
+            "co": {"$dateFromString": {"dateString": "$check_out", "format": "%Y-%m-%d", "onError": None}},
+        }},
+        {"$match": {"ci": {"$ne": None}, "co": {"$ne": None}}},
+        {"$set": {"offset": {"$range": [0, {"$max": [0, {"$dateDiff": {"startDate": "$ci", "endDate": "$co", "unit": "day"}}]}]}}},
+        {"$unwind": "$offset"},
+        {"$group": {
+            "_id": {"night": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$dateAdd": {"startDate": "$ci", "unit": "day", "amount": "$offset"}}}},
+                    "status": status},
+            "guests": {"$sum": guests},
+            "bookings": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": "$_id.night",
+            "guests": {"$push": {"k": "$_id.status", "v": "$guests"}},
+            "bookings": {"$push": {"k": "$_id.status", "v": "$bookings"}},
+        }},
+        {"$set": {"guests": {"$arrayToObject": "$guests"}, "bookings": {"$arrayToObject": "$bookings"}}},
+        {"$out": NIGHTLY + REBUILD_SUFFIX},
+    ])
+    db.bookings.aggregate(all_bookings + [
+        {"$match": {"check_in": {"$type": "string"}}},
+        {"$group": {"_id": {"month": {"$substrCP": ["$check_in", 0, 7]}, "status": status},
+                    "count": {"$sum": 1}, "guests": {"$sum": guests}}},
+        {"$group": {
+            "_id": "$_id.month",
+            "total": {"$sum": "$count"},
+            "status": {"$push": {"k": "$_id.status", "v": "$count"}},
+            "guests": {"$push": {"k": "$_id.status", "v": "$guests"}},
+        }},
+        {"$set": {"status": {"$arrayToObject": "$status"}, "guests": {"$arrayToObject": "$guests"}}},
+        {"$out": BOOKING_MONTHLY + REBUILD_SUFFIX},
+    ])
+    db.feedbacks.aggregate([
+        {"$match": {"rating": {"$ne": None}, "created_at": {"$type": "date"}}},
+        {"$group": {"_id": {"month": {"$dateToString": {"format": "%Y-%m", "date": "$created_at", "timezone": "Asia/Kolkata"}},
+                            "rating": {"$toString": "$rating"}},
+                    "count": {"$sum": 1}, "sum": {"$sum": "$rating"}}},
+        {"$group": {
+            "_id": "$_id.month",
+            "count": {"$sum": "$count"},
+            "sum": {"$sum": "$sum"},
+            "histogram": {"$push": {"k": "$_id.rating", "v": "$count"}},
+        }},
+        {"$set": {"histogram": {"$arrayToObject": "$histogram"}}},
+        {"$out": RATING_MONTHLY + REBUILD_SUFFIX},
+    ])
+
+    batch = []
+    for doc in archived:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _add_archived(db, batch)
+            batch = []
+    if batch:
+        _add_archived(db, batch)
+
+    for collection in (NIGHTLY, BOOKING_MONTHLY, RATING_MONTHLY):
+        _swap_in(db, collection)
+
+def _add_archived(db, docs):
+    ids = [d["_id"] for d in docs]
+    known = {d["_id"] for d in db.bookings.find({"_id": {"$in": ids}}, {"_id": 1})}
+    known |= {d["_id"] for d in db[ARCHIVE_COLLECTION].find({"_id": {"$in": ids}}, {"_id": 1})}
+    incs = defaultdict(lambda: defaultdict(int))
+    for doc in docs:
+        if doc["_id"] not in known:
+            _booking_incs(doc, 1, incs)
+    _apply(db, incs, REBUILD_SUFFIX)
+
+def dashboard(db, year, month=None):
+    """Everything the dashboard shows, read from rollup documents only."""
+    months = [f"{year}-{m:02d}" for m in range(1, 13)]
+    bookings = {d["_id"]: d for d in db[BOOKING_MONTHLY].find({"_id": {"$in": months}})}
+    ratings = {d["_id"]: d for d in db[RATING_MONTHLY].find({"_id": {"$in": months}})}
+    rows = []
+    for key in months:
+        b, r = bookings.get(key, {}), ratings.get(key, {})
+        rows.append({
+            "month": key,
+            "total": b.get("total", 0),
+            "status": b.get("status", {}),
+            "guests": b.get("guests", {}),
+            "ratings": r.get("count", 0),
+            "average": round(r["sum"] / r["count"], 1) if r.get("count") else None,
+            "histogram": [r.get("histogram", {}).get(str(i), 0) for i in range(11)],
+        })
+    nights = []
+    if month:
+        prefix = f"{year}-{month:02d}-"
+        nights = list(db[NIGHTLY].find({"_id": {"$gte": prefix + "01", "$lte": prefix + "31"}}).sort("_id", 1))
+    return rows, nights
+
+def availability(db, start, end, capacity=0):
+    """Per-night guests already booked (Accepted, and Pending holds) between two ISO dates, end exclusive."""
+    nights = {d["_id"]: d for d in db[NIGHTLY].find({"_id": {"$gte": start, "$lt": end}})}
+    days = []
+    for night in _nights(start, end):
+        guests = nights.get(night, {}).get("guests", {})
+        day = {"date": night, "accepted": guests.get("Accepted", 0), "pending": guests.get("Pending", 0)}
+        if capacity:
+            day["available"] = max(capacity - day["accepted"], 0)
+        days.append(day)
+    return days
@@ -0,0 +1,61 @@
+# Helpers for the versioned JSON API under /api/v1 (routes live in app.py)
+#
+# Responses are compact JSON with a weak ETag over the body, so the Vercel edge and
+# browsers can revalidate with If-None-Match and get a bodyless 304. Public reads set
+# s-maxage for the CDN; writes are never cached. Lists page with opaque cursors
+# instead of page numbers, so a page stays stable while images are added.
+import base64, gzip, hashlib, json
+from flask import Response, request
+
+API_PREFIX = "/api/v1"
+COMPRESSIBLE = {"application/json", "text/html", "text/css", "text/plain", "application/javascript", "text/javascript"}
+
+def _dumps(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def json_response(payload, status=200, max_age=0, shared_max_age=None):
+    response = Response(_dumps(payload), status=status, mimetype="application/json")
+    if request.method in ("GET", "HEAD") and status == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        if shared_max_age is not None:
+            response.cache_control.s_maxage = shared_max_age
+            response.cache_control["stale-while-revalidate"] = str(shared_max_age)
+        # Weak: the edge may re-encode (gzip/brotli) without changing the meaning
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+        response.make_conditional(request)
+    else:
+        response.cache_control.no_store = True
+    return response
+
+def api_error(message, status=400, **extra):
+    return json_response({"error": message, **extra}, status=status)
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(_dumps(value).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+def gzip_response(response, min_size=500, level=6):
+    """Compress a buffered response in place when the client accepts gzip."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+    response.vary.add("Accept-Encoding")
+    if "gzip" not in request.accept_encodings:
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=level))
+    response.headers["Content-Encoding"] = "gzip"
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
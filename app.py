@@ -1,25 +1,128 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, abort, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, Response, jsonify
 from flask_pymongo import PyMongo
+from pymongo import ReturnDocument
 from bson.objectid import ObjectId
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 from werkzeug.security import check_password_hash
-from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin
-import smtplib, os
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
+import os, queue
+import click
 from email.message import EmailMessage
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
 import gridfs
 from Email_Notification import *
 from dotenv import load_dotenv
 import config
+import db_pool
+from uploads import UploadRequest, stream_to_gridfs
+from gallery_assets import GalleryAssetStore, is_asset_ref, asset_digest
+from gallery_catalog import GALLERY_CATEGORIES
+import gallery_images
+import exports
+import analytics
+import admin_events
+import search
+import api
+import freeze
+import rate_limit
+import idempotency
+import scheduler
+import retention
+import image_metadata
+import feedback_photos
+import app_logging
+import profiler
+import template_cache
+import query_budget
+import mailer
+import sms_gateway
+import media
+import photo_fingerprints
 load_dotenv()
 
 app = Flask(__name__)
+# Request threads only enqueue log records; a listener thread writes them (app_logging.py)
+log_pipeline = app_logging.LoggingPipeline(
+    fmt=config.LOG_FORMAT, level=config.LOG_LEVEL, levels=app_logging.parse_levels(config.LOG_LEVELS),
+    debug_sample_rate=config.LOG_DEBUG_SAMPLE_RATE, queue_size=config.LOG_QUEUE_SIZE
+)
+log_pipeline.install(app)
 app.config["MONGO_URI"] = config.MONGO_URI # type: ignore
 app.config["SECRET_KEY"] = config.SECRET_KEY # type: ignore
+app.config["MAX_CONTENT_LENGTH"] = config.MAX_CONTENT_LENGTH
+app.request_class = UploadRequest  # streams file parts, see uploads.py
 
-mongo = PyMongo(app)
+# Command monitoring for the query budgets is only attached when they are checked
+mongo = PyMongo(app, **db_pool.client_options([query_budget.listener] if config.QUERY_BUDGETS != "off" else []))
+if config.QUERY_BUDGETS != "off":
+    query_budget.install(app, config.QUERY_BUDGETS)
 db = mongo.db  # Ensure this line comes after app is fully configured
+# Read-only public pages may be served from secondaries (MONGO_PUBLIC_READ_PREFERENCE)
+public_db = db.with_options(read_preference=db_pool.read_preference(config.MONGO_PUBLIC_READ_PREFERENCE)) if db is not None else None
+
+# Shed floods of public form posts before they reach Mongo or SMTP (rate_limit.py)
+rate_limiter = rate_limit.RateLimiter(
+    rate_limit.MongoBackend(db) if config.RATE_LIMIT_BACKEND == "mongo" else rate_limit.MemoryBackend(),
+    proxy_hops=config.RATE_LIMIT_PROXY_HOPS
+)
+
+@app.before_request
+def shed_rate_limited_posts():
+    if not config.RATE_LIMIT_ENABLED:
+        return None
+    limited = rate_limiter.check(request)
+    if limited is None:
+        return None
+    reason, retry_after = limited
+    if request.path.startswith(api.API_PREFIX + "/"):
+        response = api.api_error("Too many requests, please try again later.", 429, retry_after=retry_after)
+    else:
+        response = app.make_response((render_template("429.html", retry_after=retry_after), 429))
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+# Repeated taps on Submit replay the first result instead of booking twice (idempotency.py)
+def submission_in_progress():
+    if request.path.startswith(api.API_PREFIX + "/"):
+        return api.api_error("This request is still being processed.", 409)
+    flash("Your submission is still being processed, please wait a moment.", "info")
+    return redirect(request.path)
+
+def submission_received():
+    # The view failed after storing the submission: confirm it rather than invite a resubmit
+    if request.path.startswith(api.API_PREFIX + "/"):
+        return api.json_response({"status": "received"}, status=202)
+    flash("Your submission was received, thank you.", "success")
+    return redirect(request.path)
+
+idempotent = idempotency.IdempotencyGuard(db, ttl_seconds=config.IDEMPOTENCY_TTL_SECONDS)(submission_in_progress, submission_received)
+app.jinja_env.globals["idempotency_key"] = idempotency.new_key
+# Intrinsic size and placeholder for gallery <img> tags (image_metadata.py)
+app.jinja_env.globals["img_size"] = image_metadata.img_size
+app.jinja_env.globals["placeholder_style"] = image_metadata.placeholder_style
+
+# Compiled templates survive restarts (template_cache.py)
+template_cache.install(app, config.JINJA_CACHE_DIR and os.path.join(app.root_path, config.JINJA_CACHE_DIR))
+if config.WARM_TEMPLATES_ON_BOOT:
+    template_cache.warm(app.jinja_env)
+
+@app.cli.command("warm-templates")
+@click.option("--report", is_flag=True, help="Compare compiling each template with loading its cached bytecode.")
+def warm_templates(report):
+    """Compile every template into the bytecode cache (run at build time)."""
+    timings = template_cache.warm(app.jinja_env)
+    print(f"Templates warmed: {len(timings)} in {sum(timings.values()):.1f} ms, cache: {config.JINJA_CACHE_DIR or 'off'}")
+    if report:
+        rows = template_cache.report(app.jinja_env)
+        print(f"{'template':32} {'compile':>10} {'bytecode':>10}")
+        for row in rows:
+            bytecode = f"{row['bytecode_ms']:8.2f}ms" if row["bytecode_ms"] is not None else "         -"
+            print(f"{row['template']:32} {row['compile_ms']:8.2f}ms {bytecode}")
+        compile_total = sum(r["compile_ms"] for r in rows)
+        bytecode_total = sum(r["bytecode_ms"] or 0 for r in rows)
+        print(f"{'total':32} {compile_total:8.2f}ms {bytecode_total:8.2f}ms")
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -36,42 +139,8 @@ def load_user(user_id):
     admin_doc = db.admins.find_one({"_id": ObjectId(user_id)}) # type: ignore
     return AdminUser(admin_doc) if admin_doc else None
 
-# List of gallery images (exact filenames)
-GALLERY_CATEGORIES = {
-    "entrances": {
-        "title": "Entrances",
-        "images": [
-            "Entrance_1.0.jpeg",
-            "Entrance_1.1.jpeg"
-        ]
-    },
-    "hotel_view": {
-        "title": "Hotel View",
-        "images": [
-            "Hotel_View_1.0.jpeg",
-            "Hotel_View_1.1.jpeg",
-            "Hotel_View_1.2.jpeg",
-            "Hotel_View_2.0.jpeg",
-            "Hotel_View_2.1.jpeg",
-            "Hotel_View_2.2.jpeg",
-            "Hotel_View_3.jpeg"
-        ]
-    },
-    "outside": {
-        "title": "Outside Views",
-        "images": [
-            "Outside_Hotel_Railway_Track.jpeg",
-            "Outside_Road_Track_Before_Hotel.jpeg",
-            "Welcome_To_Matheran.jpeg"
-        ]
-    },
-    "signs": {
-        "title": "Signboards",
-        "images": [
-            "Ranchoddas_Arogya_Bhavan.jpeg"
-        ]
-    }
-}
+# Metadata of the bundled static images, written by generate_thumbnails.py
+static_image_metadata = image_metadata.StaticManifest(os.path.join(app.static_folder, "images")) # type: ignore
 
 @app.route("/")
 def index():
@@ -84,7 +153,7 @@ def index():
                 combined.append(im)
     # Limit to max 10
     carousel_images = combined[:10]
-    return render_template("index.html", images=carousel_images, page_class="home-page")
+    return render_template("index.html", images=carousel_images, image_meta=static_image_metadata.get(), page_class="home-page")
 
 @app.route("/about")
 def about():
@@ -92,41 +161,160 @@ def about():
 
 PER_PAGE = 8  # images per page for category pages
 
+# The gallery views read gallery_images only; move any legacy categories.images arrays first
+if db is not None:
+    gallery_images.migrate_pending(db, os.path.join(app.static_folder, "images")) # type: ignore
+
 @app.route("/gallery")
 def gallery():
-    cats = list(db.categories.find()) # type: ignore
+    # image_count and sample are maintained on the category document (gallery_images.py)
+    cats = list(public_db.categories.find({}, {"key": 1, "title": 1, "sample": 1, "image_count": 1})) # type: ignore
     categories = []
     for c in cats:
-        sample = c.get("images", [])[:3]
         categories.append({
             "key": c["key"],
             "title": c["title"],
-            "sample": sample,
-            "count": len(c.get("images", []))
+            "sample": c.get("sample", []),
+            "count": c.get("image_count", 0)
         })
     return render_template("gallery.html", categories=categories)
     
+# /page/<n> is the path-only form of ?page=n, so the static export can freeze every page
 @app.route("/gallery/<category>")
-def gallery_category(category):
-    meta = db.categories.find_one({"key": category}) # type: ignore
+@app.route("/gallery/<category>/page/<int:page>")
+def gallery_category(category, page=None):
+    meta = public_db.categories.find_one({"key": category}, {"title": 1, "image_count": 1}) # type: ignore
     if not meta:
         abort(404)
-    page = int(request.args.get("page", 1))
-    images = meta.get("images", [])
-    total = len(images)
+    page = page or int(request.args.get("page", 1))
+    total = meta.get("image_count", 0)
     pages = (total + PER_PAGE - 1) // PER_PAGE
-    start = (page - 1) * PER_PAGE
-    end = start + PER_PAGE
-    page_images = images[start:end]
+    page_images = gallery_images.page(public_db, category, page, PER_PAGE)
     return render_template("gallery_category.html", category=category, title=meta["title"], images=page_images, page=page, pages=pages, total=total)
 
+# Uploaded gallery images live in the asset store and are referenced as "sha256:<hex>"
+gallery_store = GalleryAssetStore(db, config.GALLERY_ASSET_DIR) # type: ignore
+
+# Large files are handed to sendfile or the front proxy (MEDIA_MODE, see media.py);
+# GridFS files are copied to a local disk cache first
+media_cache = media.DiskCache(os.path.join(app.root_path, config.MEDIA_CACHE_DIR), config.MEDIA_CACHE_MAX_MB * 1024 * 1024)
+media_server = media.MediaServer(config.MEDIA_MODE, config.MEDIA_ACCEL_PREFIX, {
+    "static": app.static_folder, "cache": media_cache.directory, "assets": config.GALLERY_ASSET_DIR})
+media_server.install(app)
+
+def cached_media(key, open_file):
+    """(path, mimetype) of a GridFS file on local disk, copying it on the first request."""
+    cached = media_cache.lookup(key)
+    if cached is None:
+        file = open_file()
+        cached = media_cache.store(key, file, file.content_type or "application/octet-stream")
+    return cached
+
+@app.template_global()
+def gallery_image_url(image, thumb=False):
+    if is_asset_ref(image):
+        return url_for("gallery_asset_thumb" if thumb else "gallery_asset", digest=asset_digest(image))
+    return url_for("static", filename=("images/thumbs/" if thumb else "images/") + image)
+
+def send_gallery_asset(stored, etag, cache_key):
+    """Response for a stored blob or thumbnail (a gallery_blobs document or its `thumb`)."""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif media_server.enabled:
+        if config.GALLERY_ASSET_DIR:
+            path = gallery_store.backend.path(stored["_id"])
+        else:
+            path, _ = cached_media(cache_key, lambda: gallery_store.open(stored))
+        response = media_server.send(path, stored["content_type"], etag=etag)
+    else:
+        response = Response(wrap_file(request.environ, gallery_store.open(stored)), mimetype=stored["content_type"], direct_passthrough=True)
+        response.content_length = stored["size"]
+    # Content-addressed: the bytes behind this URL can never change
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/gallery/asset/<digest>")
+def gallery_asset(digest):
+    blob = gallery_store.get(digest)
+    if not blob:
+        abort(404)
+    return send_gallery_asset(blob, digest, digest)
+
+# Grid-sized rendition; blobs stored before thumbnails existed (or undecodable ones)
+# get the original until generate_thumbnails.py has filled theirs in
+@app.route("/gallery/asset/<digest>/thumb")
+def gallery_asset_thumb(digest):
+    blob = gallery_store.get(digest)
+    if not blob:
+        abort(404)
+    if not blob.get("thumb"):
+        return send_gallery_asset(blob, digest, digest)
+    # Cache keys match by prefix, so the thumbnail's must not start with the digest
+    return send_gallery_asset(blob["thumb"], blob["thumb"]["_id"], "thumb-" + digest)
+
+@app.cli.command("create-indexes")
+def create_indexes():
+    """Create the MongoDB indexes the app relies on."""
+    gallery_images.ensure_indexes(db)
+    search.ensure_indexes(db)
+    rate_limit.MongoBackend(db).ensure_indexes()
+    idempotency.ensure_indexes(db)
+    booking_archive.ensure_indexes()
+    request_profiler.ensure_indexes(config.PROFILER_RETENTION_DAYS)
+    photo_index.ensure_indexes()
+    print("Contacts TTL index:", retention.ensure_contacts_ttl(db, config.CONTACT_RETENTION_DAYS))
+    print("Indexes created.")
+
+@app.cli.command("migrate-gallery-images")
+def migrate_gallery_images():
+    """One-shot move of categories.images arrays into the gallery_images collection."""
+    gallery_images.ensure_indexes(db)
+    print("Images migrated:", gallery_images.migrate(db, os.path.join(app.static_folder, "images"))) # type: ignore
+
+@app.cli.command("reclaim-gallery-blobs")
+def reclaim_gallery_blobs():
+    """Delete gallery blobs that no category references any more."""
+    print("Reclaimed blobs:", gallery_store.reclaim_unused())
+
+# ------------------ STATIC EXPORT ------------------
+site_freezer = freeze.Freezer(app, os.path.join(app.root_path, config.FREEZE_DIR), gallery_store)
+
+def frozen_pages():
+    """(url, data) for every public page; a page is re-rendered when its data changes."""
+    yield "/", {"carousel": GALLERY_CATEGORIES, "meta": static_image_metadata.get()}
+    yield "/about", {}
+    # Same read preference as the pages themselves, so hashes match what gets rendered
+    cats = list(public_db.categories.find({}, {"_id": 0, "key": 1, "title": 1, "sample": 1, "image_count": 1}).sort("key")) # type: ignore
+    yield "/gallery", cats
+    images = gallery_images.images_by_category(public_db, [c["key"] for c in cats])
+    for c in cats:
+        refs = [{"image": d["image"], "meta": d.get("meta")} for d in images[c["key"]]]
+        pages = max((len(refs) + PER_PAGE - 1) // PER_PAGE, 1)
+        for page in range(1, pages + 1):
+            url = url_for("gallery_category", category=c["key"], page=page if page > 1 else None)
+            yield url, {"title": c["title"], "pages": pages, "images": refs[(page - 1) * PER_PAGE:page * PER_PAGE]}
+
+def freeze_pages():
+    with app.test_request_context():
+        return list(frozen_pages())
+
+@app.cli.command("freeze")
+@click.option("--force", is_flag=True, help="Re-render every page, not only the changed ones.")
+def freeze_site(force):
+    """Render the public pages into FREEZE_DIR for static hosting."""
+    rendered, removed = site_freezer.freeze(freeze_pages(), force=force)
+    print(f"Pages rendered: {len(rendered)}, removed: {len(removed)}, output: {site_freezer.output_dir}")
+
 # ------------------ ADMIN GALLERY EDIT ------------------
 # Gallery & Feedback allowed extentions
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
 
 def allowed_file(filename):
     ext_ok = '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-    print("Checking file:", filename, "Allowed:", ext_ok)
+    app.logger.debug("Checking file %s allowed=%s", filename, ext_ok)
     return ext_ok
 
 @app.route("/gallery/edit", methods=["GET", "POST"])
@@ -143,257 +331,120 @@ def gallery_edit():
             db.categories.insert_one({ # type: ignore
                 "title": title,
                 "key": key,
-                "images": [],
+                "image_count": 0,
+                "sample": [],
                 "created_at": datetime.now(timezone.utc)
             })
             flash("Category added.", "success")
 
         # Delete category
         elif action == "delete_category" and category_id:
-            db.categories.delete_one({"_id": ObjectId(category_id)}) # pyright: ignore[reportOptionalMemberAccess]
+            category = db.categories.find_one_and_delete({"_id": ObjectId(category_id)}) # pyright: ignore[reportOptionalMemberAccess]
+            if category:
+                for image in gallery_images.remove_category(db, category["key"]):
+                    gallery_store.release(image)
             flash("Category deleted.", "info")
 
         # Add image (upload file)
         elif action == "add_image" and category_id and "file" in request.files:
             file = request.files["file"]
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename) # type: ignore
-                
-                db.categories.update_one( # type: ignore
-                    {"_id": ObjectId(category_id)},
-                    {"$push": {"images": filename}}
-                )
-                flash("Image uploaded and added.", "success")
+            if file and allowed_file(file.filename) and file.stream.stored:
+                image = gallery_store.put(file.stream, file.stream.mimetype)
+                file.stream.seek(0)
+                meta = image_metadata.extract(file.stream)
+                # One reference per category; the unique (category_key, image) index rejects repeats
+                if gallery_images.add_image(db, {"_id": ObjectId(category_id)}, image, file.stream.mimetype, file.stream.size, meta):
+                    flash("Image uploaded and added.", "success")
+                else:
+                    gallery_store.release(image)
+                    flash("This image is already in the category.", "info")
             else:
-                flash("Invalid file type.", "danger")
+                flash(f"Invalid file: {file.stream.rejected or 'type not allowed'}.", "danger")
 
-        # Delete image (remove from DB and filesystem)
+        # Delete image (remove from category and drop its blob reference)
         elif action == "delete_image" and category_id:
             filename = request.form.get("filename")
-            db.categories.update_one( # type: ignore
-                {"_id": ObjectId(category_id)},
-                {"$pull": {"images": filename}}
-            )
+            category = db.categories.find_one({"_id": ObjectId(category_id)}, {"key": 1}) # type: ignore
+            if category and gallery_images.remove_image(db, category["key"], filename):
+                gallery_store.release(filename)
             flash("Image deleted.", "info")
 
+        if config.FREEZE_ON_GALLERY_EDIT:
+            site_freezer.schedule(freeze_pages)
         return redirect(url_for("gallery_edit"))
 
     cats = list(db.categories.find().sort("created_at", -1)) # type: ignore
+    # One query for every category's images, already in position order
+    images = gallery_images.images_by_category(db, [c["key"] for c in cats])
     for c in cats:
-        c["images"] = sorted(c.get("images", []))
+        c["images"] = [d["image"] for d in images[c["key"]]]
     return render_template("gallery_edit.html", categories=cats)
 
-# Booking create with validation and optional email confirmation
-@app.route("/booking", methods=["GET", "POST"])
-def booking():  # sourcery skip: last-if-guard
-    if request.method != "POST":
-        return render_template("booking.html")
-    
-    name = request.form.get("name")
-    phone = request.form.get("phone")
-    email = request.form.get("email")
-    check_in = request.form.get("check_in")
-    check_out = request.form.get("check_out")
-    guests = int(request.form.get("guests", 1))
-    note = request.form.get("note", "")
-
-    # Server-side validation
-    if not check_in or not check_out:
-        flash("Check-in and check-out dates are required.", "danger")
-        return redirect(url_for("booking"))
-    try:
-        ci = datetime.strptime(check_in, "%Y-%m-%d").date()
-        co = datetime.strptime(check_out, "%Y-%m-%d").date()
-    except Exception:
-        flash("Invalid dates provided.", "danger")
-        return redirect(url_for("booking"))
-
-    if ci >= co:
-        flash("Check-out date must be after check-in date.", "danger")
-        return redirect(url_for("booking"))
-
-    booking_doc = {
-        "name": name,
-        "phone": phone,
-        "email": email,
-        "check_in": check_in,
-        "check_out": check_out,
-        "guests": guests,
-        "note": note,
-        "created_at": datetime.now(ZoneInfo("Asia/Kolkata")),  # 12-hour format
-        "status": "Pending"
-    }
-    result = db.bookings.insert_one(booking_doc) # type: ignore
-    booking_id = str(result.inserted_id)
-    flash(f"Booking created successfully. Booking ID: {booking_id}", "success")
-    
-    # Optional email creation for guest
-    def booking_pending(email, name, booking_id, check_in, check_out):
-        if config.SMTP_HOST and getattr(config, "ADMIN_EMAIL", None): # type: ignore
-            try:
-                msg = EmailMessage()
-                msg["Subject"] = f"New Booking Alert - ID {booking_id}"
-                msg["From"] = config.SMTP_USER
-                msg["To"] = email
-                msg.set_content(
-                    f"Dear {name},\n\nYour booking (ID: {booking_id}) is generated in the system and is currently pending acceptance "
-                    f"for {check_in} to {check_out}.\n\nKindly wait for further confirmation mail.\n\n"
-                    f"Thanks for your cooperation.\n\nRegards,\nShri Ranchoddas Hindu Arogya Bhavan\nMatheran Hill Station"
-                )
-                
-                html_body = f"""
-                <html>
-                <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px; color: #333; }}
-                    .card {{ background: #fff; border-radius: 8px; padding: 20px; box-shadow: 0 2px 6px rgba(0,0,0,0.1); }}
-                    .logo {{ text-align: center; margin-bottom: 20px; }}
-                    .logo img {{ max-width: 180px; height: auto; border-radius: 8px; }}
-                    h2 {{ color: #0b8a61; }}
-                </style>
-                </head>
-                <body>
-                <div class="card">
-                    <div class="logo">
-                    <img src="cid:RAG_Logo" alt="Ranchoddas Arogya Bhavan Logo" />
-                    </div>
-                    <p>Dear { name },</p>
-                    <p>Your booking (ID: { booking_id }) is generated in the system and is currently pending acceptance
-                    for Check-In: { check_in } to Check-Out: { check_out } at Shri Ranchoddas Hindu Arogya Bhavan Guest House.
-                    </p>
-                    <p>Kindly wait for further confirmation mail.</p>
-                    <p>Thanks for your cooperation.</p>
-                    <p>Regards,<br>Shri Ranchoddas Hindu Arogya Bhavan<br>From Matheran Hill Station</p>
-                </div>
-                </body>
-                </html>
-                """
-                msg.add_alternative(html_body, subtype="html")
-                # Attach logo image inline
-                with open("static/images/icons/RAG_Logo.png", "rb") as img:
-                    msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
-                
-                with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server: # type: ignore
-                    server.starttls()
-                    if config.SMTP_USER is not None and config.SMTP_PASS is not None: # type: ignore
-                        server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore
-                    server.send_message(msg)
-            except Exception: 
-                app.logger.exception("Failed to send guest notification email")
-                
-    booking_pending(email, name, booking_id, check_in, check_out)
+# ------------------ BOOKING STATUS ------------------
+# Allowed status transitions (from -> to). Every status change goes through update_booking().
+BOOKING_TRANSITIONS = {
+    "Pending": {"Accepted", "Rejected", "Expired"},
+    "Accepted": {"Pending", "Rejected"},
+    "Rejected": {"Pending", "Accepted"},
+    "Expired": {"Pending", "Accepted"},
+}
 
-    # 🔔 Notify admin by email
+# Guest mail for a booking that is (again) pending acceptance
+def notify_booking_pending(booking):
+    email, name, check_in, check_out = booking.get("email"), booking.get("name"), booking.get("check_in"), booking.get("check_out")
+    booking_id = str(booking["_id"])
     if config.SMTP_HOST and getattr(config, "ADMIN_EMAIL", None): # type: ignore
         try:
-            admin_msg = EmailMessage()
-            admin_msg["Subject"] = f"New Booking Alert - ID {booking_id}"
-            admin_msg["From"] = config.SMTP_USER # type: ignore
-            admin_msg["To"] = config.ADMIN_EMAIL # type: ignore
-            admin_msg.set_content(
-                f"A new booking has been created.\n\n"
-                f"Booking ID: {booking_id}\n"
-                f"Name: {name}\n"
-                f"Phone: {phone}\n"
-                f"Email: {email}\n"
-                f"Check-in: {check_in} → Check-out: {check_out}\n"
-                f"Guests: {guests}\n"
-                f"Note: {note}\n\n"
-                f"Please check the bookings list on the website to update the status."
+            msg = EmailMessage()
+            msg["Subject"] = f"New Booking Alert - ID {booking_id}"
+            msg["From"] = config.SMTP_USER
+            msg["To"] = email
+            msg.set_content(
+                f"Dear {name},\n\nYour booking (ID: {booking_id}) is generated in the system and is currently pending acceptance "
+                f"for {check_in} to {check_out}.\n\nKindly wait for further confirmation mail.\n\n"
+                f"Thanks for your cooperation.\n\nRegards,\nShri Ranchoddas Hindu Arogya Bhavan\nMatheran Hill Station"
             )
+
             html_body = f"""
             <html>
             <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px; color: #333; }}
-                    .card {{ background: #fff; border-radius: 8px; padding: 20px; box-shadow: 0 2px 6px rgba(0,0,0,0.1); }}
-                    .logo {{ text-align: center; margin-bottom: 20px; }}
-                    .logo img {{ max-width: 180px; height: auto; border-radius: 8px; }}
-                    h2 {{ color: #0b8a61; }}
-                </style>
+            <style>
+                body {{ font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px; color: #333; }}
+                .card {{ background: #fff; border-radius: 8px; padding: 20px; box-shadow: 0 2px 6px rgba(0,0,0,0.1); }}
+                .logo {{ text-align: center; margin-bottom: 20px; }}
+                .logo img {{ max-width: 180px; height: auto; border-radius: 8px; }}
+                h2 {{ color: #0b8a61; }}
+            </style>
             </head>
             <body>
             <div class="card">
                 <div class="logo">
                 <img src="cid:RAG_Logo" alt="Ranchoddas Arogya Bhavan Logo" />
                 </div>
-                <h2>New Booking Created</h2>
-                <p>A new booking has been created.</p>
-
-                <p><strong>Booking ID:</strong> { booking_id }</p>
-                <p><strong>Name:</strong> { name }</p>
-                <p><strong>Phone:</strong> { phone }</p>
-                <p><strong>Email:</strong> { email }</p>
-                <p><strong>Check-in:</strong> { check_in } → <strong>Check-out:</strong> { check_out }</p>
-                <p><strong>Guests:</strong> { guests }</p>
-                <p><strong>Note:</strong> { note }</p>
-
-                <p>Please check the bookings list on the website to update the status.</p>
+                <p>Dear { name },</p>
+                <p>Your booking (ID: { booking_id }) is generated in the system and is currently pending acceptance
+                for Check-In: { check_in } to Check-Out: { check_out } at Shri Ranchoddas Hindu Arogya Bhavan Guest House.
+                </p>
+                <p>Kindly wait for further confirmation mail.</p>
+                <p>Thanks for your cooperation.</p>
+                <p>Regards,<br>Shri Ranchoddas Hindu Arogya Bhavan<br>From Matheran Hill Station</p>
             </div>
             </body>
             </html>
             """
-            admin_msg.add_alternative(html_body, subtype="html")
+            msg.add_alternative(html_body, subtype="html")
             # Attach logo image inline
             with open("static/images/icons/RAG_Logo.png", "rb") as img:
-                admin_msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
-                
-            with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server: # type: ignore
-                server.starttls()
-                if config.SMTP_USER is not None and config.SMTP_PASS is not None: # type: ignore
-                    server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore
-                server.send_message(admin_msg)
-        except Exception:
-            app.logger.exception("Failed to send admin notification email")
-
-    # 📱 Optional: Notify admin by SMS (Twilio)
-    if getattr(config, "TWILIO_SID", None) and getattr(config, "ADMIN_PHONE", None):
-        try:
-            from twilio.rest import Client
-            client = Client(config.TWILIO_SID, config.TWILIO_AUTH_TOKEN) # type: ignore
-            client.messages.create(
-                body=f"Dear Admin You Have A New Booking Alert.\n\n"
-                f"Booking ID: {booking_id}\n"
-                f"Name: {name}\n"
-                f"Phone: {phone}\n"
-                f"Email: {email}\n"
-                f"Check-in: {check_in} to Check-out: {check_out}\n"
-                f"Guests: {guests}\n"
-                f"Note: {note}\n\n"
-                f"Please check the bookings list on the website to update the status.",
-                from_=config.TWILIO_PHONE, # type: ignore
-                to=config.ADMIN_PHONE if config.ADMIN_PHONE is not None else "" # type: ignore
-            )
-        except Exception:
-            app.logger.exception("Failed to send SMS notification")
-
-    return redirect(url_for("bookings_list"))
-
-# Bookings list protected for admin
-@app.route("/bookings")
-@login_required
-def bookings_list():
-    bookings = list(db.bookings.find().sort("created_at", 1)) # type: ignore
-    return render_template("bookings_list.html", bookings=bookings)
-
-@app.route("/booking/accept/<booking_id>", methods=["POST"])
-@login_required
-def booking_accept(booking_id):
-    booking = db.bookings.find_one({"_id": ObjectId(booking_id)}) # type: ignore
-    if not booking:
-        abort(404)
+                msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
 
-    db.bookings.update_one({"_id": ObjectId(booking_id)}, {"$set": {"status": "Accepted"}}) # type: ignore
-    flash("Booking accepted.", "success")
+            mailer.send(msg)
+        except Exception: 
+            app.logger.exception("Failed to send guest notification email")
 
-    # Send confirmation email only now
-    email = booking.get("email")
-    name = booking.get("name")
-    check_in = booking.get("check_in")
-    check_out = booking.get("check_out")
+# Booking Confirmation mail to guest
+def notify_booking_accepted(booking):
+    email, name, check_in, check_out = booking.get("email"), booking.get("name"), booking.get("check_in"), booking.get("check_out")
     booking_id = str(booking["_id"])
-    
-    # Booking Confirmation mail to guest
     if config.SMTP_HOST and email: # type: ignore
         try:
             msg = EmailMessage()
@@ -437,34 +488,14 @@ def booking_accept(booking_id):
             with open("static/images/icons/RAG_Logo.png", "rb") as img:
                 msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
             
-            with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server: # type: ignore
-                server.starttls()
-                if config.SMTP_USER is not None and config.SMTP_PASS is not None: # type: ignore
-                            server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore
-                server.send_message(msg)
+            mailer.send(msg)
         except Exception:
             app.logger.exception("Failed to send confirmation email")
 
-    return redirect(url_for("bookings_list"))
-
-@app.route("/booking/reject/<booking_id>", methods=["POST"])
-@login_required
-def booking_reject(booking_id):
-    booking = db.bookings.find_one({"_id": ObjectId(booking_id)}) # type: ignore
-    if not booking:
-        abort(404)
-
-    db.bookings.update_one({"_id": ObjectId(booking_id)}, {"$set": {"status": "Rejected"}}) # type: ignore
-    flash("Booking rejected.", "danger")
-
-    # Optional: notify customer of rejection
-    email = booking.get("email")
-    name = booking.get("name")
-    check_in = booking.get("check_in")
-    check_out = booking.get("check_out")
+# Booking Rejection mail to guests
+def notify_booking_rejected(booking):
+    email, name, check_in, check_out = booking.get("email"), booking.get("name"), booking.get("check_in"), booking.get("check_out")
     booking_id = str(booking["_id"])
-    
-    # Booking Rejection mail to guests
     if config.SMTP_HOST and email: # type: ignore
         try:
             msg = EmailMessage()
@@ -508,14 +539,270 @@ def booking_reject(booking_id):
             with open("static/images/icons/RAG_Logo.png", "rb") as img:
                 msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
                     
-            with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server: # type: ignore
-                server.starttls()
-                if config.SMTP_USER is not None and config.SMTP_PASS is not None: # type: ignore
-                    server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore
-                server.send_message(msg)
+            mailer.send(msg)
         except Exception:
             app.logger.exception("Failed to send rejection email")
 
+# Pending bookings that nobody answered in time (scheduled job expire-pending-bookings)
+def notify_booking_expired(booking):
+    email, name, check_in, check_out = booking.get("email"), booking.get("name"), booking.get("check_in"), booking.get("check_out")
+    booking_id = str(booking["_id"])
+    if config.SMTP_HOST and email: # type: ignore
+        try:
+            send_html_reply(email, "Booking Update - Shri Ranchoddas Hindu Arogya Bhavan", f"""
+            <html>
+            <body style="font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px; color: #333;">
+                <div style="background: #fff; border-radius: 8px; padding: 20px;">
+                    <div style="text-align: center; margin-bottom: 20px;"><img src="cid:RAG_Logo" alt="Ranchoddas Arogya Bhavan Logo" style="max-width: 180px;" /></div>
+                    <p>Dear {name},</p>
+                    <p>We could not confirm your booking request (ID: {booking_id}) for Check-In: {check_in} to Check-Out: {check_out} in time, so it has expired.</p>
+                    <p>Please <a href="https://ranchoddasbhavan.com/booking">book again</a> or <a href="https://ranchoddasbhavan.com/contact">contact us</a> for availability.</p>
+                    <p>Regards,<br>Shri Ranchoddas Hindu Arogya Bhavan<br>Matheran Hill Station</p>
+                </div>
+            </body>
+            </html>
+            """)
+        except Exception:
+            app.logger.exception("Failed to send expiry email")
+
+# Guest notification sent when a booking enters a status
+BOOKING_STATUS_NOTIFIERS = {
+    "Pending": notify_booking_pending,
+    "Accepted": notify_booking_accepted,
+    "Rejected": notify_booking_rejected,
+    "Expired": notify_booking_expired,
+}
+
+def update_booking(booking, changes, actor=None):
+    """Write the changed fields of `booking` in one find_one_and_update.
+
+    The write is guarded on the status that was read, so concurrent edits cannot
+    double-apply a transition; returns (None, diff) when the guard misses. A status
+    change is validated against BOOKING_TRANSITIONS, appended to the audit
+    sub-document and is the only thing that notifies the guest.
+    """
+    old_status = booking.get("status")
+    diff = {field: value for field, value in changes.items() if booking.get(field) != value}
+    if not diff:
+        return booking, diff
+
+    update = {"$set": dict(diff)}
+    if "status" in diff:
+        new_status = diff["status"]
+        if new_status not in BOOKING_TRANSITIONS.get(old_status or "Pending", ()):
+            raise ValueError(f"Booking cannot move from {old_status} to {new_status}.")
+        now = datetime.now(ZoneInfo("Asia/Kolkata"))
+        update["$set"]["audit.updated_at"] = now
+        update["$push"] = {"audit.transitions": {
+            "from": old_status,
+            "to": new_status,
+            "at": now,
+            "by": actor,
+        }}
+
+    updated = db.bookings.find_one_and_update( # type: ignore
+        {"_id": booking["_id"], "status": old_status},
+        update,
+        return_document=ReturnDocument.AFTER
+    )
+    if updated is not None and diff.keys() & {"status", "guests", "check_in", "check_out"}:
+        analytics.apply_booking(db, booking, updated)
+    if updated is not None and "status" in diff:
+        BOOKING_STATUS_NOTIFIERS[updated["status"]](updated)
+    return updated, diff
+
+def booking_fields(form):
+    """Validated booking fields from form/JSON data; raises ValueError with a guest-facing message."""
+    check_in = form.get("check_in")
+    check_out = form.get("check_out")
+    try:
+        guests = int(form.get("guests", 1))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid number of guests.")
+
+    # Server-side validation
+    if not check_in or not check_out:
+        raise ValueError("Check-in and check-out dates are required.")
+    try:
+        ci = datetime.strptime(check_in, "%Y-%m-%d").date()
+        co = datetime.strptime(check_out, "%Y-%m-%d").date()
+    except Exception:
+        raise ValueError("Invalid dates provided.")
+
+    if ci >= co:
+        raise ValueError("Check-out date must be after check-in date.")
+
+    return {
+        "name": form.get("name"),
+        "phone": form.get("phone"),
+        "email": form.get("email"),
+        "check_in": check_in,
+        "check_out": check_out,
+        "guests": guests,
+        "note": form.get("note", ""),
+    }
+
+def create_booking(form):
+    """Validate and store a booking from form/JSON fields; raises ValueError with a guest-facing message."""
+    fields = booking_fields(form)
+    created_at = datetime.now(ZoneInfo("Asia/Kolkata"))
+    booking_doc = {
+        **fields,
+        "created_at": created_at,  # 12-hour format
+        "status": "Pending",
+        "audit": {"transitions": [{"from": None, "to": "Pending", "at": created_at, "by": None}]}
+    }
+    # Stamped with the idempotency key: a retried submission finds this booking instead of adding one
+    booking_doc, inserted = idempotency.insert_once(db.bookings, booking_doc) # type: ignore
+    if not inserted:
+        return booking_doc
+    analytics.apply_booking(db, None, booking_doc)
+
+    notify_booking_pending(booking_doc)
+    notify_admin_new_booking(booking_doc)
+    return booking_doc
+
+sms = sms_gateway.SmsGateway(db, sms_gateway.make_backend(config.SMS_BACKEND, config),
+                             max_workers=config.SMS_MAX_WORKERS, max_pending=config.SMS_MAX_PENDING)
+
+@app.cli.command("send-test-sms")
+@click.argument("to")
+def send_test_sms(to):
+    """Send one SMS through the configured backend, synchronously."""
+    if not sms.enabled:
+        print("No SMS backend configured (SMS_BACKEND / TWILIO_SID).")
+        return
+    try:
+        print("Sent:", sms.send_now(to, "Test message from Ranchoddas Arogya Bhavan."))
+    except sms_gateway.SmsError as e:
+        print("Failed:", e)
+
+def notify_admin_new_booking(booking):
+    booking_id = str(booking["_id"])
+    name, phone, email = booking["name"], booking["phone"], booking["email"]
+    check_in, check_out = booking["check_in"], booking["check_out"]
+    guests, note = booking["guests"], booking["note"]
+
+    # 🔔 Notify admin by email
+    if config.SMTP_HOST and getattr(config, "ADMIN_EMAIL", None): # type: ignore
+        try:
+            admin_msg = EmailMessage()
+            admin_msg["Subject"] = f"New Booking Alert - ID {booking_id}"
+            admin_msg["From"] = config.SMTP_USER # type: ignore
+            admin_msg["To"] = config.ADMIN_EMAIL # type: ignore
+            admin_msg.set_content(
+                f"A new booking has been created.\n\n"
+                f"Booking ID: {booking_id}\n"
+                f"Name: {name}\n"
+                f"Phone: {phone}\n"
+                f"Email: {email}\n"
+                f"Check-in: {check_in} → Check-out: {check_out}\n"
+                f"Guests: {guests}\n"
+                f"Note: {note}\n\n"
+                f"Please check the bookings list on the website to update the status."
+            )
+            html_body = f"""
+            <html>
+            <head>
+                <style>
+                    body {{ font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px; color: #333; }}
+                    .card {{ background: #fff; border-radius: 8px; padding: 20px; box-shadow: 0 2px 6px rgba(0,0,0,0.1); }}
+                    .logo {{ text-align: center; margin-bottom: 20px; }}
+                    .logo img {{ max-width: 180px; height: auto; border-radius: 8px; }}
+                    h2 {{ color: #0b8a61; }}
+                </style>
+            </head>
+            <body>
+            <div class="card">
+                <div class="logo">
+                <img src="cid:RAG_Logo" alt="Ranchoddas Arogya Bhavan Logo" />
+                </div>
+                <h2>New Booking Created</h2>
+                <p>A new booking has been created.</p>
+
+                <p><strong>Booking ID:</strong> { booking_id }</p>
+                <p><strong>Name:</strong> { name }</p>
+                <p><strong>Phone:</strong> { phone }</p>
+                <p><strong>Email:</strong> { email }</p>
+                <p><strong>Check-in:</strong> { check_in } → <strong>Check-out:</strong> { check_out }</p>
+                <p><strong>Guests:</strong> { guests }</p>
+                <p><strong>Note:</strong> { note }</p>
+
+                <p>Please check the bookings list on the website to update the status.</p>
+            </div>
+            </body>
+            </html>
+            """
+            admin_msg.add_alternative(html_body, subtype="html")
+            # Attach logo image inline
+            with open("static/images/icons/RAG_Logo.png", "rb") as img:
+                admin_msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
+                
+            mailer.send(admin_msg)
+        except Exception:
+            app.logger.exception("Failed to send admin notification email")
+
+    # 📱 Optional: Notify admin by SMS (sent in the background, outcome stored on the booking)
+    if config.ADMIN_PHONE:
+        sms.send(
+            config.ADMIN_PHONE,
+            f"Dear Admin You Have A New Booking Alert.\n\n"
+            f"Booking ID: {booking_id}\n"
+            f"Name: {name}\n"
+            f"Phone: {phone}\n"
+            f"Email: {email}\n"
+            f"Check-in: {check_in} to Check-out: {check_out}\n"
+            f"Guests: {guests}\n"
+            f"Note: {note}\n\n"
+            f"Please check the bookings list on the website to update the status.",
+            booking_id=booking["_id"],
+        )
+
+# Booking create with validation and optional email confirmation
+@app.route("/booking", methods=["GET", "POST"])
+@idempotent
+def booking():  # sourcery skip: last-if-guard
+    if request.method != "POST":
+        return render_template("booking.html")
+
+    try:
+        booking_doc = create_booking(request.form)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("booking"))
+    flash(f"Booking created successfully. Booking ID: {booking_doc['_id']}", "success")
+    return redirect(url_for("bookings_list"))
+
+# Bookings list protected for admin
+@app.route("/bookings")
+@login_required
+def bookings_list():
+    bookings = list(db.bookings.find().sort("created_at", 1)) # type: ignore
+    return render_template("bookings_list.html", bookings=bookings)
+
+@app.route("/booking/accept/<booking_id>", methods=["POST"])
+@login_required
+def booking_accept(booking_id):
+    return set_booking_status(booking_id, "Accepted", "Booking accepted.", "success")
+
+@app.route("/booking/reject/<booking_id>", methods=["POST"])
+@login_required
+def booking_reject(booking_id):
+    return set_booking_status(booking_id, "Rejected", "Booking rejected.", "danger")
+
+def set_booking_status(booking_id, status, message, category):
+    booking = db.bookings.find_one({"_id": ObjectId(booking_id)}) # type: ignore
+    if not booking:
+        abort(404)
+    try:
+        updated, _ = update_booking(booking, {"status": status}, actor=current_user.username)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("bookings_list"))
+    if updated is None:
+        flash("Booking was changed by someone else, please review it again.", "warning")
+    else:
+        flash(message, category)
     return redirect(url_for("bookings_list"))
 
 @app.route("/booking/edit/<booking_id>", methods=["GET", "POST"])
@@ -525,140 +812,153 @@ def booking_edit(booking_id):
     if not booking:
         abort(404)
     if request.method == "POST":
-        name = request.form.get("name")
-        phone = request.form.get("phone")
-        email = request.form.get("email")
-        check_in = request.form.get("check_in")
-        check_out = request.form.get("check_out")
-        guests = int(request.form.get("guests", 1))
-        status = request.form.get("status", "Pending")
-        note = request.form.get("note", "")
-
-        if not check_in or not check_out:
-            flash("Check-in and check-out dates are required.", "danger")
-            return redirect(url_for("booking_edit", booking_id=booking_id))
         try:
-            ci = datetime.strptime(check_in, "%Y-%m-%d").date()
-            co = datetime.strptime(check_out, "%Y-%m-%d").date()
-        except Exception:
-            flash("Invalid dates provided.", "danger")
+            changes = booking_fields(request.form)
+        except ValueError as e:
+            flash(str(e), "danger")
             return redirect(url_for("booking_edit", booking_id=booking_id))
+        changes["status"] = request.form.get("status", "Pending").capitalize()
 
-        if ci >= co:
-            flash("Check-out date must be after check-in date.", "danger")
+        try:
+            updated, changed = update_booking(booking, changes, actor=current_user.username)
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("booking_edit", booking_id=booking_id))
+        if updated is None:
+            flash("Booking was changed by someone else, please review it again.", "warning")
             return redirect(url_for("booking_edit", booking_id=booking_id))
 
-        updated = {
-            "name": name,
-            "phone": phone,
-            "email": email,
-            "check_in": check_in,
-            "check_out": check_out,
-            "guests": guests,
-            "status": status,
-            "note": note
-        }
-        # Notify customer based on status
-        if status.lower() == "accepted":
-            booking_accept(booking_id)
-        elif status.lower() == "rejected":
-            booking_reject(booking_id)
-        else:
-            booking_pending(email, name, booking_id, check_in, check_out) # type: ignore
-            
-        flash("Booking updated successfully.", "success")
+        flash("Booking updated successfully." if changed else "No changes to save.", "success" if changed else "info")
         return redirect(url_for("bookings_list"))
     return render_template("booking_edit.html", booking=booking)
 
 @app.route("/booking/delete/<booking_id>", methods=["POST"])
 @login_required
 def booking_delete(booking_id):
-    db.bookings.delete_one({"_id": ObjectId(booking_id)}) # type: ignore
+    booking = db.bookings.find_one_and_delete({"_id": ObjectId(booking_id)}) # type: ignore
+    analytics.apply_booking(db, booking, None)
     flash("Booking deleted.", "info")
     return redirect(url_for("bookings_list"))
 
 #app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'static', 'images', 'feedback_gallery')
 fs = gridfs.GridFS(db) # type: ignore
+# Exact duplicate uploads reuse the stored file; near-duplicates are flagged (photo_fingerprints.py)
+photo_index = photo_fingerprints.PhotoIndex(db, fs, config.PHOTO_NEAR_DUPLICATE_DISTANCE)
+
+# Photos were already streamed into GridFS while the form was parsed (uploads.py)
+def stored_photo_ids(photos, rejected=None, similar=None):
+    # Skipped files are flashed, or collected into `rejected` (API callers);
+    # near-duplicates of earlier photos are collected into `similar`
+    photo_ids = []
+    for photo in photos:
+        sink = photo.stream
+        if sink.stored:
+            photo_id = sink.file_id
+            try:
+                photo_id, matches = photo_index.register(sink.file_id, sink.sha256)
+            except Exception:
+                app.logger.exception("Failed to fingerprint photo %s", sink.file_id)
+                matches = []
+            if str(photo_id) not in photo_ids:
+                photo_ids.append(str(photo_id))
+            if similar is not None:
+                similar.extend(matches)
+        elif photo.filename and sink.rejected != "empty file":
+            if rejected is None:
+                flash(f"{photo.filename} was not uploaded: {sink.rejected}.", "warning")
+            else:
+                rejected.append({"filename": photo.filename, "reason": sink.rejected})
+    return photo_ids
+
+def feedback_rating(form):
+    try:
+        rating = int(form.get("rating", 0))
+    except (TypeError, ValueError):
+        rating = -1
+    if rating < 0 or rating > 10:
+        raise ValueError("Rating must be between 0 and 10.")
+    return rating
+
+def create_feedback(form, rating, photo_ids, similar_photos=None):
+    name = form.get("name")
+    email = form.get("email")
+    comments = form.get("comments", "")
+    feedback_doc = {
+        "name": name,
+        "rating": rating,
+        "comments": comments,
+        "photos": photo_ids,   # store GridFS IDs
+        "created_at": datetime.now(ZoneInfo("Asia/Kolkata"))
+    }
+    if similar_photos:
+        feedback_doc["similar_photos"] = similar_photos
+    feedback_doc, inserted = idempotency.insert_once(db.feedbacks, feedback_doc) # type: ignore
+    if not inserted:
+        return feedback_doc
+    analytics.apply_feedback(db, None, feedback_doc)
+
+    # Notify Thanks email for the feedback to guests
+    if config.SMTP_HOST and email: # type: ignore
+        try:
+            msg = EmailMessage()
+            msg["Subject"] = "Feedback Response - Shri Ranchoddas Hindu Arogya Bhavan"
+            msg["From"] = config.SMTP_USER # type: ignore
+            msg["To"] = email
+            msg.set_content(
+            f"Dear {name},\n\nThank you for your feedback\n\n"
+            f"Your thoughts help us improve our hospitality.\n"
+            f"📍 Location: Before Union Bank & Local Market, Matheran Hill Station\n"
+            f"🌐 Website: www.ranchoddasbhavan.com"
+            )
+            # HTML body with inline logo
+            html_body = f"""
+            <html>
+            <head>
+                <style>
+                    body {{ font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px; color: #333; }}
+                    .card {{ background: #fff; border-radius: 8px; padding: 20px; box-shadow: 0 2px 6px rgba(0,0,0,0.1); }}
+                    .logo {{ text-align: center; margin-bottom: 20px; }}
+                    .logo img {{ max-width: 180px; height: auto; border-radius: 8px; }}
+                    h2 {{ color: #0b8a61; }}
+                </style>
+            </head>
+            <body>
+            <div class="card">
+            <div class="logo">
+            <img src="cid:RAG_Logo" alt="Ranchoddas Arogya Bhavan Logo" />
+            </div>
+                <h2>Thank you for your feedback</h2>
+                <p>Your thoughts help us improve our hospitality.</p>
+                <p>📍 Location: Before Union Bank & Local Market, Matheran Hill Station<br>
+                    🌐 Website: <a href="https://www.ranchoddasbhavan.com">www.ranchoddasbhavan.com</a></p>
+            </div>
+            </body>
+            </html>
+            """
+            msg.add_alternative(html_body, subtype="html")
+            # Attach logo image inline
+            with open("static/images/icons/RAG_Logo.png", "rb") as img:
+                msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
+                
+            mailer.send(msg)
+        except Exception:
+            app.logger.exception("Failed to send return feedback email")
+    return feedback_doc
 
 @app.route("/feedback", methods=["GET", "POST"])
+@idempotent
+@stream_to_gridfs(fs)
 def feedback(): # sourcery skip: last-if-guard
     if request.method == "POST":
-        name = request.form.get("name")
-        email = request.form.get("email")
-        rating = int(request.form.get("rating", 0))
-        comments = request.form.get("comments", "")
-
-        if rating < 0 or rating > 10:
-            flash("Rating must be between 0 and 10.", "danger")
+        try:
+            rating = feedback_rating(request.form)
+        except ValueError as e:
+            request.discard_uploads() # type: ignore
+            flash(str(e), "danger")
             return redirect(url_for("feedback"))
 
-        photo_ids = []
-        if 'photos' in request.files:
-            photos = request.files.getlist('photos')
-            for photo in photos:
-                if photo and allowed_file(photo.filename):
-                    file_id = fs.put(photo, filename=secure_filename(photo.filename)) # type: ignore
-                    photo_ids.append(str(file_id))
-
-        db.feedbacks.insert_one({ # type: ignore
-            "name": name,
-            "rating": rating,
-            "comments": comments,
-            "photos": photo_ids,   # store GridFS IDs
-            "created_at": datetime.now(ZoneInfo("Asia/Kolkata"))
-        })
-        
-        # Notify Thanks email for the feedback to guests
-        if config.SMTP_HOST and email: # type: ignore
-            try:
-                msg = EmailMessage()
-                msg["Subject"] = "Feedback Response - Shri Ranchoddas Hindu Arogya Bhavan"
-                msg["From"] = config.SMTP_USER # type: ignore
-                msg["To"] = email
-                msg.set_content(
-                f"Dear {name},\n\nThank you for your feedback\n\n"
-                f"Your thoughts help us improve our hospitality.\n"
-                f"📍 Location: Before Union Bank & Local Market, Matheran Hill Station\n"
-                f"🌐 Website: www.ranchoddasbhavan.com"
-                )
-                # HTML body with inline logo
-                html_body = f"""
-                <html>
-                <head>
-                    <style>
-                        body {{ font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px; color: #333; }}
-                        .card {{ background: #fff; border-radius: 8px; padding: 20px; box-shadow: 0 2px 6px rgba(0,0,0,0.1); }}
-                        .logo {{ text-align: center; margin-bottom: 20px; }}
-                        .logo img {{ max-width: 180px; height: auto; border-radius: 8px; }}
-                        h2 {{ color: #0b8a61; }}
-                    </style>
-                </head>
-                <body>
-                <div class="card">
-                <div class="logo">
-                <img src="cid:RAG_Logo" alt="Ranchoddas Arogya Bhavan Logo" />
-                </div>
-                    <h2>Thank you for your feedback</h2>
-                    <p>Your thoughts help us improve our hospitality.</p>
-                    <p>📍 Location: Before Union Bank & Local Market, Matheran Hill Station<br>
-                        🌐 Website: <a href="https://www.ranchoddasbhavan.com">www.ranchoddasbhavan.com</a></p>
-                </div>
-                </body>
-                </html>
-                """
-                msg.add_alternative(html_body, subtype="html")
-                # Attach logo image inline
-                with open("static/images/icons/RAG_Logo.png", "rb") as img:
-                    msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
-                    
-                with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server: # type: ignore
-                    server.starttls()
-                    if config.SMTP_USER is not None and config.SMTP_PASS is not None: # type: ignore
-                        server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore
-                    server.send_message(msg)
-            except Exception:
-                app.logger.exception("Failed to send return feedback email")
-
+        similar = []
+        create_feedback(request.form, rating, stored_photo_ids(request.files.getlist('photos'), similar=similar), similar)
         flash("Thank you for your feedback.", "success")
         return redirect(url_for("feedbacks_list"))
 
@@ -667,12 +967,85 @@ def feedback(): # sourcery skip: last-if-guard
 # Route to stream photos from GridFS
 @app.route("/feedback/photo/<file_id>")
 def feedback_photo(file_id):
+    if media_server.enabled:
+        try:
+            path, mimetype = cached_media(str(ObjectId(file_id)), lambda: fs.get(ObjectId(file_id)))
+        except Exception:
+            abort(404)
+        return media_server.send(path, mimetype, etag=file_id)
     try:
         file = fs.get(ObjectId(file_id))
     except Exception:
         abort(404)
-    # Detect mimetype from filename if needed
-    return Response(file.read(), mimetype="image/jpeg")
+    # Content type is sniffed from magic bytes at upload time
+    return Response(file.read(), mimetype=file.content_type or "image/jpeg")
+
+feedback_thumbs = feedback_photos.ThumbnailCache(db, fs)
+
+# Small cached rendition for the /feedbacks rows; a photo id never changes content
+@app.route("/feedback/photo/<file_id>/thumb")
+@login_required
+def feedback_photo_thumb(file_id):
+    try:
+        thumb = feedback_thumbs.get(ObjectId(file_id))
+    except Exception:
+        abort(404)
+    if thumb is None:
+        abort(404)
+    if request.if_none_match.contains(file_id):
+        response = Response(status=304)
+    else:
+        response = Response(wrap_file(request.environ, thumb), mimetype="image/jpeg", direct_passthrough=True)
+        response.content_length = thumb.length
+    response.set_etag(file_id)
+    response.cache_control.private = True
+    response.cache_control.max_age = 86400
+    return response
+
+@app.cli.command("dedupe-feedback-photos")
+@click.option("--batch-size", default=200, show_default=True)
+def dedupe_feedback_photos(batch_size):
+    """Fingerprint existing feedback photos in batches; merge exact duplicates, flag near ones."""
+    photo_index.ensure_indexes()
+    last_id, stats = None, {"fingerprinted": 0, "merged": 0, "flagged": 0}
+    while True:
+        ids, todo = photo_index.unindexed(last_id, batch_size)
+        if not ids:
+            break
+        last_id = ids[-1]
+        for file_id in todo:
+            try:
+                kept, matches = photo_index.register(file_id)
+            except gridfs.errors.NoFile:
+                continue
+            stats["fingerprinted"] += 1
+            if kept != file_id:
+                # The oldest copy wins; feedbacks are repointed before the duplicate's leftovers go
+                photo_index.replace_references(db.feedbacks, file_id, kept) # type: ignore
+                feedback_thumbs.delete(file_id)
+                media_cache.discard(str(file_id))
+                stats["merged"] += 1
+            for match in matches:
+                db.feedbacks.update_many({"photos": match["photo"]}, {"$addToSet": {"similar_photos": match}}) # type: ignore
+                stats["flagged"] += 1
+        print("Batch done:", stats)
+    print("Feedback photos deduplicated:", stats)
+
+# Photo list for the shared carousel modal, fetched when it opens
+@app.route("/feedback/<fb_id>/photos")
+@login_required
+def feedback_photo_list(fb_id):
+    try:
+        fb = db.feedbacks.find_one({"_id": ObjectId(fb_id)}, {"photos": 1}) # type: ignore
+    except Exception:
+        abort(404)
+    if not fb:
+        abort(404)
+    photos = feedback_thumbs.listing(fb.get("photos", []))
+    for photo in photos:
+        photo["url"] = url_for("feedback_photo", file_id=photo["id"])
+        photo["thumb"] = url_for("feedback_photo_thumb", file_id=photo["id"])
+    return jsonify({"photos": photos})
 
 @app.route("/feedbacks")
 @login_required
@@ -682,24 +1055,25 @@ def feedbacks_list():
 
 @app.route("/feedback/edit/<fb_id>", methods=["GET", "POST"])
 @login_required
+@stream_to_gridfs(fs)
 def feedback_edit(fb_id):
     fb = db.feedbacks.find_one({"_id": ObjectId(fb_id)}) # type: ignore
     if not fb:
         abort(404)
 
     if request.method == "POST":
+        try:
+            rating = feedback_rating(request.form)
+        except ValueError as e:
+            request.discard_uploads() # type: ignore
+            flash(str(e), "danger")
+            return redirect(url_for("feedback_edit", fb_id=fb_id))
         name = request.form.get("name")
-        rating = int(request.form.get("rating", 0))
         comments = request.form.get("comments", "")
 
-        photo_ids = fb.get("photos", [])
-
-        if 'photos' in request.files:
-            photos = request.files.getlist('photos')
-            for photo in photos:
-                if photo and allowed_file(photo.filename):
-                    file_id = fs.put(photo, filename=secure_filename(photo.filename)) # type: ignore
-                    photo_ids.append(str(file_id))
+        similar = []
+        new_ids = stored_photo_ids(request.files.getlist('photos'), similar=similar)
+        photo_ids = fb.get("photos", []) + [p for p in new_ids if p not in fb.get("photos", [])]
 
         db.feedbacks.update_one( # type: ignore
             {"_id": ObjectId(fb_id)},
@@ -707,9 +1081,12 @@ def feedback_edit(fb_id):
                 "name": name,
                 "rating": rating,
                 "comments": comments,
-                "photos": photo_ids
+                "photos": photo_ids,
+                "similar_photos": fb.get("similar_photos", []) + similar
             }}
         )
+        if rating != fb.get("rating"):
+            analytics.apply_feedback(db, fb, dict(fb, rating=rating))
 
         flash("Feedback updated.", "success")
         return redirect(url_for("feedbacks_list"))
@@ -719,11 +1096,13 @@ def feedback_edit(fb_id):
 @app.route("/feedback/delete/<fb_id>", methods=["POST"])
 @login_required
 def feedback_delete(fb_id):
-    db.feedbacks.delete_one({"_id": ObjectId(fb_id)}) # type: ignore
+    fb = db.feedbacks.find_one_and_delete({"_id": ObjectId(fb_id)}) # type: ignore
+    analytics.apply_feedback(db, fb, None)
     flash("Feedback deleted.", "info")
     return redirect(url_for("feedbacks_list"))
 
 @app.route("/contact", methods=["GET", "POST"])
+@idempotent
 def contact():  # sourcery skip: last-if-guard
     if request.method == "POST":
         name = request.form.get("name", "").strip()
@@ -741,8 +1120,8 @@ def contact():  # sourcery skip: last-if-guard
             flash("Message cannot be empty.", "danger")
             return redirect(url_for("contact"))
 
-        # Save to MongoDB
-        db.contacts.insert_one({ # type: ignore
+        # Save to MongoDB; a retried submission finds its first document and is not re-notified
+        _, inserted = idempotency.insert_once(db.contacts, { # type: ignore
             "name": name,
             "email": email,
             "message": message,
@@ -750,7 +1129,7 @@ def contact():  # sourcery skip: last-if-guard
         })
         
         # 🔔 Contact form submittion alert Notify admin by email with logo and reply buttons
-        if config.SMTP_HOST and getattr(config, "ADMIN_EMAIL", None): # type: ignore
+        if inserted and config.SMTP_HOST and getattr(config, "ADMIN_EMAIL", None): # type: ignore
             try:
                 admin_msg = EmailMessage()
                 admin_msg["Subject"] = f"New Contact Form Submission from {name}"
@@ -801,11 +1180,7 @@ def contact():  # sourcery skip: last-if-guard
                     admin_msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
 
                 # Send email    
-                with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server: # type: ignore
-                        server.starttls()
-                        if config.SMTP_USER is not None and config.SMTP_PASS is not None: # type: ignore
-                            server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore
-                        server.send_message(admin_msg)
+                mailer.send(admin_msg)
 
                 app.logger.info("Admin notification email sent successfully.")
             except Exception:
@@ -854,6 +1229,422 @@ def contact_delete_all():
     flash("All contacts deleted successfully!", "danger")
     return redirect(url_for("contact_list"))
 
+# ------------------ JSON API ------------------
+# vercel.json proxies /api/* here; everything else can be served from the CDN
+def api_image(doc):
+    meta = doc.get("meta") or {}
+    return {
+        "position": doc["position"],
+        "url": gallery_image_url(doc["image"]),
+        "thumb": gallery_image_url(doc["image"], thumb=True),
+        "content_type": doc.get("content_type"),
+        "size": doc.get("size"),
+        # Intrinsic size and placeholder, so clients can reserve the box before loading
+        "width": meta.get("width"),
+        "height": meta.get("height"),
+        "color": meta.get("color"),
+        "placeholder": meta.get("lqip"),
+    }
+
+@app.route(api.API_PREFIX + "/categories")
+def api_categories():
+    cats = public_db.categories.find({}, {"key": 1, "title": 1, "sample": 1, "image_count": 1}) # type: ignore
+    return api.json_response({"categories": [{
+        "key": c["key"],
+        "title": c["title"],
+        "count": c.get("image_count", 0),
+        "sample": [gallery_image_url(image, thumb=True) for image in c.get("sample", [])],
+    } for c in cats]}, max_age=config.API_MAX_AGE, shared_max_age=config.API_SHARED_MAX_AGE)
+
+@app.route(api.API_PREFIX + "/categories/<category>/images")
+def api_category_images(category):
+    meta = public_db.categories.find_one({"key": category}, {"title": 1, "image_count": 1}) # type: ignore
+    if not meta:
+        return api.api_error("Unknown category.", 404)
+    limit = min(max(request.args.get("limit", config.API_PAGE_LIMIT, type=int), 1), config.API_MAX_PAGE_LIMIT)
+    try:
+        position = api.decode_cursor(request.args["cursor"])["p"] if request.args.get("cursor") else 0
+    except (ValueError, KeyError, TypeError):
+        return api.api_error("Invalid cursor.")
+    docs, next_position = gallery_images.after(public_db, category, int(position), limit)
+    return api.json_response({
+        "key": category,
+        "title": meta["title"],
+        "count": meta.get("image_count", 0),
+        "images": [api_image(doc) for doc in docs],
+        "next_cursor": api.encode_cursor({"p": next_position}) if next_position is not None else None,
+    }, max_age=config.API_MAX_AGE, shared_max_age=config.API_SHARED_MAX_AGE)
+
+@app.route(api.API_PREFIX + "/availability")
+def api_availability():
+    today = datetime.now(ZoneInfo("Asia/Kolkata")).date()
+    try:
+        start = datetime.strptime(request.args.get("from", today.isoformat()), "%Y-%m-%d").date()
+        end = datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to") else start + timedelta(days=30)
+    except ValueError:
+        return api.api_error("Dates must be YYYY-MM-DD.")
+    if not start < end or (end - start).days > config.API_MAX_AVAILABILITY_DAYS:
+        return api.api_error(f"'to' must be after 'from' and at most {config.API_MAX_AVAILABILITY_DAYS} days later.")
+    nights = analytics.availability(db, start.isoformat(), end.isoformat(), config.GUEST_CAPACITY)
+    return api.json_response({"from": start.isoformat(), "to": end.isoformat(), "capacity": config.GUEST_CAPACITY or None,
+                              "nights": nights}, max_age=config.API_MAX_AGE)
+
+@app.route(api.API_PREFIX + "/bookings", methods=["POST"])
+@idempotent
+def api_create_booking():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return api.api_error("Expected a JSON object.")
+    try:
+        booking_doc = create_booking(payload)
+    except ValueError as e:
+        return api.api_error(str(e))
+    return api.json_response({"id": str(booking_doc["_id"]), "status": booking_doc["status"]}, status=201)
+
+@app.route(api.API_PREFIX + "/feedbacks", methods=["POST"])
+@idempotent
+@stream_to_gridfs(fs)
+def api_create_feedback():
+    # JSON, or multipart form data when photos are attached
+    payload = request.get_json(silent=True) if request.is_json else request.form
+    if not isinstance(payload, dict):
+        return api.api_error("Expected a JSON object or form data.")
+    try:
+        rating = feedback_rating(payload)
+    except ValueError as e:
+        request.discard_uploads() # type: ignore
+        return api.api_error(str(e))
+    rejected, similar = [], []
+    feedback_doc = create_feedback(payload, rating, stored_photo_ids(request.files.getlist("photos"), rejected, similar), similar)
+    return api.json_response({"id": str(feedback_doc["_id"]), "photos": len(feedback_doc["photos"]),
+                              "rejected": rejected}, status=201)
+
+@app.after_request
+def compress_api_response(response):
+    if request.path.startswith(api.API_PREFIX + "/"):
+        api.gzip_response(response, min_size=config.GZIP_MIN_BYTES)
+    return response
+
+# ------------------ ADMIN SEARCH ------------------
+searcher = search.Searcher(db, backend=config.SEARCH_BACKEND)
+
+@app.route("/admin/search")
+@login_required
+def admin_search():
+    query = request.args.get("q", "").strip()
+    scope = request.args.get("in") or None
+    page = max(request.args.get("page", 1, type=int), 1)
+    hits, total, took_ms = [], 0, 0.0
+    if query:
+        hits, total, took_ms = searcher.search(query, [scope] if scope else None, page, config.SEARCH_PER_PAGE)
+    pages = (total + config.SEARCH_PER_PAGE - 1) // config.SEARCH_PER_PAGE
+    return render_template("search.html", query=query, scope=scope, page=page, pages=pages, hits=hits,
+                        total=total, took_ms=took_ms, scopes=list(search.SEARCH_FIELDS))
+
+# ------------------ BOOKING ARCHIVE ------------------
+booking_archive = (retention.FileArchive(os.path.join(app.root_path, config.ARCHIVE_DIR))
+                   if config.ARCHIVE_BACKEND == "file" else retention.CollectionArchive(db))
+ARCHIVE_PER_PAGE = 50
+
+# Read-only view of archived bookings; slower than the live list, especially with file archives
+@app.route("/admin/archive/bookings")
+@login_required
+def archived_bookings():
+    q, date_from, date_to = request.args.get("q", ""), request.args.get("date_from", ""), request.args.get("date_to", "")
+    page = max(request.args.get("page", 1, type=int), 1)
+    try:
+        query = retention.archive_filter(q, date_from or None, date_to or None)
+    except ValueError:
+        flash("Dates must be YYYY-MM-DD.", "danger")
+        return redirect(url_for("archived_bookings"))
+    bookings, total = booking_archive.search(query, (page - 1) * ARCHIVE_PER_PAGE, ARCHIVE_PER_PAGE)
+    pages = (total + ARCHIVE_PER_PAGE - 1) // ARCHIVE_PER_PAGE
+    return render_template("archive_bookings.html", bookings=bookings, total=total, page=page, pages=pages,
+                        q=q, date_from=date_from, date_to=date_to, months=config.BOOKING_ARCHIVE_AFTER_MONTHS)
+
+# ------------------ SCHEDULED JOBS ------------------
+job_scheduler = scheduler.Scheduler(db, tick_seconds=config.SCHEDULER_TICK_SECONDS)
+
+@job_scheduler.job("expire-pending-bookings", "*/30 * * * *")
+def expire_pending_bookings(batch_size):
+    now = datetime.now(ZoneInfo("Asia/Kolkata"))
+    stale = {"status": "Pending", "$or": [
+        {"check_in": {"$lt": now.date().isoformat()}},
+        {"created_at": {"$lt": now - timedelta(hours=config.BOOKING_PENDING_EXPIRY_HOURS)}},
+    ]}
+    expired = 0
+    while True:
+        batch = list(db.bookings.find(stale).limit(batch_size)) # type: ignore
+        for b in batch:
+            # Guarded on the old status: an admin accepting it at the same moment wins
+            updated, _ = update_booking(b, {"status": "Expired"}, actor="scheduler")
+            expired += updated is not None
+        if len(batch) < batch_size:
+            return {"expired": expired}
+
+@job_scheduler.job("pre-arrival-reminders", "0 9 * * *")
+def send_pre_arrival_reminders(batch_size):
+    arrival = (datetime.now(ZoneInfo("Asia/Kolkata")).date() + timedelta(days=config.REMINDER_DAYS_BEFORE)).isoformat()
+    due = {"status": "Accepted", "check_in": arrival, "reminder_sent_at": {"$exists": False}}
+    sent = 0
+    while True:
+        batch = list(db.bookings.find(due, {"name": 1, "email": 1, "check_in": 1, "check_out": 1, "guests": 1}).limit(batch_size)) # type: ignore
+        for b in batch:
+            # Mark first, so an overlapping run can never mail the same guest twice
+            claimed = db.bookings.update_one({"_id": b["_id"], "reminder_sent_at": {"$exists": False}}, # type: ignore
+                                             {"$set": {"reminder_sent_at": datetime.now(timezone.utc)}})
+            if not claimed.modified_count or not (config.SMTP_HOST and b.get("email")): # type: ignore
+                continue
+            try:
+                send_html_reply(b["email"], "See you soon - Shri Ranchoddas Hindu Arogya Bhavan", f"""
+                <html>
+                <body style="font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px; color: #333;">
+                    <div style="background: #fff; border-radius: 8px; padding: 20px;">
+                        <div style="text-align: center; margin-bottom: 20px;"><img src="cid:RAG_Logo" alt="Ranchoddas Arogya Bhavan Logo" style="max-width: 180px;" /></div>
+                        <p>Dear {b.get("name")},</p>
+                        <p>This is a reminder of your stay (Booking ID: {b["_id"]}) from {b["check_in"]} to {b["check_out"]} for {b.get("guests")} guest(s).</p>
+                        <p>📍 Location: Before Union Bank & Local Market, Matheran Hill Station</p>
+                        <p>Regards,<br>Shri Ranchoddas Hindu Arogya Bhavan<br>Matheran Hill Station</p>
+                    </div>
+                </body>
+                </html>
+                """)
+                sent += 1
+            except Exception:
+                app.logger.exception("Failed to send pre-arrival reminder")
+        if len(batch) < batch_size:
+            return {"sent": sent}
+
+@job_scheduler.job("orphaned-feedback-photos", "30 3 * * *")
+def delete_orphaned_feedback_photos(batch_size):
+    # Uploads younger than the grace period may belong to a feedback still being saved
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=config.ORPHAN_UPLOAD_GRACE_HOURS)
+    last_id, deleted = None, 0
+    while True:
+        query = {"uploadDate": {"$lt": cutoff}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        ids = [f["_id"] for f in db.fs.files.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)] # type: ignore
+        if not ids:
+            return {"deleted": deleted}
+        last_id = ids[-1]
+        referenced = set(db.feedbacks.distinct("photos", {"photos": {"$in": [str(i) for i in ids]}})) # type: ignore
+        for file_id in ids:
+            if str(file_id) not in referenced:
+                fs.delete(file_id)
+                feedback_thumbs.delete(file_id)
+                media_cache.discard(str(file_id))
+                photo_index.forget(file_id)
+                deleted += 1
+
+@job_scheduler.job("archive-old-bookings", "0 4 * * *")
+def archive_old_bookings(batch_size):
+    # Old contacts need no job: they expire through the TTL index (retention.py)
+    if not config.BOOKING_ARCHIVE_AFTER_MONTHS:
+        return {"archived": 0}
+    return {"archived": retention.archive_bookings(db, booking_archive, config.BOOKING_ARCHIVE_AFTER_MONTHS, batch_size)}
+
+@job_scheduler.job("reclaim-gallery-blobs", "0 5 * * 0")
+def reclaim_unused_gallery_blobs(batch_size):
+    return {"reclaimed": gallery_store.reclaim_unused()}
+
+@app.before_request
+def start_scheduler():
+    if config.SCHEDULER_IN_PROCESS:
+        job_scheduler.start()
+
+@app.cli.command("run-scheduler")
+def run_scheduler():
+    """Run the scheduled jobs in the foreground (sidecar process)."""
+    job_scheduler.run_forever()
+
+@app.cli.command("run-job")
+@click.argument("name", type=click.Choice(sorted(job_scheduler.jobs)))
+def run_job(name):
+    """Run one scheduled job now, outside its schedule."""
+    print(name, job_scheduler.run_job(name))
+
+@app.cli.command("scheduler-status")
+def scheduler_status():
+    """Show the schedule and last run of every job."""
+    for job in job_scheduler.statuses():
+        print(f"{job['name']:28} {job['schedule']:14} next={job.get('next_run_at')} last={job.get('last_status', '-')} "
+              f"at={job.get('last_finished_at')} took={job.get('last_duration_ms')}ms result={job.get('last_result')}")
+
+# ------------------ LIVE ADMIN EVENTS ------------------
+event_hub = admin_events.EventHub(db, mode=config.ADMIN_EVENTS_MODE, poll_interval=config.ADMIN_EVENTS_POLL_SECONDS)
+ADMIN_EVENTS_RETRY_SECONDS = 30
+
+# Server-Sent Events stream consumed by static/js/admin_events.js on the admin lists
+@app.route("/admin/events")
+@login_required
+def admin_event_stream():
+    # Each stream holds a worker thread while the tab is open (see admin_events.py)
+    subscription = event_hub.subscribe(limit=config.ADMIN_EVENTS_MAX_STREAMS)
+    if subscription is None:
+        return Response("Too many live admin tabs.", status=503, mimetype="text/plain",
+                        headers={"Retry-After": str(ADMIN_EVENTS_RETRY_SECONDS)})
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = subscription.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield admin_events.format_sse(event)
+        finally:
+            event_hub.unsubscribe(subscription)
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ------------------ ADMIN DASHBOARD ------------------
+@app.route("/admin/dashboard")
+@login_required
+def admin_dashboard():
+    today = datetime.now(ZoneInfo("Asia/Kolkata"))
+    # Unparseable values fall back to today; out-of-range ones are clamped
+    year = min(max(request.args.get("year", today.year, type=int), 1), 9999)
+    month = min(max(request.args.get("month", today.month, type=int), 1), 12)
+    months, nights = analytics.dashboard(db, year, month)
+    return render_template("dashboard.html", year=year, month=month, months=months, nights=nights,
+                        capacity=config.GUEST_CAPACITY, jobs=job_scheduler.statuses())
+
+@app.cli.command("check-query-budgets")
+def check_query_budgets():
+    """Request every budgeted GET route once and fail if one exceeds its query budget."""
+    if config.QUERY_BUDGETS == "off":
+        raise click.ClickException("Set QUERY_BUDGETS=report (or enforce) so commands are monitored.")
+    client = app.test_client()
+    admin = db.admins.find_one({}, {"_id": 1}) # type: ignore
+    if admin:
+        with client.session_transaction() as sess:
+            sess["_user_id"], sess["_fresh"] = str(admin["_id"]), True
+    category = db.categories.find_one({}, {"key": 1}) or {"key": "none"} # type: ignore
+    failures = 0
+    with app.test_request_context():
+        for method, endpoint in query_budget.ROUTE_BUDGETS:
+            if method != "GET":
+                continue
+            kwargs = {"category": category["key"]} if endpoint in ("gallery_category", "api_category_images") else {}
+            url = url_for(endpoint, **kwargs)
+            client.get(url)
+            tracker = query_budget.listener.last()
+            report = query_budget.check(method, endpoint, url, tracker)
+            used = ", ".join(f"{k}={v}" for k, v in sorted(tracker.counts.items()) if "." not in k) or "none"
+            print(f"{'FAIL' if report else 'ok  '} GET {url:40} {used}")
+            if report:
+                print(report)
+                failures += 1
+    if failures:
+        raise click.ClickException(f"{failures} route(s) over budget.")
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups():
+    """Recompute the occupancy and rating rollups from bookings (live and archived) and feedbacks."""
+    analytics.rebuild(db, booking_archive.documents() if config.ARCHIVE_BACKEND == "file" else ()) # type: ignore
+    print("Rollups rebuilt.")
+
+# ------------------ ADMIN LOGGING ------------------
+# Runtime log levels per logger; stored in log_levels and re-read by a follower thread in
+# every worker. Started from the first request, like the scheduler, so it runs in the worker
+# process rather than in a pre-fork master; after that the hook only checks the thread is alive.
+@app.before_request
+def follow_log_levels():
+    log_pipeline.follow_levels(db.log_levels) # type: ignore
+
+@app.route("/admin/logging", methods=["GET", "POST"])
+@login_required
+def admin_logging():
+    if request.method == "POST":
+        name = request.form.get("logger", "").strip()
+        level = request.form.get("level", "").upper()
+        if not name or (level and level not in app_logging.LEVELS):
+            flash("Pick a logger name and a level.", "danger")
+        elif level:
+            db.log_levels.update_one({"_id": name}, {"$set": {"level": level, "updated_at": datetime.now(timezone.utc)}}, upsert=True) # type: ignore
+            log_pipeline.set_level(name, level)
+            flash(f"{name} now logs at {level}.", "success")
+        else:
+            db.log_levels.delete_one({"_id": name}) # type: ignore
+            log_pipeline.set_level(name, None)
+            flash(f"{name} restored to its start-up level.", "info")
+        return redirect(url_for("admin_logging"))
+    return render_template("logging_levels.html", loggers=log_pipeline.levels(), levels=app_logging.LEVELS,
+                        stats=log_pipeline.stats(), sample_rate=config.LOG_DEBUG_SAMPLE_RATE)
+
+# ------------------ REQUEST PROFILER ------------------
+request_profiler = profiler.RequestProfiler(db, mode=config.PROFILER_MODE, sample_rate=config.PROFILER_SAMPLE_RATE,
+                                            trace_allocations=config.PROFILER_TRACE_ALLOCATIONS)
+# No hooks at all unless enabled; registered after the other before_request hooks so only the view is profiled
+if config.PROFILER_ENABLED:
+    request_profiler.install(app)
+
+PROFILE_DOWNLOADS = {"pstats": ("application/octet-stream", "prof"), "folded": ("text/plain", "folded")}
+
+@app.route("/admin/profiles")
+@login_required
+def admin_profiles():
+    query = {"route": request.args["route"]} if request.args.get("route") else {}
+    profiles = list(db.profiles.find(query, {"raw": 0, "frames": 0, "allocations": 0}).sort("created_at", -1).limit(100)) # type: ignore
+    return render_template("profiles_list.html", profiles=profiles, route=request.args.get("route", ""),
+                        enabled=config.PROFILER_ENABLED, mode=config.PROFILER_MODE, sample_rate=config.PROFILER_SAMPLE_RATE)
+
+@app.route("/admin/profiles/<profile_id>")
+@login_required
+def admin_profile(profile_id):
+    try:
+        profile = db.profiles.find_one({"_id": ObjectId(profile_id)}, {"raw": 0}) # type: ignore
+    except Exception:
+        abort(404)
+    if not profile:
+        abort(404)
+    return render_template("profile_detail.html", profile=profile)
+
+@app.route("/admin/profiles/<profile_id>/download")
+@login_required
+def admin_profile_download(profile_id):
+    try:
+        profile = db.profiles.find_one({"_id": ObjectId(profile_id)}, {"raw": 1, "raw_format": 1}) # type: ignore
+    except Exception:
+        abort(404)
+    if not profile or "raw" not in profile:
+        abort(404)
+    mimetype, extension = PROFILE_DOWNLOADS[profile["raw_format"]]
+    response = Response(bytes(profile["raw"]), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=profile-{profile_id}.{extension}"
+    return response
+
+# ------------------ ADMIN EXPORTS ------------------
+EXPORT_LIST_PAGES = {"bookings": "bookings_list", "feedbacks": "feedbacks_list", "contacts": "contact_list"}
+
+@app.route("/admin/export/<kind>")
+@login_required
+def export_records(kind):
+    if kind not in exports.EXPORTS:
+        abort(404)
+    fmt = request.args.get("format", "csv")
+    if fmt not in exports.FORMATS:
+        abort(400)
+    if fmt == "xlsx" and not exports.xlsx_available():
+        flash("XLSX export needs openpyxl installed, please use CSV.", "danger")
+        return redirect(url_for(EXPORT_LIST_PAGES[kind]))
+    try:
+        query = exports.build_query(kind, request.args.get("from") or None, request.args.get("to") or None,
+                                    request.args.get("status") or None)
+    except ValueError as e:
+        flash(f"Invalid export filter: {e}", "danger")
+        return redirect(url_for(EXPORT_LIST_PAGES[kind]))
+
+    writer, mimetype = exports.FORMATS[fmt]
+    filename = f"{kind}-{datetime.now(ZoneInfo('Asia/Kolkata')):%Y%m%d-%H%M}.{fmt}"
+    return Response(
+        writer(kind, exports.iter_rows(db, kind, query)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}", "X-Accel-Buffering": "no"}
+    )
+
 def send_html_reply(to_email, subject, body_html):
     msg = EmailMessage()
     msg["Subject"] = subject
@@ -869,11 +1660,7 @@ def send_html_reply(to_email, subject, body_html):
     with open("static/images/icons/RAG_Logo.png", "rb") as img:
         msg.get_payload()[1].add_related(img.read(), maintype="image", subtype="png", cid="RAG_Logo") # type: ignore
 
-    with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server: # type: ignore
-        server.starttls()
-        if config.SMTP_USER is not None and config.SMTP_PASS is not None: # type: ignore
-            server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore
-        server.send_message(msg)
+    mailer.send(msg)
 
 @app.route("/reply/<reply_type>/<guest_email>", methods=["GET", "POST"])
 def reply_generic(reply_type, guest_email):
@@ -963,6 +1750,13 @@ def logout():
     flash("Logged out.", "info")
     return redirect(url_for("index"))
 
+# Load balancer health probe: Mongo ping latency and connection pool stats
+@app.route("/healthz")
+def healthz():
+    report = db_pool.health(db)
+    return jsonify(status="ok" if report["ok"] else "unavailable", mongo=report,
+                   rate_limit=rate_limiter.stats(), logging=log_pipeline.stats()), (200 if report["ok"] else 503)
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template("404.html"), 404
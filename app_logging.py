@@ -0,0 +1,187 @@
+# Logging pipeline: request threads only enqueue, one listener thread does the I/O
+#
+#   request thread: logger -> QueueHandler (adds request_id/route, samples DEBUG,
+#                   renders the message and traceback, never blocks: a full queue
+#                   drops the record and counts it)
+#   listener thread: QueueListener -> StreamHandler(stderr) with JsonFormatter
+#                    (one JSON object per line) or a plain text format
+#
+# Levels can be set per logger ("scheduler=DEBUG,werkzeug=WARNING") at start-up from
+# LOG_LEVELS and changed at runtime from /admin/logging, which applies the change in
+# its own worker at once. Overrides are kept in the log_levels collection; a small
+# follower thread per worker loads them when the worker starts and re-reads them every
+# few seconds, so the other workers catch up without a query on any request.
+import atexit, json, logging, queue, random, sys, threading, time, uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from pymongo.errors import PyMongoError
+
+REQUEST_ID_HEADER = "X-Request-ID"
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+# Extra attributes copied into JSON records when a log call passes them (extra={...})
+RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "request_id", "route", "method", "path"}
+
+def parse_levels(spec):
+    """"scheduler=DEBUG,werkzeug=WARNING" -> {"scheduler": "DEBUG", "werkzeug": "WARNING"}"""
+    levels = {}
+    for part in (spec or "").split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip().upper() in LEVELS:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in ("request_id", "route", "method", "path"):
+            if getattr(record, name, None):
+                entry[name] = getattr(record, name)
+        for name, value in vars(record).items():
+            if name not in RESERVED and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s %(route)s] %(message)s")
+
+    def format(self, record):
+        record.__dict__.setdefault("request_id", "-")
+        record.__dict__.setdefault("route", "-")
+        return super().format(record)
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue, debug_sample_rate=1.0):
+        super().__init__(log_queue)
+        self.debug_sample_rate = debug_sample_rate
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1 and random.random() >= self.debug_sample_rate:
+            self.sampled_out += 1
+            return False
+        return super().filter(record)
+
+    def prepare(self, record):
+        # Runs in the emitting thread: capture the request context and render everything
+        # that refers to live objects (args, exc_info) before the record crosses threads
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            record.route = request.endpoint
+            record.method = request.method
+            record.path = request.path
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.args, record.exc_info = message, None, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LoggingPipeline:
+    def __init__(self, fmt="json", level="INFO", levels=None, debug_sample_rate=1.0, queue_size=10000):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue, debug_sample_rate)
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        self.listener = QueueListener(self.queue, output, respect_handler_level=False)
+        self.level = level
+        self.static_levels = dict(levels or {})
+        self.overrides = {}
+        self._follower = None
+        self._follower_lock = threading.Lock()
+
+    def install(self, app):
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        # Flask's own stderr handler would write synchronously from request threads
+        app.logger.removeHandler(default_handler)
+        app.logger.setLevel(logging.NOTSET)
+        for name, level in self.static_levels.items():
+            logging.getLogger(name).setLevel(level)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+        @app.before_request
+        def assign_request_id():
+            g.request_id = (request.headers.get(REQUEST_ID_HEADER) or "")[:64] or new_request_id()
+
+        @app.after_request
+        def echo_request_id(response):
+            if g.get("request_id"):
+                response.headers[REQUEST_ID_HEADER] = g.request_id
+            return response
+
+    def set_level(self, name, level):
+        """Apply a level to one logger in this process; None restores its start-up level."""
+        if level is None:
+            self.overrides.pop(name, None)
+            default = self.level if name == "root" else logging.NOTSET
+            logging.getLogger(name).setLevel(self.static_levels.get(name, default))
+        else:
+            self.overrides[name] = level
+            logging.getLogger(name).setLevel(level)
+
+    def load_levels(self, collection):
+        """Apply the runtime overrides stored in `collection` to this process."""
+        try:
+            wanted = {d["_id"]: d["level"] for d in collection.find({}, {"level": 1})}
+        except PyMongoError:
+            logging.getLogger(__name__).warning("Could not read log level overrides", exc_info=True)
+            return
+        for name in set(self.overrides) - set(wanted):
+            self.set_level(name, None)
+        for name, level in wanted.items():
+            if self.overrides.get(name) != level:
+                self.set_level(name, level)
+
+    def follow_levels(self, collection, every=5.0):
+        """Load overrides now and every `every` seconds from a daemon thread of this process (idempotent)."""
+        with self._follower_lock:
+            if self._follower is not None and self._follower.is_alive():
+                return
+            self._follower = threading.Thread(target=self._follow, args=(collection, every),
+                                              name="log-levels", daemon=True)
+            self._follower.start()
+
+    def _follow(self, collection, every):
+        while True:
+            self.load_levels(collection)
+            time.sleep(every)
+
+    def levels(self):
+        """Every logger with an explicit level, for the admin page."""
+        names = {"root"} | set(self.static_levels) | set(self.overrides)
+        names |= {name for name, logger in logging.root.manager.loggerDict.items()
+                  if isinstance(logger, logging.Logger) and logger.level}
+        rows = []
+        for name in sorted(names):
+            logger = logging.getLogger(name)
+            rows.append({"name": name, "level": logging.getLevelName(logger.level) if logger.level else "-",
+                         "effective": logging.getLevelName(logger.getEffectiveLevel()),
+                         "override": self.overrides.get(name)})
+        return rows
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "dropped": self.handler.dropped, "sampled_out": self.handler.sampled_out}
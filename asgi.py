@@ -0,0 +1,112 @@
+# Optional async serving mode: `uvicorn asgi:app` (needs a2wsgi and uvicorn; aiosmtplib optional)
+#
+# The Flask app still renders every page (same routes, templates and sessions), run
+# by a2wsgi in a bounded thread pool. What dominates the I/O is moved onto the event
+# loop, where a waiting request costs a coroutine instead of a thread:
+#   - GET /feedback/photo/<id> streams the GridFS chunks with pymongo's
+#     AsyncMongoClient, so slow photo downloads do not hold a WSGI thread each.
+#     It answers like the Flask view: same X-Request-ID header, and log records carry
+#     the same request_id/route/method/path fields. Only with MEDIA_MODE=off: in the
+#     other modes the Flask view serves the photo from the media disk cache through
+#     the proxy, which already frees the thread. The Flask hooks the view does not
+#     need are skipped (rate limits cover POST forms only, the route has no query
+#     budget), and so is the profiler;
+#   - mail sends from any view are handed to mailer.AsyncMailer and leave the
+#     request immediately.
+# benchmark_concurrency.py compares this against the sync build at a fixed worker count.
+import asyncio, logging, re
+from a2wsgi import WSGIMiddleware
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from gridfs import AsyncGridFSBucket
+from gridfs.errors import NoFile
+from pymongo import AsyncMongoClient
+import app_logging
+import config
+import db_pool
+import mailer
+from app import app as flask_app
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_PHOTO_RE = re.compile(r"^/feedback/photo/([^/]+)$")
+
+class AsyncApp:
+    def __init__(self, wsgi_app, threads):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=threads)
+        self.client = None
+        self.photos = None
+        self.mailer = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD") and self.photos is not None:
+            match = FEEDBACK_PHOTO_RE.match(scope["path"])
+            if match:
+                return await self.feedback_photo(match.group(1), scope, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("Async startup failed")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def startup(self):
+        # The async client lives on this loop; the Flask app keeps its own sync client
+        if config.MONGO_URI and config.MEDIA_MODE == "off":
+            self.client = AsyncMongoClient(config.MONGO_URI, **db_pool.client_options())
+            self.photos = AsyncGridFSBucket(self.client.get_default_database())
+        if config.SMTP_HOST:
+            self.mailer = mailer.AsyncMailer(asyncio.get_running_loop(), config.ASYNC_MAIL_CONCURRENCY)
+            mailer.transport = self.mailer.submit
+
+    async def shutdown(self):
+        if self.mailer is not None:
+            mailer.transport = mailer.send_smtp
+            await self.mailer.drain()
+        if self.client is not None:
+            await self.client.close()
+
+    async def feedback_photo(self, file_id, scope, send):
+        headers = dict(scope["headers"])
+        request_id = headers.get(app_logging.REQUEST_ID_HEADER.lower().encode(), b"").decode("latin-1")[:64]
+        request_id = request_id or app_logging.new_request_id()
+        log_fields = {"request_id": request_id, "route": "feedback_photo", "method": scope["method"], "path": scope["path"]}
+        common = [(app_logging.REQUEST_ID_HEADER.lower().encode(), request_id.encode())]
+        try:
+            stream = await self.photos.open_download_stream(ObjectId(file_id))
+        except (InvalidId, NoFile):
+            await send({"type": "http.response.start", "status": 404, "headers": [(b"content-type", b"text/plain"), *common]})
+            await send({"type": "http.response.body", "body": b"Not Found"})
+            return
+        # Content type is sniffed from magic bytes at upload time
+        content_type = (stream.content_type or "image/jpeg").encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", content_type), (b"content-length", str(stream.length).encode()), *common]})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        try:
+            while True:
+                chunk = await stream.readchunk()
+                if not chunk:
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        except Exception:
+            logger.exception("Feedback photo %s failed mid-stream", file_id, extra=log_fields)
+            raise
+        await send({"type": "http.response.body", "body": b""})
+
+app = AsyncApp(flask_app, config.ASYNC_WSGI_THREADS)
@@ -0,0 +1,86 @@
+# Concurrent-request capacity of a running server, sync build vs async mode
+#
+#   gunicorn -w 2 -b :8001 app:app                     # sync build
+#   uvicorn --workers 2 --port 8002 asgi:app           # async mode, same worker count
+#   python benchmark_concurrency.py http://localhost:8001/feedback/photo/<id> --pids <gunicorn pids>
+#   python benchmark_concurrency.py http://localhost:8002/feedback/photo/<id> --pids <uvicorn pids>
+#
+# For each concurrency level it reports throughput, latency percentiles, errors and
+# the servers' resident memory (from /proc, for the given pids), so the two builds
+# can be compared at the same memory footprint. Pick an I/O-bound URL (a feedback
+# photo, an API page against a remote Atlas cluster): a static page measures the
+# HTTP stack, not the waiting.
+import argparse, statistics, threading, time
+import urllib.error, urllib.request
+
+def rss_mb(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024 if total else None
+
+def run_level(url, concurrency, requests_per_client, timeout):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start = threading.Barrier(concurrency + 1)
+
+    def client():
+        start.wait()
+        for _ in range(requests_per_client):
+            began = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    while response.read(64 * 1024):
+                        pass
+                with lock:
+                    latencies.append(time.perf_counter() - began)
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(type(e).__name__)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    start.wait()
+    began = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    return latencies, errors, elapsed
+
+def percentile(values, share):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-request capacity of a running server.")
+    parser.add_argument("url")
+    parser.add_argument("--levels", default="1,8,32,64,128", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="requests per client per level")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--pids", default="", help="comma-separated server pids for the memory column")
+    args = parser.parse_args()
+    pids = [int(p) for p in args.pids.split(",") if p.strip()]
+
+    print(f"{'clients':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'RSS MB':>8}")
+    for level in (int(v) for v in args.levels.split(",")):
+        latencies, errors, elapsed = run_level(args.url, level, args.requests, args.timeout)
+        memory = rss_mb(pids)
+        print(f"{level:7d} {len(latencies) / elapsed:9.1f} {percentile(latencies, .5) * 1000:9.1f} "
+              f"{percentile(latencies, .95) * 1000:9.1f} {percentile(latencies, .99) * 1000:9.1f} {len(errors):7d} "
+              f"{memory if memory is not None else float('nan'):8.1f}")
+        if errors:
+            print(f"        errors: {', '.join(sorted(set(errors)))}")
+        if latencies:
+            print(f"        mean {statistics.mean(latencies) * 1000:.1f} ms over {len(latencies)} requests in {elapsed:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -22,3 +22,125 @@ ADMIN_PHONE = os.getenv("ADMIN_PHONE")
 
 SERVER_NAME = os.getenv("SERVER_NAME", "ranchoddasbhavan.com")
 PREFERRED_URL_SCHEME = os.getenv("PREFERRED_URL_SCHEME", "https")
+
+# MongoDB client / connection pool
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_RETRY_WRITES = os.getenv("MONGO_RETRY_WRITES", "true").lower() == "true"
+MONGO_RETRY_READS = os.getenv("MONGO_RETRY_READS", "true").lower() == "true"
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")  # e.g. "zstd,snappy,zlib"
+MONGO_PUBLIC_READ_PREFERENCE = os.getenv("MONGO_PUBLIC_READ_PREFERENCE", "primary")  # e.g. "secondaryPreferred"
+
+HEALTHZ_TIMEOUT_MS = int(os.getenv("HEALTHZ_TIMEOUT_MS", "1500"))
+HEALTHZ_MAX_PING_MS = float(os.getenv("HEALTHZ_MAX_PING_MS", "500"))
+
+# Upload limits (bytes)
+MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(25 * 1024 * 1024)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(8 * 1024 * 1024)))
+MAX_FORM_MEMORY_BYTES = int(os.getenv("MAX_FORM_MEMORY_BYTES", str(512 * 1024)))
+
+# Gallery uploads: content-addressed blobs in GridFS, or on this volume when set
+GALLERY_ASSET_DIR = os.getenv("GALLERY_ASSET_DIR")
+
+# Guest house capacity (guests per night) used for occupancy percentages; 0 hides them
+GUEST_CAPACITY = int(os.getenv("GUEST_CAPACITY", "0"))
+
+# Live admin events: "auto" uses change streams when available, "poll" forces polling
+ADMIN_EVENTS_MODE = os.getenv("ADMIN_EVENTS_MODE", "auto")
+ADMIN_EVENTS_POLL_SECONDS = float(os.getenv("ADMIN_EVENTS_POLL_SECONDS", "3"))
+# Open /admin/events streams per process; each holds a worker thread (needs gthread/gevent workers), 0 = no cap
+ADMIN_EVENTS_MAX_STREAMS = int(os.getenv("ADMIN_EVENTS_MAX_STREAMS", "2"))
+
+# Admin search: "auto" uses MongoDB text indexes when available, "memory" forces the in-process index
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_PER_PAGE = int(os.getenv("SEARCH_PER_PAGE", "20"))
+
+# JSON API (/api/v1): browser and CDN (s-maxage) cache lifetimes in seconds, page size limits
+API_MAX_AGE = int(os.getenv("API_MAX_AGE", "60"))
+API_SHARED_MAX_AGE = int(os.getenv("API_SHARED_MAX_AGE", "300"))
+API_PAGE_LIMIT = int(os.getenv("API_PAGE_LIMIT", "24"))
+API_MAX_PAGE_LIMIT = int(os.getenv("API_MAX_PAGE_LIMIT", "100"))
+API_MAX_AVAILABILITY_DAYS = int(os.getenv("API_MAX_AVAILABILITY_DAYS", "92"))
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "500"))
+
+# Static export of the public pages (`flask freeze`, deployed by hand, see freeze.py); rebuilt
+# after gallery edits only when enabled and FREEZE_DIR is served from persistent disk
+FREEZE_DIR = os.getenv("FREEZE_DIR", "build")
+FREEZE_ON_GALLERY_EDIT = os.getenv("FREEZE_ON_GALLERY_EDIT", "false").lower() == "true"
+
+# Rate limiting of the public POST forms: "memory" (per process) or "mongo" (shared between instances)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))  # X-Forwarded-For entries added by our own proxies
+
+# Idempotent submissions: how long a form/API key is remembered
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+
+# Scheduled jobs (scheduler.py): run in the web process, or in a sidecar with `flask run-scheduler`
+SCHEDULER_IN_PROCESS = os.getenv("SCHEDULER_IN_PROCESS", "false").lower() == "true"
+SCHEDULER_TICK_SECONDS = int(os.getenv("SCHEDULER_TICK_SECONDS", "30"))
+BOOKING_PENDING_EXPIRY_HOURS = int(os.getenv("BOOKING_PENDING_EXPIRY_HOURS", "72"))
+REMINDER_DAYS_BEFORE = int(os.getenv("REMINDER_DAYS_BEFORE", "1"))
+ORPHAN_UPLOAD_GRACE_HOURS = int(os.getenv("ORPHAN_UPLOAD_GRACE_HOURS", "24"))
+
+# Retention (retention.py): finished bookings move to the archive after N months (0 keeps them),
+# contacts expire through a TTL index after N days (0 keeps them); applied by `flask create-indexes`
+BOOKING_ARCHIVE_AFTER_MONTHS = int(os.getenv("BOOKING_ARCHIVE_AFTER_MONTHS", "12"))
+ARCHIVE_BACKEND = os.getenv("ARCHIVE_BACKEND", "collection")  # "collection" (bookings_archive) or "file"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")  # gzip'd JSON Lines when ARCHIVE_BACKEND=file
+CONTACT_RETENTION_DAYS = int(os.getenv("CONTACT_RETENTION_DAYS", "365"))
+
+# Logging (app_logging.py): "json" or "text" lines on stderr, written by a background thread.
+# LOG_LEVELS sets per-logger levels, e.g. "scheduler=DEBUG,werkzeug=WARNING" (also editable at /admin/logging);
+# LOG_DEBUG_SAMPLE_RATE keeps that share of DEBUG records (1 = all)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Request profiler (profiler.py): off by default; when on, admins profile a request with
+# X-Profile: 1 or ?_profile=1, and PROFILER_SAMPLE_RATE of all requests are profiled too
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_MODE = os.getenv("PROFILER_MODE", "cprofile")  # "cprofile" or "sample" (stack sampler)
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_TRACE_ALLOCATIONS = os.getenv("PROFILER_TRACE_ALLOCATIONS", "true").lower() == "true"
+PROFILER_RETENTION_DAYS = int(os.getenv("PROFILER_RETENTION_DAYS", "14"))
+
+# Jinja bytecode cache (template_cache.py): compiled templates kept on disk; empty disables it.
+# Run `flask warm-templates` in the build step so a woken instance finds the cache filled
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", ".jinja_cache")
+WARM_TEMPLATES_ON_BOOT = os.getenv("WARM_TEMPLATES_ON_BOOT", "false").lower() == "true"
+
+# Per-route query budgets (query_budget.py): "off", "report" (log a warning) or "enforce"
+# (raise; only under app.testing, elsewhere it reports)
+QUERY_BUDGETS = os.getenv("QUERY_BUDGETS", "off").lower()
+
+# Async serving mode (asgi.py, `uvicorn asgi:app`): threads running the Flask views, concurrent async mail sends
+ASYNC_WSGI_THREADS = int(os.getenv("ASYNC_WSGI_THREADS", "16"))
+ASYNC_MAIL_CONCURRENCY = int(os.getenv("ASYNC_MAIL_CONCURRENCY", "4"))
+
+# SMS notifications: SMS_BACKEND = twilio | http | stub | off ("" = twilio when TWILIO_SID is set)
+SMS_BACKEND = os.getenv("SMS_BACKEND", "")
+SMS_TIMEOUT = float(os.getenv("SMS_TIMEOUT", "10"))
+SMS_MAX_WORKERS = int(os.getenv("SMS_MAX_WORKERS", "2"))
+SMS_MAX_PENDING = int(os.getenv("SMS_MAX_PENDING", "50"))
+SMS_HTTP_URL = os.getenv("SMS_HTTP_URL")
+SMS_HTTP_API_KEY = os.getenv("SMS_HTTP_API_KEY")
+SMS_SENDER_ID = os.getenv("SMS_SENDER_ID")
+
+# Media delivery (media.py): MEDIA_MODE = off | sendfile | x-sendfile | x-accel
+# sendfile only removes the Python copy loop; the worker stays busy until the download ends.
+# x-accel (nginx) and x-sendfile hand the file to the proxy and free the worker at once.
+MEDIA_MODE = os.getenv("MEDIA_MODE", "off")
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/_media")  # nginx internal locations
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "media_cache")  # local copies of GridFS files
+MEDIA_CACHE_MAX_MB = int(os.getenv("MEDIA_CACHE_MAX_MB", "512"))
+
+# Feedback photo dedup: uploads within this many dHash bits (of 64) of an earlier photo are flagged
+PHOTO_NEAR_DUPLICATE_DISTANCE = int(os.getenv("PHOTO_NEAR_DUPLICATE_DISTANCE", "6"))
@@ -0,0 +1,92 @@
+# MongoDB client settings, connection-pool stats and health probe
+import threading, time
+import pymongo
+from pymongo import ReadPreference, monitoring
+import config
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primarypreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondarypreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+def read_preference(name):
+    try:
+        return READ_PREFERENCES[(name or "primary").replace("_", "").lower()]
+    except KeyError:
+        raise ValueError(f"Unknown Mongo read preference: {name}")
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Keeps running counters of connection-pool events per server address."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _pool(self, address):
+        key = "%s:%s" % address
+        if key not in self._pools:
+            self._pools[key] = {"open": 0, "in_use": 0, "created": 0, "closed": 0,
+                                "checkout_failures": 0, "clears": 0}
+        return self._pools[key]
+
+    def _bump(self, address, **deltas):
+        with self._lock:
+            pool = self._pool(address)
+            for field, delta in deltas.items():
+                pool[field] += delta
+
+    def pool_created(self, event): self._bump(event.address)
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): self._bump(event.address, clears=1)
+    def pool_closed(self, event): pass
+    def connection_created(self, event): self._bump(event.address, open=1, created=1)
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): self._bump(event.address, open=-1, closed=1)
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event): self._bump(event.address, checkout_failures=1)
+    def connection_checked_out(self, event): self._bump(event.address, in_use=1)
+    def connection_checked_in(self, event): self._bump(event.address, in_use=-1)
+
+    def stats(self):
+        with self._lock:
+            return {address: dict(pool) for address, pool in self._pools.items()}
+
+pool_monitor = PoolMonitor()
+
+def client_options(extra_listeners=()):
+    # Keyword arguments handed to MongoClient through PyMongo(app, **options)
+    options = {
+        "maxPoolSize": config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": config.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": config.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": config.MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": config.MONGO_SOCKET_TIMEOUT_MS,
+        "retryWrites": config.MONGO_RETRY_WRITES,
+        "retryReads": config.MONGO_RETRY_READS,
+        "event_listeners": [pool_monitor, *extra_listeners],
+    }
+    if config.MONGO_COMPRESSORS:
+        options["compressors"] = config.MONGO_COMPRESSORS
+    return options
+
+def health(db):
+    # Ping with a hard deadline so a sick cluster fails the probe instead of hanging it
+    report = {"pool": pool_monitor.stats(), "max_pool_size": config.MONGO_MAX_POOL_SIZE}
+    if db is None:
+        report.update(ok=False, error="MONGO_URI is not configured")
+        return report
+    started = time.perf_counter()
+    try:
+        with pymongo.timeout(config.HEALTHZ_TIMEOUT_MS / 1000):
+            db.command("ping")
+    except Exception as e:
+        report.update(ok=False, error=str(e))
+        return report
+    ping_ms = round((time.perf_counter() - started) * 1000, 2)
+    report.update(ok=ping_ms <= config.HEALTHZ_MAX_PING_MS, ping_ms=ping_ms)
+    return report
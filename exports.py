@@ -0,0 +1,135 @@
+# Streaming admin exports of bookings, feedbacks and contacts
+#
+# Rows come straight off a Mongo cursor in batches, so memory stays flat no matter
+# how many years are exported. CSV is written to the response as it is produced;
+# XLSX uses openpyxl's write-only workbook (rows go to a temp file, never a full
+# in-memory sheet) and the finished file is then streamed out in chunks.
+#
+# Names, notes, comments and messages are guest-supplied. A spreadsheet runs text
+# starting with = + - @ (or a tab/CR before them) as a formula, so CSV cells with
+# such text get a leading ' and XLSX cells are written with the string data type.
+import csv, importlib.util, io, tempfile
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+IST = ZoneInfo("Asia/Kolkata")
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# date_field: the field the from/to filter applies to
+EXPORTS = {
+    "bookings": {
+        "date_field": "check_in",
+        "statuses": ["Pending", "Accepted", "Rejected", "Expired"],
+        "columns": [("_id", "Booking ID"), ("created_at", "Created"), ("name", "Name"), ("phone", "Phone"),
+                    ("email", "Email"), ("check_in", "Check-in"), ("check_out", "Check-out"),
+                    ("guests", "Guests"), ("status", "Status"), ("note", "Note")],
+    },
+    "feedbacks": {
+        "date_field": "created_at",
+        "statuses": [],
+        "columns": [("_id", "Feedback ID"), ("created_at", "Created"), ("name", "Name"),
+                    ("rating", "Rating"), ("comments", "Comments"), ("photos", "Photos")],
+    },
+    "contacts": {
+        "date_field": "created_at",
+        "statuses": [],
+        "columns": [("_id", "Contact ID"), ("created_at", "Created"), ("name", "Name"),
+                    ("email", "Email"), ("message", "Message")],
+    },
+}
+
+def build_query(kind, date_from=None, date_to=None, status=None):
+    """Filter for an export; dates are YYYY-MM-DD strings, both ends inclusive."""
+    spec = EXPORTS[kind]
+    query = {}
+    if date_from or date_to:
+        bounds = {}
+        if spec["date_field"] == "created_at":
+            # Stored as datetimes; compare against IST day boundaries
+            if date_from:
+                bounds["$gte"] = datetime.strptime(date_from, "%Y-%m-%d").replace(tzinfo=IST)
+            if date_to:
+                bounds["$lte"] = datetime.strptime(date_to, "%Y-%m-%d").replace(hour=23, minute=59, second=59, tzinfo=IST)
+        else:
+            # Booking dates are ISO strings, which sort lexicographically
+            if date_from:
+                bounds["$gte"] = datetime.strptime(date_from, "%Y-%m-%d").strftime("%Y-%m-%d")
+            if date_to:
+                bounds["$lte"] = datetime.strptime(date_to, "%Y-%m-%d").strftime("%Y-%m-%d")
+        query[spec["date_field"]] = bounds
+    if status:
+        if status not in spec["statuses"]:
+            raise ValueError(f"Unknown status: {status}")
+        query["status"] = status
+    return query
+
+def _cell(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=ZoneInfo("UTC"))
+        return value.astimezone(IST).strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, list):
+        return len(value)
+    if value is None:
+        return ""
+    return value if isinstance(value, (int, float)) else str(value)
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def iter_rows(db, kind, query):
+    spec = EXPORTS[kind]
+    fields = [field for field, _ in spec["columns"]]
+    cursor = db[kind].find(query, {field: 1 for field in fields}).sort(spec["date_field"], 1).batch_size(BATCH_SIZE)
+    try:
+        for doc in cursor:
+            yield [_cell(doc.get(field)) for field in fields]
+    finally:
+        cursor.close()
+
+def header(kind):
+    return [title for _, title in EXPORTS[kind]["columns"]]
+
+def stream_csv(kind, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header(kind))
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_csv_cell(value) for value in row])
+        if count % BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def xlsx_available():
+    return importlib.util.find_spec("openpyxl") is not None
+
+def stream_xlsx(kind, rows):
+    from openpyxl import Workbook  # optional dependency, see requirements.txt
+    from openpyxl.cell import WriteOnlyCell
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(kind.capitalize())
+    sheet.append(header(kind))
+    for row in rows:
+        cells = []
+        for value in row:
+            cell = WriteOnlyCell(sheet, value=value)
+            if isinstance(value, str):
+                cell.data_type = "s"  # openpyxl would store "=..." as a live formula
+            cells.append(cell)
+        sheet.append(cells)
+    with tempfile.TemporaryFile() as out:
+        workbook.save(out)
+        out.seek(0)
+        for chunk in iter(lambda: out.read(CHUNK_SIZE), b""):
+            yield chunk
+
+FORMATS = {
+    "csv": (stream_csv, "text/csv"),
+    "xlsx": (stream_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
@@ -0,0 +1,83 @@
+# Thumbnails and photo listings for the admin feedback page
+#
+# /feedbacks only loads small thumbnails; the full photos are fetched when the shared
+# carousel modal opens, from a JSON listing built on fs.files metadata alone (no chunk
+# is read). Thumbnails are rendered once per photo into the feedback_thumbs GridFS
+# bucket under the original's _id, which also records the original's dimensions.
+import io
+import gridfs
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from PIL import Image, ImageOps
+from image_metadata import TRANSPOSED_ORIENTATIONS
+
+THUMB_SIZE = (240, 120)  # 2x the 60px row thumbnails
+THUMB_QUALITY = 80
+
+def object_ids(photo_ids):
+    ids = []
+    for photo_id in photo_ids:
+        try:
+            ids.append(ObjectId(photo_id))
+        except (InvalidId, TypeError):
+            continue
+    return ids
+
+def render_thumbnail(stream):
+    """JPEG thumbnail bytes and the original's (width, height)."""
+    with Image.open(stream) as im:
+        size = im.size
+        if im.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+            size = size[::-1]
+        # JPEG decodes straight at a reduced scale, which is most of the work saved
+        im.draft("RGB", (THUMB_SIZE[0] * 2, THUMB_SIZE[1] * 2))
+        thumb = ImageOps.exif_transpose(im).convert("RGB")
+        thumb.thumbnail(THUMB_SIZE)
+        out = io.BytesIO()
+        thumb.save(out, "JPEG", quality=THUMB_QUALITY, optimize=True)
+    return out.getvalue(), size
+
+class ThumbnailCache:
+    def __init__(self, db, photos):
+        self.photos = photos
+        self.files = db.fs.files
+        self.thumbs = gridfs.GridFS(db, collection="feedback_thumbs")
+        self.thumb_files = db.feedback_thumbs.files
+
+    def get(self, file_id):
+        """The cached thumbnail (a GridOut), rendered on first use; None when the photo is missing or unreadable."""
+        try:
+            return self.thumbs.get(file_id)
+        except gridfs.errors.NoFile:
+            pass
+        try:
+            original = self.photos.get(file_id)
+        except gridfs.errors.NoFile:
+            return None
+        try:
+            data, (width, height) = render_thumbnail(original)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None
+        try:
+            self.thumbs.put(data, _id=file_id, contentType="image/jpeg", metadata={"width": width, "height": height})
+        except gridfs.errors.FileExists:
+            # Another request rendered it first
+            pass
+        return self.thumbs.get(file_id)
+
+    def delete(self, file_id):
+        self.thumbs.delete(file_id)
+
+    def listing(self, photo_ids):
+        """[{id, size, content_type, width, height}] in the feedback's order, from file metadata only."""
+        ids = object_ids(photo_ids)
+        files = {f["_id"]: f for f in self.files.find({"_id": {"$in": ids}}, {"length": 1, "contentType": 1})}
+        # Dimensions are known once a thumbnail has been rendered
+        dims = {t["_id"]: t.get("metadata") or {} for t in self.thumb_files.find({"_id": {"$in": ids}}, {"metadata": 1})}
+        return [{
+            "id": str(file_id),
+            "size": files[file_id].get("length"),
+            "content_type": files[file_id].get("contentType"),
+            "width": dims.get(file_id, {}).get("width"),
+            "height": dims.get(file_id, {}).get("height"),
+        } for file_id in ids if file_id in files]
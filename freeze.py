@@ -0,0 +1,187 @@
+# Static export of the public pages for CDN hosting (`flask freeze`)
+#
+# Pages are rendered through the app's own test client, so the HTML is exactly what
+# Flask would serve to an anonymous visitor. Every /static/... URL is rewritten to
+# a content-fingerprinted copy (styles.3f2a1b9c.css) that can be cached forever,
+# and uploaded gallery assets are exported as /gallery/asset/<sha256>.<ext> (their
+# thumbnails as <sha256>.thumb.jpg).
+#
+# manifest.json remembers a hash of each page's inputs (its data plus the template and
+# asset versions); a rebuild only renders pages whose hash changed and removes pages
+# that no longer exist.
+#
+# Nothing is published automatically. To deploy: run `flask freeze` with MONGO_URI
+# set, copy vercel.json into FREEZE_DIR and run `vercel deploy --prod` from there. Its
+# filesystem route serves the frozen pages; every other URL still goes to the backend.
+# FREEZE_ON_GALLERY_EDIT rebuilds in the background after each gallery edit. That only
+# pays off when FREEZE_DIR is on persistent disk that a web server serves directly. On
+# an ephemeral instance (Render), nothing serves the rebuilt pages, so leave it off.
+import hashlib, json, logging, os, re, shutil, tempfile, threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+STATIC_URL_RE = re.compile(r"/static/([\w./-]+)")
+ASSET_URL_RE = re.compile(r"/gallery/asset/([0-9a-f]{64})(/thumb)?\b")
+ASSET_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif"}
+CHUNK_SIZE = 256 * 1024
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as out:
+        out.write(data)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+def _fingerprinted(path, digest):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest[:10]}{ext}"
+
+def page_path(url):
+    """/gallery/rooms/page/2 -> gallery/rooms/page/2/index.html"""
+    parts = [p for p in url.split("/") if p]
+    return os.path.join(*parts, "index.html") if parts else "index.html"
+
+class Freezer:
+    def __init__(self, app, output_dir, asset_store=None):
+        self.app = app
+        self.output_dir = output_dir
+        self.asset_store = asset_store
+        self._lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+        self._pending = False
+        self._worker = None
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.output_dir, MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"pages": {}, "assets": {}}
+
+    def _static_assets(self):
+        """Copy every static file under a fingerprinted name; returns {path: fingerprinted path}."""
+        static_dir = self.app.static_folder
+        sources = {}
+        for root, _, files in os.walk(static_dir):
+            for name in files:
+                full = os.path.join(root, name)
+                sources[os.path.relpath(full, static_dir).replace(os.sep, "/")] = full
+
+        assets = {}
+        # CSS refers to other assets, so it is rewritten (and hashed) after everything else
+        for path in sorted(sources, key=lambda p: p.endswith(".css")):
+            if path.endswith(".css"):
+                with open(sources[path], "rb") as f:
+                    data = self._rewrite_static(f.read().decode("utf-8"), assets).encode("utf-8")
+                target = _fingerprinted(path, _digest(data))
+                if not os.path.exists(os.path.join(self.output_dir, "static", target)):
+                    _write_atomic(os.path.join(self.output_dir, "static", target), data)
+            else:
+                target = _fingerprinted(path, _file_digest(sources[path]))
+                out = os.path.join(self.output_dir, "static", target)
+                if not os.path.exists(out):
+                    os.makedirs(os.path.dirname(out), exist_ok=True)
+                    shutil.copyfile(sources[path], out)
+            assets[path] = target
+        return assets
+
+    def _rewrite_static(self, text, assets):
+        return STATIC_URL_RE.sub(lambda m: "/static/" + assets.get(m.group(1), m.group(1)), text)
+
+    def _rewrite_gallery_assets(self, text):
+        def export(match):
+            digest = match.group(1)
+            blob = self.asset_store.get(digest) if self.asset_store else None
+            if blob is None:
+                return match.group(0)
+            if match.group(2) and blob.get("thumb"):
+                blob = blob["thumb"]
+            name = blob["_id"] + ASSET_EXTENSIONS.get(blob.get("content_type"), "")
+            out = os.path.join(self.output_dir, "gallery", "asset", name)
+            if not os.path.exists(out):
+                stream = self.asset_store.open(blob)
+                try:
+                    _write_atomic(out, stream.read())
+                finally:
+                    stream.close()
+            return "/gallery/asset/" + name
+        return ASSET_URL_RE.sub(export, text)
+
+    def _site_version(self, assets):
+        # Any template or asset change invalidates every page
+        digest = hashlib.sha256(json.dumps(assets, sort_keys=True).encode())
+        template_dir = os.path.join(self.app.root_path, self.app.template_folder)
+        for root, _, files in sorted(os.walk(template_dir)):
+            for name in sorted(files):
+                digest.update(_file_digest(os.path.join(root, name)).encode())
+        return digest.hexdigest()
+
+    def freeze(self, pages, force=False):
+        """Render `pages` ((url, data) pairs); returns (rendered urls, removed urls)."""
+        with self._lock:
+            os.makedirs(self.output_dir, exist_ok=True)
+            manifest = self._load_manifest()
+            assets = self._static_assets()
+            version = self._site_version(assets)
+            client = self.app.test_client()
+
+            rendered, seen = [], set()
+            for url, data in pages:
+                seen.add(url)
+                key = _digest((version + json.dumps(data, sort_keys=True, default=str)).encode())
+                if not force and manifest["pages"].get(url) == key and os.path.exists(os.path.join(self.output_dir, page_path(url))):
+                    continue
+                response = client.get(url)
+                if response.status_code != 200:
+                    logger.warning("Freeze skipped %s: HTTP %s", url, response.status_code)
+                    continue
+                html = self._rewrite_gallery_assets(self._rewrite_static(response.get_data(as_text=True), assets))
+                _write_atomic(os.path.join(self.output_dir, page_path(url)), html.encode("utf-8"))
+                manifest["pages"][url] = key
+                rendered.append(url)
+
+            removed = [url for url in manifest["pages"] if url not in seen]
+            for url in removed:
+                try:
+                    os.remove(os.path.join(self.output_dir, page_path(url)))
+                except FileNotFoundError:
+                    pass
+                del manifest["pages"][url]
+
+            manifest["assets"] = assets
+            _write_atomic(os.path.join(self.output_dir, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode())
+            return rendered, removed
+
+    def schedule(self, pages_fn):
+        """Rebuild in the background; writes that land during a build are folded into one more pass."""
+        with self._schedule_lock:
+            self._pending = True
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, args=(pages_fn,), name="freeze", daemon=True)
+            self._worker.start()
+
+    def _run(self, pages_fn):
+        while True:
+            with self._schedule_lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                self._pending = False
+            try:
+                rendered, removed = self.freeze(pages_fn())
+                logger.info("Frozen %d page(s), removed %d", len(rendered), len(removed))
+            except Exception:
+                logger.exception("Static freeze failed")
@@ -0,0 +1,172 @@
+# Content-addressed storage for admin gallery uploads
+#
+# Every upload is keyed by the SHA-256 of its bytes. A blob is stored once (GridFS
+# by default, or a mounted volume when GALLERY_ASSET_DIR is set) and categories
+# refer to it as "sha256:<hex>". `gallery_blobs` keeps one document per blob with a
+# reference count; release() decrements it and reclaim_unused() deletes blobs that
+# nothing points at any more.
+#
+# A new blob also gets a JPEG thumbnail for the gallery grids, stored in the same
+# backend as "<hex>.thumb" and described by the blob document's `thumb` field
+# ({_id, file_id, size, content_type}; None when the upload cannot be decoded).
+# add_thumbnail() fills it in for blobs stored before thumbnails existed.
+import hashlib, io, os, tempfile
+from datetime import datetime, timezone
+import gridfs
+from PIL import Image, ImageOps, UnidentifiedImageError
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+REF_PREFIX = "sha256:"
+CHUNK_SIZE = 256 * 1024
+THUMB_SUFFIX = ".thumb"
+THUMB_SIZE = (420, 300)  # same box as the static thumbs (generate_thumbnails.py)
+THUMB_QUALITY = 85
+
+def is_asset_ref(image):
+    return isinstance(image, str) and image.startswith(REF_PREFIX)
+
+def asset_digest(image):
+    return image[len(REF_PREFIX):]
+
+def render_thumbnail(stream):
+    """JPEG thumbnail bytes, or None if the image cannot be decoded."""
+    try:
+        with Image.open(stream) as im:
+            im.draft("RGB", (THUMB_SIZE[0] * 2, THUMB_SIZE[1] * 2))
+            thumb = ImageOps.exif_transpose(im).convert("RGB")
+            thumb.thumbnail(THUMB_SIZE)
+            out = io.BytesIO()
+            thumb.save(out, "JPEG", quality=THUMB_QUALITY, optimize=True)
+    except (UnidentifiedImageError, OSError):
+        return None
+    return out.getvalue()
+
+class GridFSBlobs:
+    def __init__(self, db):
+        self.fs = gridfs.GridFS(db, collection="gallery_assets")
+
+    def write(self, digest, stream, mimetype):
+        return self.fs.put(stream, filename=digest, contentType=mimetype)
+
+    def open(self, blob):
+        return self.fs.get(blob["file_id"])
+
+    def delete(self, blob):
+        self.fs.delete(blob["file_id"])
+
+class DirectoryBlobs:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def write(self, digest, stream, mimetype):
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                out.write(chunk)
+        os.replace(tmp, path)
+        return None
+
+    def open(self, blob):
+        return open(self.path(blob["_id"]), "rb")
+
+    def delete(self, blob):
+        try:
+            os.remove(self.path(blob["_id"]))
+        except FileNotFoundError:
+            pass
+
+class GalleryAssetStore:
+    def __init__(self, db, directory=None):
+        self.blobs = db.gallery_blobs
+        self.backend = DirectoryBlobs(directory) if directory else GridFSBlobs(db)
+
+    def put(self, stream, mimetype):
+        """Store a seekable stream and return its "sha256:<hex>" reference."""
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+        digest = digest.hexdigest()
+
+        # Known content: only bump the reference count, nothing is written
+        if self.blobs.find_one_and_update({"_id": digest}, {"$inc": {"refcount": 1}}):
+            return REF_PREFIX + digest
+
+        stream.seek(0)
+        file_id = self.backend.write(digest, stream, mimetype)
+        stream.seek(0)
+        thumb = self._write_thumbnail(digest, stream)
+        try:
+            self.blobs.insert_one({
+                "_id": digest,
+                "file_id": file_id,
+                "size": size,
+                "content_type": mimetype,
+                "thumb": thumb,
+                "refcount": 1,
+                "created_at": datetime.now(timezone.utc)
+            })
+        except DuplicateKeyError:
+            # Lost a race with an identical upload: keep theirs, drop our copy
+            if file_id is not None:
+                self.backend.delete({"_id": digest, "file_id": file_id})
+            if thumb is not None and thumb["file_id"] is not None:
+                self.backend.delete(thumb)
+            self.blobs.update_one({"_id": digest}, {"$inc": {"refcount": 1}})
+        return REF_PREFIX + digest
+
+    def _write_thumbnail(self, digest, stream):
+        data = render_thumbnail(stream)
+        if data is None:
+            return None
+        name = digest + THUMB_SUFFIX
+        file_id = self.backend.write(name, io.BytesIO(data), "image/jpeg")
+        return {"_id": name, "file_id": file_id, "size": len(data), "content_type": "image/jpeg"}
+
+    def add_thumbnail(self, blob):
+        """Render and record the thumbnail of a blob stored without one; returns it (None if undecodable)."""
+        stream = self.backend.open(blob)
+        try:
+            thumb = self._write_thumbnail(blob["_id"], stream)
+        finally:
+            stream.close()
+        self.blobs.update_one({"_id": blob["_id"]}, {"$set": {"thumb": thumb}})
+        return thumb
+
+    def missing_thumbnails(self):
+        return self.blobs.find({"thumb": {"$exists": False}})
+
+    def get(self, digest):
+        return self.blobs.find_one({"_id": digest})
+
+    def open(self, blob):
+        return self.backend.open(blob)
+
+    def release(self, image):
+        if not is_asset_ref(image):
+            return None
+        return self.blobs.find_one_and_update(
+            {"_id": asset_digest(image), "refcount": {"$gt": 0}},
+            {"$inc": {"refcount": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def reclaim_unused(self):
+        # The refcount guard makes a concurrent put() win over deletion
+        reclaimed = 0
+        for blob in self.blobs.find({"refcount": {"$lte": 0}}, {"_id": 1}):
+            blob = self.blobs.find_one_and_delete({"_id": blob["_id"], "refcount": {"$lte": 0}})
+            if blob:
+                self.backend.delete(blob)
+                if blob.get("thumb"):
+                    self.backend.delete(blob["thumb"])
+                reclaimed += 1
+        return reclaimed
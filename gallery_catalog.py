@@ -0,0 +1,54 @@
+# The bundled gallery catalogue, and the asset store for offline scripts
+#
+# GALLERY_CATEGORIES lists the images shipped in static/images. Scripts such as
+# generate_thumbnails.py import it from here, with open_store() for the database side,
+# rather than importing app.py and starting the web app's subsystems (log listener,
+# scheduler hooks, SMS pool, media server) just to read a list.
+from pymongo import MongoClient
+import config
+import db_pool
+from gallery_assets import GalleryAssetStore
+
+# List of gallery images (exact filenames)
+GALLERY_CATEGORIES = {
+    "entrances": {
+        "title": "Entrances",
+        "images": [
+            "Entrance_1.0.jpeg",
+            "Entrance_1.1.jpeg"
+        ]
+    },
+    "hotel_view": {
+        "title": "Hotel View",
+        "images": [
+            "Hotel_View_1.0.jpeg",
+            "Hotel_View_1.1.jpeg",
+            "Hotel_View_1.2.jpeg",
+            "Hotel_View_2.0.jpeg",
+            "Hotel_View_2.1.jpeg",
+            "Hotel_View_2.2.jpeg",
+            "Hotel_View_3.jpeg"
+        ]
+    },
+    "outside": {
+        "title": "Outside Views",
+        "images": [
+            "Outside_Hotel_Railway_Track.jpeg",
+            "Outside_Road_Track_Before_Hotel.jpeg",
+            "Welcome_To_Matheran.jpeg"
+        ]
+    },
+    "signs": {
+        "title": "Signboards",
+        "images": [
+            "Ranchoddas_Arogya_Bhavan.jpeg"
+        ]
+    }
+}
+
+def open_store():
+    """(db, GalleryAssetStore) on MONGO_URI, or (None, None) when it is not configured."""
+    if not config.MONGO_URI:
+        return None, None
+    db = MongoClient(config.MONGO_URI, **db_pool.client_options()).get_default_database()
+    return db, GalleryAssetStore(db, config.GALLERY_ASSET_DIR)
@@ -0,0 +1,145 @@
+# Gallery images as one document per image instead of an unbounded categories.images array
+#
+# gallery_images: {category_key, position, image, uploaded_at, content_type, size, meta}
+# Positions are dense (0..n-1) within a category, so a category page is an indexed
+# range query on (category_key, position), and meta (image_metadata.py) is inlined
+# by the templates without touching the image itself. Each category document keeps an
+# incrementally maintained image_count and a 3-image sample for the /gallery cards.
+import logging, os
+from datetime import datetime, timezone
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from gallery_assets import is_asset_ref, asset_digest
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_SIZE = 3
+
+def ensure_indexes(db):
+    db.gallery_images.create_index([("category_key", ASCENDING), ("position", ASCENDING)])
+    db.gallery_images.create_index([("category_key", ASCENDING), ("image", ASCENDING)], unique=True)
+    db.categories.create_index("key", unique=True)
+
+def refresh_sample(db, category_key):
+    sample = [d["image"] for d in db.gallery_images.find(
+        {"category_key": category_key, "position": {"$lt": SAMPLE_SIZE}}, {"image": 1}
+    ).sort("position", ASCENDING)]
+    db.categories.update_one({"key": category_key}, {"$set": {"sample": sample}})
+
+def add_image(db, category_filter, image, content_type=None, size=None, meta=None):
+    """Append `image` to a category; returns the new document, or None if it is already there."""
+    category = db.categories.find_one_and_update(
+        category_filter, {"$inc": {"image_count": 1}}, return_document=ReturnDocument.BEFORE
+    )
+    if category is None:
+        return None
+    doc = {
+        "category_key": category["key"],
+        "position": category.get("image_count", 0),
+        "image": image,
+        "uploaded_at": datetime.now(timezone.utc),
+        "content_type": content_type,
+        "size": size,
+        "meta": meta,
+    }
+    try:
+        db.gallery_images.insert_one(doc)
+    except DuplicateKeyError:
+        db.categories.update_one({"_id": category["_id"]}, {"$inc": {"image_count": -1}})
+        return None
+    if doc["position"] < SAMPLE_SIZE:
+        refresh_sample(db, category["key"])
+    return doc
+
+def remove_image(db, category_key, image):
+    doc = db.gallery_images.find_one_and_delete({"category_key": category_key, "image": image})
+    if doc is None:
+        return None
+    # Close the gap so positions stay dense
+    db.gallery_images.update_many(
+        {"category_key": category_key, "position": {"$gt": doc["position"]}},
+        {"$inc": {"position": -1}}
+    )
+    db.categories.update_one({"key": category_key}, {"$inc": {"image_count": -1}})
+    if doc["position"] < SAMPLE_SIZE:
+        refresh_sample(db, category_key)
+    return doc
+
+def set_meta(db, image, meta):
+    # The same image may sit in several categories
+    return db.gallery_images.update_many({"image": image}, {"$set": {"meta": meta}}).modified_count
+
+def missing_meta(db):
+    return db.gallery_images.distinct("image", {"meta": None})
+
+def remove_category(db, category_key):
+    images = [d["image"] for d in db.gallery_images.find({"category_key": category_key}, {"image": 1})]
+    db.gallery_images.delete_many({"category_key": category_key})
+    return images
+
+def page(db, category_key, page_number, per_page):
+    start = (page_number - 1) * per_page
+    return list(db.gallery_images.find(
+        {"category_key": category_key, "position": {"$gte": start, "$lt": start + per_page}}
+    ).sort("position", ASCENDING))
+
+def after(db, category_key, position, limit):
+    """Up to `limit` images from `position` on, plus the position to continue from (or None)."""
+    docs = list(db.gallery_images.find(
+        {"category_key": category_key, "position": {"$gte": position}}
+    ).sort("position", ASCENDING).limit(limit + 1))
+    next_position = docs[limit]["position"] if len(docs) > limit else None
+    return docs[:limit], next_position
+
+def images_by_category(db, category_keys):
+    grouped = {key: [] for key in category_keys}
+    for doc in db.gallery_images.find({"category_key": {"$in": list(category_keys)}}).sort(
+        [("category_key", ASCENDING), ("position", ASCENDING)]
+    ):
+        grouped[doc["category_key"]].append(doc)
+    return grouped
+
+def migrate(db, static_dir, batch_size=500):
+    """Move every legacy categories.images array into gallery_images (safe to re-run)."""
+    moved = 0
+    for category in db.categories.find({"images": {"$exists": True}}):
+        key = category["key"]
+        uploaded_at = category.get("created_at") or datetime.now(timezone.utc)
+        ops = []
+        for position, image in enumerate(dict.fromkeys(category.get("images", []))):
+            content_type, size = None, None
+            if is_asset_ref(image):
+                blob = db.gallery_blobs.find_one({"_id": asset_digest(image)}) or {}
+                content_type, size = blob.get("content_type"), blob.get("size")
+            elif os.path.exists(os.path.join(static_dir, image)):
+                size = os.path.getsize(os.path.join(static_dir, image))
+            ops.append(UpdateOne(
+                {"category_key": key, "image": image},
+                {"$set": {"position": position},
+                 "$setOnInsert": {"uploaded_at": uploaded_at, "content_type": content_type, "size": size}},
+                upsert=True
+            ))
+            if len(ops) >= batch_size:
+                db.gallery_images.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            db.gallery_images.bulk_write(ops, ordered=False)
+        count = db.gallery_images.count_documents({"category_key": key})
+        db.categories.update_one({"_id": category["_id"]}, {"$set": {"image_count": count}, "$unset": {"images": ""}})
+        refresh_sample(db, key)
+        moved += count
+    return moved
+
+def migrate_pending(db, static_dir):
+    """Run migrate() at startup when legacy images arrays are left; a no-op read otherwise."""
+    try:
+        if db.categories.find_one({"images": {"$exists": True}}, {"_id": 1}) is None:
+            return 0
+        # The unique (category_key, image) index keeps concurrent workers from duplicating rows
+        ensure_indexes(db)
+        moved = migrate(db, static_dir)
+    except PyMongoError:
+        logger.exception("Gallery migration at startup failed; run `flask migrate-gallery-images`")
+        return None
+    logger.info("Migrated %d legacy gallery images", moved)
+    return moved
@@ -1,13 +1,20 @@
-# iterate over all images in GALLERY_CATEGORIES to create thumbs
+# iterate over all images in GALLERY_CATEGORIES to create thumbs and metadata
+# (dimensions, dominant color, placeholder; see image_metadata.py), then fill in
+# the metadata of gallery_images documents that have none yet and the thumbnails of
+# uploaded blobs stored before the asset store rendered them
 from PIL import Image
 import os
-from app import GALLERY_CATEGORIES  # or import from a shared module
+import gallery_images
+import image_metadata
+from gallery_assets import is_asset_ref, asset_digest
+from gallery_catalog import GALLERY_CATEGORIES, open_store
 
 SRC = "static/images"
 DST = os.path.join(SRC, "thumbs")
 os.makedirs(DST, exist_ok=True)
 sizes = (420, 300)
 
+metadata = {}
 for cat in GALLERY_CATEGORIES.values():
     for fname in cat["images"]:
         src_path = os.path.join(SRC, fname)
@@ -15,10 +22,45 @@ for cat in GALLERY_CATEGORIES.values():
         if not os.path.exists(src_path):
             print("Missing:", src_path)
             continue
+        meta = image_metadata.extract(src_path)
+        if meta:
+            metadata[fname] = meta
+        if os.path.exists(dst_path) and os.path.getmtime(dst_path) >= os.path.getmtime(src_path):
+            continue
         try:
             with Image.open(src_path) as im:
                 im.thumbnail(sizes)
                 im.save(dst_path, optimize=True, quality=85)
                 print("Thumb saved:", dst_path)
         except Exception as e:
-            print("Failed:", fname, e)
\ No newline at end of file
+            print("Failed:", fname, e)
+
+image_metadata.write_manifest(SRC, metadata)
+print("Metadata saved:", os.path.join(SRC, image_metadata.MANIFEST), len(metadata), "images")
+
+db, gallery_store = open_store()
+if db is None:
+    print("MONGO_URI not set: skipped the metadata of uploaded gallery images")
+
+for image in gallery_images.missing_meta(db) if db is not None else []:
+    if is_asset_ref(image):
+        blob = gallery_store.get(asset_digest(image))
+        if not blob:
+            print("Missing blob:", image)
+            continue
+        stream = gallery_store.open(blob)
+        try:
+            meta = image_metadata.extract(stream)
+        finally:
+            stream.close()
+    else:
+        meta = metadata.get(image) or image_metadata.extract(os.path.join(SRC, image))
+    if meta:
+        gallery_images.set_meta(db, image, meta)
+        print("Metadata stored:", image)
+    else:
+        print("No metadata:", image)
+
+for blob in gallery_store.missing_thumbnails() if db is not None else []:
+    thumb = gallery_store.add_thumbnail(blob)
+    print("Thumb stored:" if thumb else "Not an image:", blob["_id"])
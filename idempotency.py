@@ -0,0 +1,155 @@
+# Idempotent form and API submissions
+#
+# Each rendered form carries a fresh key in its action URL (?idempotency_key=...);
+# API clients send an Idempotency-Key header. The first POST with a key claims it by
+# inserting {_id: "<endpoint>:<key>", state: "pending"} into idempotency_keys (the
+# _id makes the claim atomic) and runs the view; the response (redirect target,
+# flashed messages, small bodies) is then stored on that document. A repeated POST
+# with the same key gets the stored response replayed without running the view, so
+# there is no second insert, mail, SMS or GridFS upload. The key is read from the
+# URL or headers, never the body, so a replayed multipart upload is not even parsed.
+# Keys expire through a TTL index on expires_at.
+#
+# A view that fails before writing anything releases its key, so the guest can retry.
+# Views create their document with insert_once(), which stamps it with the key (unique
+# index) and marks the request committed: a failure after that point stores a generic
+# "received" response instead of releasing the key, and a re-run of the same key finds
+# the document already there rather than inserting it again.
+import functools, time, uuid
+from datetime import datetime, timedelta, timezone
+from bson import Binary
+from flask import Response, current_app, flash, g, request, session
+from pymongo.errors import DuplicateKeyError
+
+KEY_ARG = "idempotency_key"
+KEY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 128
+MAX_STORED_BODY = 64 * 1024
+
+def new_key():
+    return uuid.uuid4().hex
+
+KEYED_COLLECTIONS = ("bookings", "feedbacks", "contacts")
+
+def ensure_indexes(db):
+    db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+    for name in KEYED_COLLECTIONS:
+        db[name].create_index("idempotency_key", unique=True,
+                              partialFilterExpression={"idempotency_key": {"$type": "string"}})
+
+def current_key():
+    """The claimed key of the guarded request being handled, if any."""
+    return g.get("idempotency_key")
+
+def committed():
+    """The view has made a durable write: from here on its key is never released."""
+    g.idempotency_committed = True
+
+def insert_once(collection, doc):
+    """Insert `doc` stamped with the current key; (doc, True), or (earlier document, False) on a re-run."""
+    key = current_key()
+    if key:
+        doc["idempotency_key"] = key
+    try:
+        collection.insert_one(doc)
+    except DuplicateKeyError:
+        existing = collection.find_one({"idempotency_key": key}) if key else None
+        if existing is None:
+            raise
+        committed()
+        return existing, False
+    committed()
+    return doc, True
+
+def request_key():
+    key = request.headers.get(KEY_HEADER) or request.args.get(KEY_ARG)
+    return key.strip()[:MAX_KEY_LENGTH] if key and key.strip() else None
+
+def _snapshot(response, flashes):
+    stored = {"status": response.status_code, "headers": {}, "flashes": flashes}
+    for name in ("Location", "Content-Type", "Retry-After"):
+        if name in response.headers:
+            stored["headers"][name] = response.headers[name]
+    if not response.is_streamed and not response.direct_passthrough:
+        body = response.get_data()
+        if len(body) <= MAX_STORED_BODY:
+            stored["body"] = Binary(body)
+    return stored
+
+def _replay(stored):
+    for category, message in stored.get("flashes", []):
+        flash(message, category)
+    response = Response(bytes(stored.get("body", b"")), status=stored["status"])
+    for name, value in stored["headers"].items():
+        response.headers[name] = value
+    response.headers["Idempotent-Replay"] = "true"
+    return response
+
+class IdempotencyGuard:
+    def __init__(self, db, ttl_seconds=86400, pending_timeout=60, wait_seconds=5):
+        self.keys = db.idempotency_keys
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.pending_timeout = timedelta(seconds=pending_timeout)
+        self.wait_seconds = wait_seconds
+
+    def _claim(self, doc_id):
+        now = datetime.now(timezone.utc)
+        try:
+            self.keys.insert_one({"_id": doc_id, "state": "pending", "created_at": now, "expires_at": now + self.ttl})
+            return True, None
+        except DuplicateKeyError:
+            pass
+        # A pending claim whose request died (worker killed mid-view) may be taken over
+        taken = self.keys.find_one_and_update(
+            {"_id": doc_id, "state": "pending", "created_at": {"$lt": now - self.pending_timeout}},
+            {"$set": {"created_at": now, "expires_at": now + self.ttl}}
+        )
+        return (True, None) if taken else (False, self.keys.find_one({"_id": doc_id}))
+
+    def _wait_for(self, doc_id, doc):
+        # The first submission is still running: give it a moment to finish
+        deadline = time.monotonic() + self.wait_seconds
+        while doc is not None and doc.get("state") == "pending" and time.monotonic() < deadline:
+            time.sleep(0.2)
+            doc = self.keys.find_one({"_id": doc_id})
+        return doc
+
+    def __call__(self, in_progress, received):
+        """Decorator; `in_progress()` builds the response when the first submission has not finished yet,
+        `received()` the one stored when the view fails after committing its writes."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                key = request_key() if request.method == "POST" else None
+                if key is None:
+                    return view(*args, **kwargs)
+                doc_id = f"{request.endpoint}:{key}"
+                claimed, doc = self._claim(doc_id)
+                if not claimed:
+                    doc = self._wait_for(doc_id, doc)
+                    if doc is not None and doc.get("state") == "done":
+                        return _replay(doc["response"])
+                    if doc is not None:
+                        return in_progress()
+                    # Expired between the insert and the read: run as a first submission
+                    claimed, doc = self._claim(doc_id)
+                    if not claimed:
+                        return in_progress()
+
+                g.idempotency_key, g.idempotency_committed = doc_id, False
+                flashes_before = len(session.get("_flashes", []))
+                try:
+                    response = current_app.make_response(view(*args, **kwargs))
+                except Exception:
+                    if not g.idempotency_committed:
+                        # Nothing written: let the guest retry with the same key
+                        self.keys.delete_one({"_id": doc_id})
+                        raise
+                    # Written already: a retry must not write again, so answer and remember "received"
+                    current_app.logger.exception("%s failed after committing its writes", request.endpoint)
+                    response = current_app.make_response(received())
+                flashes = [list(f) for f in session.get("_flashes", [])[flashes_before:]]
+                self.keys.update_one({"_id": doc_id}, {"$set": {"state": "done", "response": _snapshot(response, flashes)}})
+                return response
+            return wrapper
+        return decorator
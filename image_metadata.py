@@ -0,0 +1,89 @@
+# Intrinsic metadata for gallery images, extracted once and inlined by the templates
+#
+#   {width, height, color, lqip}
+# width/height are the displayed (EXIF-oriented) dimensions, so <img width height>
+# reserves the right box before any bytes arrive; color is the dominant colour as
+# "#rrggbb" and lqip a ~16px JPEG as a data: URI, painted as the box's background
+# while the real image loads (no extra request).
+#
+# Uploaded images keep it on their gallery_images document (meta); the bundled
+# static images get it from static/images/metadata.json, written by
+# generate_thumbnails.py.
+import base64, io, json, os
+from PIL import Image, ImageOps
+from markupsafe import Markup
+
+LQIP_SIZE = 16
+LQIP_QUALITY = 40
+COLOR_SAMPLE = 64
+MANIFEST = "metadata.json"
+# EXIF orientations that rotate by 90 degrees (width and height swap)
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+def extract(source):
+    """Metadata for a path or seekable stream; None when Pillow cannot read it."""
+    try:
+        with Image.open(source) as im:
+            width, height = im.size
+            if im.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            # JPEG can decode at 1/8 scale directly: no full-size decode for a 16px preview
+            im.draft("RGB", (COLOR_SAMPLE, COLOR_SAMPLE))
+            small = ImageOps.exif_transpose(im).convert("RGB")
+            small.thumbnail((COLOR_SAMPLE, COLOR_SAMPLE))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return {"width": width, "height": height, "color": dominant_color(small), "lqip": lqip(small)}
+
+def dominant_color(im):
+    quantized = im.quantize(colors=5)
+    palette = quantized.getpalette()
+    _, index = max(quantized.getcolors())
+    return "#{:02x}{:02x}{:02x}".format(*palette[index * 3:index * 3 + 3])
+
+def lqip(im):
+    tiny = im.copy()
+    tiny.thumbnail((LQIP_SIZE, LQIP_SIZE))
+    out = io.BytesIO()
+    tiny.save(out, "JPEG", quality=LQIP_QUALITY, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+def img_size(meta):
+    """width/height attributes for an <img>; empty when nothing is known yet."""
+    if not meta:
+        return Markup("")
+    return Markup('width="{}" height="{}"').format(meta["width"], meta["height"])
+
+def placeholder_style(meta):
+    """CSS painting the placeholder behind an <img> until its bytes arrive."""
+    if not meta:
+        return ""
+    return f"background:{meta['color']} url('{meta['lqip']}') center/cover no-repeat;"
+
+def write_manifest(directory, metadata):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(metadata, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+class StaticManifest:
+    """metadata.json for the bundled images, reloaded when the file changes."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST)
+        self._mtime = None
+        self._data = {}
+
+    def get(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return {}
+        if mtime != self._mtime:
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            except ValueError:
+                self._data = {}
+            self._mtime = mtime
+        return self._data
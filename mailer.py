@@ -0,0 +1,58 @@
+# Outgoing mail transport shared by every notification
+#
+# send(msg) delivers over SMTP in the calling thread, so callers keep their own
+# try/except and log the failure. Under the ASGI server (asgi.py) the transport is
+# swapped for AsyncMailer: send() only schedules the delivery on the event loop
+# (aiosmtplib when installed, otherwise smtplib in a worker thread) and returns at
+# once; failures are then logged by the mailer itself.
+import asyncio, logging, smtplib
+import config
+
+logger = logging.getLogger(__name__)
+
+SMTP_TIMEOUT = 30
+
+def send_smtp(msg):
+    with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=SMTP_TIMEOUT) as server: # type: ignore
+        server.starttls()
+        if config.SMTP_USER is not None and config.SMTP_PASS is not None: # type: ignore
+            server.login(config.SMTP_USER, config.SMTP_PASS) # type: ignore
+        server.send_message(msg)
+
+class AsyncMailer:
+    def __init__(self, loop, max_concurrent=4):
+        self.loop = loop
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.pending = set()
+        try:
+            import aiosmtplib
+            self._aiosmtplib = aiosmtplib
+        except ImportError:
+            self._aiosmtplib = None
+
+    async def _deliver(self, msg):
+        async with self._slots:
+            try:
+                if self._aiosmtplib is not None:
+                    await self._aiosmtplib.send(
+                        msg, hostname=config.SMTP_HOST, port=config.SMTP_PORT, start_tls=True, timeout=SMTP_TIMEOUT, # type: ignore
+                        username=config.SMTP_USER, password=config.SMTP_PASS) # type: ignore
+                else:
+                    await asyncio.to_thread(send_smtp, msg)
+            except Exception:
+                logger.exception("Failed to send mail %r to %s", msg["Subject"], msg["To"])
+
+    def submit(self, msg):
+        # Called from the Flask worker threads; the loop owns the delivery from here
+        future = asyncio.run_coroutine_threadsafe(self._deliver(msg), self.loop)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+
+    async def drain(self, timeout=30):
+        if self.pending:
+            await asyncio.wait([asyncio.wrap_future(f) for f in list(self.pending)], timeout=timeout)
+
+transport = send_smtp
+
+def send(msg):
+    transport(msg)
@@ -0,0 +1,180 @@
+# Media delivery that frees the Python worker while the bytes go out
+#
+# MEDIA_MODE:
+#   off         Flask streams everything itself (the default);
+#   sendfile    files go out through wsgi.file_wrapper, which gunicorn turns into
+#               os.sendfile(): the kernel copies, no Python loop per chunk. The worker
+#               still waits until the last byte has gone out, so with sync workers a
+#               slow client holds one for the whole download. Behind nginx use
+#               x-accel, which frees the worker as soon as the headers are written;
+#   x-sendfile  an empty response with X-Sendfile: <absolute path> (Apache
+#               mod_xsendfile, lighttpd); Flask's own static view honours it too;
+#   x-accel     an empty response with X-Accel-Redirect: <prefix>/<root>/<path>, for
+#               nginx, which needs one internal location per root, e.g.
+#                 location /_media/static/ { internal; alias /srv/app/static/; }
+#                 location /_media/cache/  { internal; alias /srv/app/media_cache/; }
+#                 location /_media/assets/ { internal; alias <GALLERY_ASSET_DIR>/; }
+# In the offload modes the proxy also answers Range and conditional requests.
+#
+# GridFS files (feedback photos, gallery assets without GALLERY_ASSET_DIR) are first
+# copied to DiskCache, so repeat downloads are served from local disk without Mongo.
+# The cache is shared by every worker on the host and trimmed oldest-first (by last
+# hit) once it grows past MEDIA_CACHE_MAX_MB. Each worker keeps a running total of the
+# cache size and only scans the tree when that total passes the limit. The scan
+# resyncs the total with what the other workers wrote, then trims down to
+# TRIM_TO of the limit, so the next scan is some downloads away. Between scans the
+# cache can overshoot by what the other workers stored since their last scan.
+import logging, mimetypes, os, tempfile
+from flask import Response, abort, current_app, send_file
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "sendfile", "x-sendfile", "x-accel")
+CHUNK_SIZE = 256 * 1024
+TRIM_TO = 0.9
+
+class DiskCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None  # running total in bytes; None until the first scan
+
+    def _dir(self, key):
+        return os.path.join(self.directory, key[:2])
+
+    def lookup(self, key):
+        """(path, mimetype) of a cached file, or None."""
+        try:
+            names = os.listdir(self._dir(key))
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if name.startswith(key) and not name.startswith(f"{key}.tmp"):
+                path = os.path.join(self._dir(key), name)
+                try:
+                    os.utime(path)  # mtime doubles as last-hit time for eviction
+                except FileNotFoundError:
+                    return None
+                return path, mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return None
+
+    def store(self, key, stream, mimetype):
+        ext = mimetypes.guess_extension(mimetype or "") or ""
+        path = os.path.join(self._dir(key), key + ext)
+        os.makedirs(self._dir(key), exist_ok=True)
+        # Write under a temporary name so other workers never serve a partial file
+        fd, tmp = tempfile.mkstemp(dir=self._dir(key), prefix=f"{key}.tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    out.write(chunk)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if self._size is None or self._size + size > self.max_bytes:
+            self.trim()
+        else:
+            self._size += size
+        return path, mimetype
+
+    def discard(self, key):
+        cached = self.lookup(key)
+        if cached is not None:
+            try:
+                size = os.path.getsize(cached[0])
+                os.remove(cached[0])
+            except FileNotFoundError:
+                return
+            if self._size is not None:
+                self._size = max(self._size - size, 0)
+
+    def _cached_files(self, directory):
+        """(mtime, size, path) of the finished files in one cache subdirectory."""
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return []
+        files = []
+        for f in entries:
+            # "<key>.tmp*" is another worker's download in progress; removing it breaks its os.replace()
+            if ".tmp" in f.name:
+                continue
+            try:
+                if not f.is_file():
+                    continue
+                st = f.stat()
+            except FileNotFoundError:
+                continue  # removed by another worker's trim or discard meanwhile
+            files.append((st.st_mtime, st.st_size, f.path))
+        return files
+
+    def trim(self):
+        """Scan the cache, remove least recently hit files down to TRIM_TO of the limit; returns the count."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                files.extend(self._cached_files(entry.path))
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes if total <= self.max_bytes else int(self.max_bytes * TRIM_TO)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._size = total
+        if removed:
+            logger.info("Media cache trimmed by %d files", removed)
+        return removed
+
+class MediaServer:
+    def __init__(self, mode, accel_prefix, roots):
+        if mode not in MODES:
+            raise ValueError(f"Unknown MEDIA_MODE: {mode}")
+        self.mode = mode
+        self.accel_prefix = accel_prefix.rstrip("/")
+        self.roots = {name: os.path.realpath(root) for name, root in roots.items() if root}
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def install(self, app):
+        app.config["USE_X_SENDFILE"] = self.mode == "x-sendfile"
+        if self.mode == "x-accel":
+            app.view_functions["static"] = self.static_view
+
+    def _accel_uri(self, path):
+        path = os.path.realpath(path)
+        for name, root in self.roots.items():
+            if path.startswith(root + os.sep):
+                return f"{self.accel_prefix}/{name}/{os.path.relpath(path, root).replace(os.sep, '/')}"
+        raise ValueError(f"{path} is outside every media root")
+
+    def send(self, path, mimetype, max_age=None, etag=None):
+        if self.mode != "x-accel":
+            # sendfile: wsgi.file_wrapper; x-sendfile: send_file emits the header itself
+            return send_file(path, mimetype=mimetype, conditional=True, etag=etag or True, max_age=max_age)
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = self._accel_uri(path)
+        if etag:
+            response.set_etag(etag)
+        if max_age is not None:
+            response.cache_control.max_age = max_age
+            response.cache_control.public = True
+        return response
+
+    def static_view(self, filename):
+        root = current_app.static_folder
+        path = safe_join(root, filename) # type: ignore
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        return self.send(path, mimetypes.guess_type(path)[0] or "application/octet-stream",
+                         max_age=current_app.get_send_file_max_age(filename))
@@ -0,0 +1,125 @@
+# Duplicate detection for feedback photos
+#
+# Every photo in the fs bucket gets a photo_fingerprints document keyed by its file id:
+#   sha256  of the bytes (computed by the upload sink as they stream in), unique;
+#   dhash   a 64-bit difference hash of the 9x8 greyscale image, which survives
+#           re-encoding, resizing and small edits;
+#   bands   the dHash cut into 8 one-byte bands, multikey-indexed. Two hashes within
+#           7 bits of each other share at least one band, so candidates for a
+#           near-duplicate come from an index lookup, not a scan of every photo.
+# An upload whose sha256 is already known is deleted and the existing file id is used
+# instead. One within PHOTO_NEAR_DUPLICATE_DISTANCE bits of an earlier photo is kept,
+# and the pair is recorded on the feedback (similar_photos) for the admin to review.
+import hashlib
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+from PIL import Image, UnidentifiedImageError
+
+HASH_WIDTH, HASH_HEIGHT = 9, 8
+BANDS = 8
+MAX_SIMILAR = 5
+READ_SIZE = 256 * 1024
+
+def dhash(stream):
+    """64-bit difference hash as an int, or None if the image cannot be decoded."""
+    try:
+        with Image.open(stream) as im:
+            im.draft("L", (HASH_WIDTH * 8, HASH_HEIGHT * 8))
+            pixels = list(im.convert("L").resize((HASH_WIDTH, HASH_HEIGHT), Image.LANCZOS).getdata())
+    except (UnidentifiedImageError, OSError):
+        return None
+    value = 0
+    for row in range(HASH_HEIGHT):
+        for col in range(HASH_WIDTH - 1):
+            left = pixels[row * HASH_WIDTH + col]
+            value = (value << 1) | (left > pixels[row * HASH_WIDTH + col + 1])
+    return value
+
+def bands(value):
+    return [f"{i}:{(value >> (8 * i)) & 0xff:02x}" for i in range(BANDS)]
+
+def distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+def sha256_of(stream):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(READ_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+class PhotoIndex:
+    def __init__(self, db, fs, max_distance=6):
+        self.fingerprints = db.photo_fingerprints
+        self.files = db.fs.files
+        self.fs = fs
+        self.max_distance = max_distance
+
+    def ensure_indexes(self):
+        self.fingerprints.create_index("sha256", unique=True)
+        self.fingerprints.create_index("bands")
+
+    def fingerprint(self, file_id, sha256=None):
+        grid_out = self.fs.get(file_id)
+        if sha256 is None:
+            sha256 = sha256_of(grid_out)
+            grid_out.seek(0)
+        value = dhash(grid_out)
+        return {
+            "_id": file_id,
+            "sha256": sha256,
+            "dhash": f"{value:016x}" if value is not None else None,
+            "bands": bands(value) if value is not None else [],
+            "size": grid_out.length,
+            "created_at": datetime.now(timezone.utc),
+        }
+
+    def similar(self, doc):
+        if not doc["dhash"]:
+            return []
+        matches = []
+        for other in self.fingerprints.find({"bands": {"$in": doc["bands"]}, "_id": {"$ne": doc["_id"]}},
+                                            {"dhash": 1}):
+            d = distance(doc["dhash"], other["dhash"])
+            if d <= self.max_distance:
+                matches.append({"photo": str(doc["_id"]), "similar_to": str(other["_id"]), "distance": d})
+        return sorted(matches, key=lambda m: m["distance"])[:MAX_SIMILAR]
+
+    def register(self, file_id, sha256=None):
+        """(id to keep, near-duplicate matches). An exact duplicate's new file is deleted."""
+        doc = self.fingerprint(file_id) if sha256 is None else None
+        kept = self._keep_existing(file_id, sha256 or doc["sha256"]) # type: ignore
+        if kept is not None:
+            return kept, []
+        doc = doc or self.fingerprint(file_id, sha256)
+        try:
+            self.fingerprints.insert_one(doc)
+        except DuplicateKeyError:
+            # Same bytes fingerprinted meanwhile by another upload, or a re-run
+            return self._keep_existing(file_id, doc["sha256"]) or file_id, []
+        return file_id, self.similar(doc)
+
+    def _keep_existing(self, file_id, sha256):
+        existing = self.fingerprints.find_one({"sha256": sha256}, {"_id": 1})
+        if existing is None or existing["_id"] == file_id:
+            return None
+        self.fs.delete(file_id)
+        return existing["_id"]
+
+    def forget(self, file_id):
+        self.fingerprints.delete_one({"_id": file_id})
+
+    def replace_references(self, feedbacks, old_id, new_id):
+        """Point feedbacks at new_id instead of old_id (each photo listed once); returns the count."""
+        old, new, updated = str(old_id), str(new_id), 0
+        for fb in feedbacks.find({"photos": old}, {"photos": 1}):
+            photos = list(dict.fromkeys(new if p == old else p for p in fb["photos"]))
+            feedbacks.update_one({"_id": fb["_id"]}, {"$set": {"photos": photos}})
+            updated += 1
+        return updated
+
+    def unindexed(self, after_id, batch_size):
+        """Next batch of fs file ids (by _id) without a fingerprint."""
+        query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+        ids = [f["_id"] for f in self.files.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+        known = {f["_id"] for f in self.fingerprints.find({"_id": {"$in": ids}}, {"_id": 1})}
+        return ids, [i for i in ids if i not in known]
@@ -0,0 +1,179 @@
+# Opt-in request profiler
+#
+# Only installed when PROFILER_ENABLED is set; otherwise no hook exists and requests
+# pay nothing. When installed, a request is profiled if a logged-in admin asks for it
+# (X-Profile: 1 header or ?_profile=1) or it falls into the PROFILER_SAMPLE_RATE share.
+# The view (and its template rendering) runs under either
+#   - cProfile ("cprofile"): exact call counts and times; downloadable as a pstats
+#     file for snakeviz / flameprof, or
+#   - a stack sampler ("sample"): a thread snapshots the request thread's stack every
+#     few ms; downloadable as folded stacks for flamegraph.pl / speedscope,
+# plus tracemalloc for the allocations made during the request. The top frames and
+# allocations are stored in the profiles collection with the route and timing.
+# tracemalloc is process-wide, so one request per process is profiled at a time.
+import cProfile, io, logging, marshal, pstats, random, sys, threading, time, tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from bson import Binary
+from flask import g, request
+from flask_login import current_user
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_HEADER = "X-Profile"
+TRIGGER_ARG = "_profile"
+TOP_FRAMES = 30
+TOP_ALLOCATIONS = 20
+MAX_RAW_BYTES = 4 * 1024 * 1024
+
+class StackSampler:
+    """Counts the folded stacks of one thread, sampled every `interval` seconds."""
+
+    def __init__(self, thread_id, interval=0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top_frames(self, limit):
+        # Self samples (the leaf) and total samples (anywhere on the stack) per frame
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [{"frame": frame, "self_samples": own[frame], "total_samples": total[frame]}
+                for frame, _ in own.most_common(limit)]
+
+def _cprofile_top(profile, limit):
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, func), (calls, primitive, tottime, cumtime, _) in stats.stats.items(): # type: ignore
+        rows.append({"frame": f"{func} ({filename}:{line})", "calls": calls, "primitive_calls": primitive,
+                     "tottime_ms": round(tottime * 1000, 3), "cumtime_ms": round(cumtime * 1000, 3)})
+    rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+    return rows[:limit]
+
+def _pstats_dump(profile):
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
+
+def _top_allocations(snapshot, limit):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    return [{"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]]
+
+class RequestProfiler:
+    def __init__(self, db, mode="cprofile", sample_rate=0.0, trace_allocations=True, interval=0.002):
+        self.profiles = db.profiles
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.trace_allocations = trace_allocations
+        self.interval = interval
+        self._busy = threading.Lock()
+
+    def ensure_indexes(self, retention_days):
+        self.profiles.create_index("created_at", expireAfterSeconds=retention_days * 86400)
+        self.profiles.create_index([("route", 1), ("created_at", -1)])
+
+    def wanted(self):
+        asked = request.headers.get(TRIGGER_HEADER) == "1" or request.args.get(TRIGGER_ARG) == "1"
+        if asked and current_user.is_authenticated:
+            return "admin"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def install(self, app):
+        @app.before_request
+        def start_profile():
+            trigger = self.wanted()
+            # One at a time: tracemalloc and the sampler see the whole process
+            if trigger is None or not self._busy.acquire(blocking=False):
+                return
+            if self.mode == "sample":
+                collector = StackSampler(threading.get_ident(), self.interval)
+                collector.start()
+            else:
+                collector = cProfile.Profile()
+                collector.enable()
+            # Leave tracing alone if something else (PYTHONTRACEMALLOC) already runs it
+            traced = self.trace_allocations and not tracemalloc.is_tracing()
+            if traced:
+                tracemalloc.start()
+            g.profile = {"collector": collector, "trigger": trigger, "traced": traced, "started": time.perf_counter()}
+
+        @app.after_request
+        def finish_profile(response):
+            if g.get("profile"):
+                self._finish(g.pop("profile"), response.status_code)
+            return response
+
+        @app.teardown_request
+        def abandon_profile(exc):
+            # The view raised: after_request never ran
+            if g.get("profile"):
+                self._finish(g.pop("profile"), 500)
+
+    def _finish(self, state, status):
+        try:
+            collector = state["collector"]
+            if isinstance(collector, StackSampler):
+                collector.stop()
+            else:
+                collector.disable()
+            duration_ms = round((time.perf_counter() - state["started"]) * 1000, 1)
+            allocations, peak_kb = [], None
+            if state["traced"]:
+                snapshot = tracemalloc.take_snapshot()
+                peak_kb = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+                tracemalloc.stop()
+                allocations = _top_allocations(snapshot, TOP_ALLOCATIONS)
+
+            doc = {
+                "route": request.endpoint, "method": request.method, "path": request.path, "status": status,
+                "duration_ms": duration_ms, "trigger": state["trigger"], "request_id": g.get("request_id"),
+                "created_at": datetime.now(timezone.utc), "allocations": allocations, "peak_kb": peak_kb,
+            }
+            if isinstance(collector, StackSampler):
+                raw = collector.folded().encode("utf-8")
+                doc.update(mode="sample", frames=collector.top_frames(TOP_FRAMES), samples=sum(collector.stacks.values()),
+                           raw_format="folded")
+            else:
+                raw = _pstats_dump(collector)
+                doc.update(mode="cprofile", frames=_cprofile_top(collector, TOP_FRAMES), raw_format="pstats")
+            if len(raw) <= MAX_RAW_BYTES:
+                doc["raw"] = Binary(raw)
+            self.profiles.insert_one(doc)
+        except PyMongoError:
+            logger.exception("Could not store the profile of %s", request.path)
+        finally:
+            self._busy.release()
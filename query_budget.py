@@ -0,0 +1,163 @@
+# Per-route MongoDB query budgets
+#
+# A pymongo CommandListener counts the commands each request sends: reads (find,
+# aggregate, count, distinct), writes (insert, update, delete, findAndModify) and
+# GridFS chunk reads (find on *.chunks), in total and per collection. getMore only
+# continues a cursor and is not counted. ROUTE_BUDGETS caps them per (method,
+# endpoint); going over raises QueryBudgetExceeded (QUERY_BUDGETS=enforce) or logs a
+# warning (report), with the numbered list of commands the request sent. The check
+# runs after the view, when its writes have already happened, so enforce only raises
+# while app.testing is set (tests/); a running site only reports.
+# `flask check-query-budgets` requests every budgeted GET route once.
+#
+# Commands on bookkeeping collections (login, rate limits, idempotency keys, log
+# levels, profiles, scheduler) are listed in the trace but do not count: the budget
+# is about what the view itself reads and writes.
+import json, logging, threading
+from collections import Counter
+from flask import request
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+READ_COMMANDS = {"find", "aggregate", "count", "distinct"}
+WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify"}
+IGNORED_COLLECTIONS = {"admins", "rate_limits", "idempotency_keys", "log_levels", "profiles",
+                       "scheduler_jobs", "scheduler_locks"}
+SUMMARY_LENGTH = 160
+
+# (method, endpoint) -> limits; keys are reads, writes, chunk_reads, or "<kind>.<collection>"
+ROUTE_BUDGETS = {
+    ("GET", "index"): {"reads": 0, "writes": 0},
+    ("GET", "gallery"): {"reads": 1, "writes": 0},
+    # category metadata + one page of gallery_images
+    ("GET", "gallery_category"): {"reads": 2, "writes": 0},
+    ("GET", "api_categories"): {"reads": 1, "writes": 0},
+    ("GET", "api_category_images"): {"reads": 2, "writes": 0},
+    ("GET", "bookings_list"): {"reads": 1, "writes": 0},
+    ("GET", "feedbacks_list"): {"reads": 1, "writes": 0, "chunk_reads": 0},
+    ("GET", "contact_list"): {"reads": 1, "writes": 0},
+    # the booking insert, plus one bulk upsert per occupancy rollup
+    ("POST", "booking"): {"reads": 0, "writes": 3, "writes.bookings": 1},
+    ("POST", "api_create_booking"): {"reads": 0, "writes": 3, "writes.bookings": 1},
+    ("POST", "contact"): {"reads": 0, "writes": 1},
+}
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def _summary(command_name, command):
+    parts = []
+    for field in ("filter", "q", "pipeline", "query", "updates", "deletes", "sort", "limit"):
+        if field in command:
+            parts.append(f"{field}={json.dumps(command[field], default=str)}")
+    if command_name == "insert":
+        parts.append(f"documents={len(command.get('documents', []))}")
+    text = " ".join(parts)
+    return text if len(text) <= SUMMARY_LENGTH else text[:SUMMARY_LENGTH - 1] + "…"
+
+class Tracker:
+    def __init__(self):
+        self.counts = Counter()
+        self.commands = []
+        self._pending = {}
+
+    def record(self, event):
+        name = event.command_name
+        target = event.command.get(name)
+        collection = event.command.get("collection") if name == "getMore" else target if isinstance(target, str) else None
+        kind = None
+        if collection not in IGNORED_COLLECTIONS:
+            if name in READ_COMMANDS:
+                kind = "chunk_reads" if collection and collection.endswith(".chunks") else "reads"
+            elif name in WRITE_COMMANDS:
+                kind = "writes"
+        if kind:
+            self.counts[kind] += 1
+            self.counts[f"{kind}.{collection}"] += 1
+        entry = {"command": name, "collection": collection, "kind": kind,
+                 "summary": _summary(name, event.command), "ms": None}
+        self.commands.append(entry)
+        self._pending[event.request_id] = entry
+
+    def finish(self, event):
+        entry = self._pending.pop(event.request_id, None)
+        if entry is not None:
+            entry["ms"] = event.duration_micros / 1000
+
+    def over(self, budget):
+        return {key: (self.counts[key], limit) for key, limit in budget.items() if self.counts[key] > limit}
+
+    def trace(self):
+        lines = []
+        for number, c in enumerate(self.commands, 1):
+            counted = c["kind"] or "not counted"
+            took = f"{c['ms']:.1f} ms" if c["ms"] is not None else "?"
+            lines.append(f"  {number:3}. {c['command']} {c['collection'] or ''} [{counted}, {took}] {c['summary']}".rstrip())
+        return "\n".join(lines) or "  (no commands)"
+
+class BudgetListener(monitoring.CommandListener):
+    """Feeds the events of the current thread into its active Tracker, if any."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def start(self):
+        self._local.tracker = Tracker()
+        return self._local.tracker
+
+    def stop(self):
+        tracker, self._local.tracker = getattr(self._local, "tracker", None), None
+        if tracker is not None:
+            self._local.last = tracker
+        return tracker
+
+    def last(self):
+        """The tracker of the last request finished on this thread (for the CLI and tests)."""
+        return getattr(self._local, "last", None)
+
+    def started(self, event):
+        tracker = getattr(self._local, "tracker", None)
+        if tracker is not None:
+            tracker.record(event)
+
+    def succeeded(self, event):
+        tracker = getattr(self._local, "tracker", None)
+        if tracker is not None:
+            tracker.finish(event)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+listener = BudgetListener()
+
+def check(method, endpoint, path, tracker, budgets=ROUTE_BUDGETS):
+    """None when within budget (or unbudgeted), else a readable report."""
+    budget = budgets.get((method, endpoint))
+    if budget is None:
+        return None
+    over = tracker.over(budget)
+    if not over:
+        return None
+    limits = ", ".join(f"{key} {used} > {limit}" for key, (used, limit) in sorted(over.items()))
+    return f"Query budget exceeded for {method} {path} ({endpoint}): {limits}\n{tracker.trace()}"
+
+def install(app, mode):
+    """mode: "enforce" raises QueryBudgetExceeded under app.testing, "report" logs a warning."""
+    @app.before_request
+    def start_query_budget():
+        listener.start()
+
+    @app.after_request
+    def check_query_budget(response):
+        tracker = listener.stop()
+        report = check(request.method, request.endpoint, request.path, tracker) if tracker else None
+        if report and mode == "enforce" and app.testing:
+            raise QueryBudgetExceeded(report)
+        if report:
+            logger.warning(report)
+        return response
+
+    @app.teardown_request
+    def drop_query_tracker(exc):
+        listener.stop()
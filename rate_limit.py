@@ -0,0 +1,180 @@
+# Rate limiting for the unauthenticated POST endpoints (booking, feedback, contact)
+#
+# Checked in a before_request hook, so a shed request never reaches Mongo, GridFS or
+# SMTP. Two layers per route:
+#   - token buckets per client IP and per email address (a steady refill rate with a
+#     small burst allowance), so one guest or bot cannot flood a form;
+#   - a sliding window over the whole route, capping the total submissions per
+#     window no matter how many addresses a bot rotates through.
+# The email is only read from urlencoded or JSON bodies; multipart uploads are
+# limited by IP alone so that the body is never parsed for a request that gets shed.
+#
+# MemoryBackend keeps state per process; MongoBackend shares it between workers and
+# instances through the rate_limits collection (expired with a TTL index). The memory
+# buckets are bounded, so a bot rotating addresses cannot grow a worker's memory.
+# A sweep every SWEEP_SECONDS drops buckets that have refilled to capacity; they
+# behave exactly like a new bucket. Past MAX_BUCKETS, the least recently used bucket
+# is evicted, and the route-wide window still caps the total.
+import logging, threading, time
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# endpoint -> limits. Buckets are (capacity, seconds per token); window is (max requests, seconds)
+RULES = {
+    "booking": {"ip": (5, 120), "email": (3, 600), "window": (60, 60)},
+    "api_create_booking": {"ip": (5, 120), "email": (3, 600), "window": (60, 60)},
+    "feedback": {"ip": (3, 300), "email": (2, 900), "window": (30, 60)},
+    "api_create_feedback": {"ip": (3, 300), "email": (2, 900), "window": (30, 60)},
+    "contact": {"ip": (5, 120), "email": (3, 600), "window": (60, 60)},
+}
+MAX_BUCKETS = 10000
+SWEEP_SECONDS = 60
+
+def client_ip(request, proxy_hops=0):
+    """The caller's address, trusting `proxy_hops` X-Forwarded-For entries appended by our own proxies."""
+    if proxy_hops:
+        forwarded = [part.strip() for part in request.headers.get("X-Forwarded-For", "").split(",") if part.strip()]
+        if len(forwarded) >= proxy_hops:
+            return forwarded[-proxy_hops]
+    return request.remote_addr or "unknown"
+
+def submitted_email(request):
+    # Never touches multipart bodies (see module comment)
+    if request.mimetype == "application/x-www-form-urlencoded":
+        email = request.form.get("email")
+    elif request.is_json:
+        payload = request.get_json(silent=True)
+        email = payload.get("email") if isinstance(payload, dict) else None
+    else:
+        return None
+    email = str(email or "").strip().lower()
+    return email or None
+
+class MemoryBackend:
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self._lock = threading.Lock()
+        # key -> (tokens, updated, full_at), least recently used first
+        self._buckets = OrderedDict()
+        self._windows = defaultdict(deque)
+        self.max_buckets = max_buckets
+        self._swept_at = time.monotonic()
+
+    def take(self, key, capacity, interval):
+        """Take one token; returns seconds until one is available (0 when allowed)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.pop(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) / interval)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) * interval)
+            self._bound(now)
+            return 0 if allowed else (1 - tokens) * interval
+
+    def _bound(self, now):
+        if now - self._swept_at >= SWEEP_SECONDS:
+            self._swept_at = now
+            for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+                del self._buckets[key]
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+
+    def hit(self, key, limit, window):
+        """Count one request in a sliding window; returns seconds until there is room (0 when allowed)."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._windows[key]
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return hits[0] + window - now
+            hits.append(now)
+            return 0
+
+class MongoBackend:
+    """Shared state in `rate_limits`; each check is a single atomic update (MongoDB 4.2+ pipeline updates)."""
+
+    def __init__(self, db):
+        self.collection = db.rate_limits
+
+    def ensure_indexes(self):
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def take(self, key, capacity, interval):
+        now = datetime.now(timezone.utc)
+        refill = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, interval * 1000]}
+        doc = self.collection.find_one_and_update(
+            {"_id": "bucket:" + key},
+            [
+                {"$set": {"tokens": {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", capacity]}, refill]}]}, "updated": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                          "expires_at": now + timedelta(seconds=capacity * interval)}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return 0 if doc["allowed"] else (1 - doc["tokens"]) * interval
+
+    def hit(self, key, limit, window):
+        # Sliding-window counter: this fixed window plus the overlapping share of the previous one
+        now = time.time()
+        current = int(now // window)
+        elapsed = (now % window) / window
+        doc = self.collection.find_one_and_update(
+            {"_id": f"window:{key}:{current}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=2 * window)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        previous = self.collection.find_one({"_id": f"window:{key}:{current - 1}"}) or {}
+        if previous.get("count", 0) * (1 - elapsed) + doc["count"] > limit:
+            self.collection.update_one({"_id": doc["_id"]}, {"$inc": {"count": -1}})
+            return (1 - elapsed) * window
+        return 0
+
+class RateLimiter:
+    def __init__(self, backend, rules=RULES, proxy_hops=0):
+        self.backend = backend
+        self.rules = rules
+        self.proxy_hops = proxy_hops
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.shed = defaultdict(lambda: defaultdict(int))
+
+    def check(self, request):
+        """None when the request may proceed, else (reason, retry_after_seconds)."""
+        rule = self.rules.get(request.endpoint)
+        if rule is None or request.method != "POST":
+            return None
+        try:
+            retry = self.backend.take(f"{request.endpoint}:ip:{client_ip(request, self.proxy_hops)}", *rule["ip"])
+            reason = "ip"
+            if not retry and "email" in rule:
+                email = submitted_email(request)
+                if email:
+                    retry = self.backend.take(f"{request.endpoint}:email:{email}", *rule["email"])
+                    reason = "email"
+            if not retry and "window" in rule:
+                retry = self.backend.hit(request.endpoint, *rule["window"])
+                reason = "window"
+        except PyMongoError:
+            # Fail open: a sick rate-limit store must not take the forms down with it
+            logger.exception("Rate limit check failed, allowing request")
+            return None
+        with self._lock:
+            if retry:
+                self.shed[request.endpoint][reason] += 1
+            else:
+                self.allowed += 1
+        return (reason, max(1, int(retry + 0.999))) if retry else None
+
+    def stats(self):
+        with self._lock:
+            shed = {endpoint: dict(reasons) for endpoint, reasons in self.shed.items()}
+            return {"allowed": self.allowed, "shed": shed, "shed_total": sum(sum(r.values()) for r in shed.values())}
@@ -0,0 +1,160 @@
+# Retention tiers: keep the hot collections small
+#
+#   bookings  finished bookings (check-out older than BOOKING_ARCHIVE_AFTER_MONTHS, and
+#             not Pending) move in batches to an archive: the bookings_archive
+#             collection, or gzip'd JSON Lines files in ARCHIVE_DIR (one per check-out
+#             month). Rollups are left alone, so the dashboard keeps its history.
+#   contacts  expire through a TTL index on created_at (CONTACT_RETENTION_DAYS, 0 keeps
+#             them forever).
+#
+# Archived bookings stay searchable through the archive's search(): an indexed query on
+# the archive collection, or a sequential scan of the files (slow, admin-only).
+import glob, gzip, os, re
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from bson import json_util
+from pymongo import ASCENDING, ReplaceOne
+
+IST = ZoneInfo("Asia/Kolkata")
+ARCHIVE_COLLECTION = "bookings_archive"
+FINISHED_STATUSES = ["Accepted", "Rejected", "Expired"]
+CONTACTS_TTL_INDEX = "contacts_ttl"
+
+def months_ago(months, today=None):
+    """ISO date `months` calendar months before today (clamped to the month's last day)."""
+    today = today or datetime.now(IST).date()
+    year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+    day = today.day
+    while True:
+        try:
+            return today.replace(year=year, month=month + 1, day=day).isoformat()
+        except ValueError:
+            day -= 1
+
+def ensure_contacts_ttl(db, days):
+    """Create, retune or drop the contacts TTL index to match `days`; returns the action taken."""
+    existing = db.contacts.index_information().get(CONTACTS_TTL_INDEX)
+    if not days:
+        if existing:
+            db.contacts.drop_index(CONTACTS_TTL_INDEX)
+            return "dropped"
+        return "none"
+    seconds = days * 86400
+    if existing is None:
+        db.contacts.create_index("created_at", name=CONTACTS_TTL_INDEX, expireAfterSeconds=seconds)
+        return "created"
+    if existing.get("expireAfterSeconds") != seconds:
+        db.command("collMod", "contacts", index={"name": CONTACTS_TTL_INDEX, "expireAfterSeconds": seconds})
+        return "updated"
+    return "unchanged"
+
+class CollectionArchive:
+    def __init__(self, db):
+        self.collection = db[ARCHIVE_COLLECTION]
+
+    def ensure_indexes(self):
+        self.collection.create_index([("check_in", ASCENDING)])
+        self.collection.create_index([("email", ASCENDING)])
+        self.collection.create_index([("phone", ASCENDING)])
+
+    def write(self, docs):
+        """Archive `docs`; returns the ids now safely stored."""
+        # Upserts by _id, so a batch retried after a crash is not archived twice
+        self.collection.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in docs], ordered=False)
+        return [d["_id"] for d in docs]
+
+    def search(self, query, skip, limit):
+        cursor = self.collection.find(query).sort("check_in", -1).skip(skip).limit(limit)
+        return list(cursor), self.collection.count_documents(query)
+
+class FileArchive:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def ensure_indexes(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def write(self, docs):
+        """Archive `docs`; returns the ids now safely on disk.
+
+        A crash after the append but before the originals are deleted archives the batch
+        again on the next run; documents() reads each _id once, so the copy is harmless.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        written = []
+        by_month = {}
+        for d in docs:
+            by_month.setdefault((d.get("check_out") or "unknown")[:7], []).append(d)
+        for month, group in by_month.items():
+            # Appending makes a multi-member gzip file, which gzip.open reads back as one stream
+            with open(os.path.join(self.directory, f"bookings-{month}.jsonl.gz"), "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as out:
+                    out.write("".join(json_util.dumps(d) + "\n" for d in group).encode("utf-8"))
+                # On disk before the originals are deleted
+                raw.flush()
+                os.fsync(raw.fileno())
+            written.extend(d["_id"] for d in group)
+        return written
+
+    def _matches(self, doc, query):
+        for field, condition in query.items():
+            value = doc.get(field)
+            if isinstance(condition, dict):
+                if "$regex" in condition and not re.search(condition["$regex"], str(value or ""), re.I):
+                    return False
+                if "$gte" in condition and not (value or "") >= condition["$gte"]:
+                    return False
+                if "$lte" in condition and not (value or "") <= condition["$lte"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def documents(self):
+        """Every archived booking once, newest month first."""
+        seen = set()
+        for path in sorted(glob.glob(os.path.join(self.directory, "bookings-*.jsonl.gz")), reverse=True):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    doc = json_util.loads(line)
+                    if doc["_id"] not in seen:
+                        seen.add(doc["_id"])
+                        yield doc
+
+    def search(self, query, skip, limit):
+        # Newest months first, matching the collection archive's order
+        matches = [doc for doc in self.documents() if self._matches(doc, query)]
+        matches.sort(key=lambda d: d.get("check_in") or "", reverse=True)
+        return matches[skip:skip + limit], len(matches)
+
+def archive_query(months):
+    return {"status": {"$in": FINISHED_STATUSES}, "check_out": {"$lt": months_ago(months)}}
+
+def archive_bookings(db, sink, months, batch_size=500):
+    """Move finished bookings older than `months` into `sink`; returns how many moved."""
+    query = archive_query(months)
+    moved = 0
+    while True:
+        batch = list(db.bookings.find(query).sort("_id", ASCENDING).limit(batch_size))
+        if not batch:
+            return moved
+        written = sink.write(batch)
+        # Only what the archive confirmed, and only if it is still finished (an edit may have reopened it)
+        moved += db.bookings.delete_many({"_id": {"$in": written}, **query}).deleted_count
+        if len(batch) < batch_size:
+            return moved
+
+def archive_filter(text=None, date_from=None, date_to=None):
+    """Archive search filter: free text over name/email/phone, check-in range as YYYY-MM-DD."""
+    query = {}
+    if text:
+        text = text.strip()
+        field = "email" if "@" in text else "phone" if text.lstrip("+").isdigit() else "name"
+        query[field] = {"$regex": re.escape(text), "$options": "i"}
+    if date_from or date_to:
+        query["check_in"] = {}
+        if date_from:
+            query["check_in"]["$gte"] = datetime.strptime(date_from, "%Y-%m-%d").strftime("%Y-%m-%d")
+        if date_to:
+            query["check_in"]["$lte"] = datetime.strptime(date_to, "%Y-%m-%d").strftime("%Y-%m-%d")
+    return query
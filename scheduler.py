@@ -0,0 +1,183 @@
+# Periodic jobs with leader election through MongoDB
+#
+# Jobs are declared with a five-field cron expression (minute hour day month weekday,
+# evaluated in IST) and run either in a background thread of the web process or in a
+# sidecar (`flask run-scheduler`). Any number of instances may run the loop:
+#   - scheduler_locks {_id: "scheduler"} is a lease; only its current owner runs jobs,
+#     renewing it every tick, and another instance takes over once it lapses;
+#   - scheduler_jobs {_id: <job>} holds next_run_at, which the leader advances with a
+#     compare-and-set before running, so a run is never started twice even across a
+#     leadership hand-over; the same document records timing and last-run status.
+import logging, os, socket, threading, time, uuid
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+IST = ZoneInfo("Asia/Kolkata")
+LOCK_ID = "scheduler"
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))  # weekday: 0 = Sunday
+
+def _parse_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        expr, _, step = part.partition("/")
+        if expr == "*":
+            start, end = low, high
+        elif "-" in expr:
+            start, end = (int(v) for v in expr.split("-"))
+        else:
+            start = end = int(expr)
+        if step and expr != "*" and "-" not in expr:
+            end = high
+        if not (low <= start <= end <= high):
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, int(step or 1)))
+    return values
+
+class Cron:
+    """A five-field cron expression, e.g. "*/15 * * * *" or "30 9 * * 1-5"."""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_field(field, *bounds) for field, bounds in zip(fields, CRON_FIELDS))
+        # Like cron: when both day fields are restricted, either may match
+        self.any_day = fields[2] == "*" or fields[4] == "*"
+
+    def _day_matches(self, moment):
+        day, weekday = moment.day in self.days, (moment.isoweekday() % 7) in self.weekdays
+        return (day and weekday) if self.any_day else (day or weekday)
+
+    def next_after(self, moment):
+        """The first matching minute strictly after `moment` (an aware datetime), in IST."""
+        moment = moment.astimezone(IST).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(366 * 24 * 60):
+            if moment.month not in self.months or not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+class Job:
+    def __init__(self, name, schedule, func, batch_size):
+        self.name = name
+        self.cron = Cron(schedule)
+        self.func = func
+        self.batch_size = batch_size
+
+class Scheduler:
+    def __init__(self, db, tick_seconds=30, lease_seconds=120, batch_size=200):
+        self.locks = db.scheduler_locks
+        self.status = db.scheduler_jobs
+        self.tick_seconds = tick_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.batch_size = batch_size
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.jobs = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def job(self, name, schedule, batch_size=None):
+        """Register `func(batch_size)`; it returns a small dict summary that is stored as last_result."""
+        def decorator(func):
+            self.jobs[name] = Job(name, schedule, func, batch_size or self.batch_size)
+            return func
+        return decorator
+
+    def is_leader(self):
+        now = datetime.now(timezone.utc)
+        try:
+            self.locks.find_one_and_update(
+                {"_id": LOCK_ID, "$or": [{"owner": self.owner}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "lease_until": now + self.lease, "renewed_at": now}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # The document exists and someone else holds an unexpired lease
+            return False
+
+    def release(self):
+        self.locks.delete_one({"_id": LOCK_ID, "owner": self.owner})
+
+    def _claim_run(self, job, now):
+        """Advance next_run_at if the job is due; True when this call won the run."""
+        state = self.status.find_one({"_id": job.name}, {"next_run_at": 1, "schedule": 1})
+        if state is None or state.get("schedule") != job.cron.expression:
+            # New or rescheduled job: first run at its next slot
+            self.status.update_one({"_id": job.name},
+                                   {"$set": {"schedule": job.cron.expression, "next_run_at": job.cron.next_after(now)}},
+                                   upsert=True)
+            return False
+        due = state["next_run_at"]
+        if due.tzinfo is None:
+            due = due.replace(tzinfo=timezone.utc)
+        if due > now:
+            return False
+        return self.status.find_one_and_update(
+            {"_id": job.name, "next_run_at": state["next_run_at"]},
+            {"$set": {"next_run_at": job.cron.next_after(now)}}
+        ) is not None
+
+    def run_job(self, name):
+        """Run one job now and record its outcome (used by the loop and `flask run-job`)."""
+        job = self.jobs[name]
+        started = datetime.now(timezone.utc)
+        self.status.update_one({"_id": name}, {"$set": {"last_started_at": started, "running_on": self.owner}}, upsert=True)
+        clock = time.perf_counter()
+        update = {"$inc": {"runs": 1}, "$unset": {"running_on": ""}}
+        try:
+            result = job.func(job.batch_size) or {}
+            update["$set"] = {"last_status": "ok", "last_result": result, "last_error": None}
+        except Exception as e:
+            logger.exception("Scheduled job %s failed", name)
+            result = None
+            update["$set"] = {"last_status": "error", "last_error": f"{type(e).__name__}: {e}"}
+            update["$inc"]["failures"] = 1
+        update["$set"].update(last_finished_at=datetime.now(timezone.utc),
+                              last_duration_ms=round((time.perf_counter() - clock) * 1000, 1))
+        self.status.update_one({"_id": name}, update)
+        return result
+
+    def tick(self):
+        if not self.is_leader():
+            return []
+        ran = []
+        for job in self.jobs.values():
+            if self._claim_run(job, datetime.now(timezone.utc)):
+                self.run_job(job.name)
+                ran.append(job.name)
+        return ran
+
+    def run_forever(self):
+        logger.info("Scheduler %s started with %d job(s)", self.owner, len(self.jobs))
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except PyMongoError:
+                logger.exception("Scheduler tick failed")
+            self._stop.wait(self.tick_seconds)
+        self.release()
+
+    def start(self):
+        """Run the loop in a daemon thread of this process (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def statuses(self):
+        docs = {d["_id"]: d for d in self.status.find({"_id": {"$in": list(self.jobs)}})}
+        return [dict(docs.get(name, {}), name=name, schedule=job.cron.expression) for name, job in self.jobs.items()]
@@ -0,0 +1,137 @@
+# Admin full-text search over contacts, feedback comments and bookings
+#
+# Each collection gets one weighted MongoDB text index, so a lookup is an index scan
+# ranked by textScore; the per-collection top hits are merged into one ranked list.
+# Mock/local databases without $text support use InvertedIndex, an in-memory index
+# built from the same fields and refreshed when a collection's size or newest _id
+# changes (or after max_age seconds, to pick up edits).
+import re, time, logging
+from collections import defaultdict
+from pymongo import TEXT
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "admin_search"
+
+# Field weights per collection: exact identifiers rank above free text
+SEARCH_FIELDS = {
+    "bookings": {"name": 10, "email": 10, "phone": 10, "note": 2},
+    "contacts": {"name": 10, "email": 10, "message": 2},
+    "feedbacks": {"comments": 2},
+}
+
+# Extra fields returned with each hit for the results page
+DISPLAY_FIELDS = {
+    "bookings": ("name", "email", "phone", "note", "check_in", "check_out", "status", "created_at"),
+    "contacts": ("name", "email", "message", "created_at"),
+    "feedbacks": ("name", "rating", "comments", "created_at"),
+}
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower()) if text else []
+
+def ensure_indexes(db):
+    for collection, weights in SEARCH_FIELDS.items():
+        db[collection].create_index([(field, TEXT) for field in weights], weights=weights, name=INDEX_NAME)
+
+def _hit(collection, doc, score):
+    return {
+        "collection": collection,
+        "id": str(doc["_id"]),
+        "score": round(score, 3),
+        "doc": {field: doc.get(field) for field in DISPLAY_FIELDS[collection] if doc.get(field) is not None},
+    }
+
+def _merge(ranked, page, per_page):
+    ranked.sort(key=lambda hit: hit["score"], reverse=True)
+    start = (page - 1) * per_page
+    return ranked[start:start + per_page]
+
+def mongo_search(db, query, collections, page, per_page):
+    # The overall top (page * per_page) can only come from each collection's own top (page * per_page)
+    limit = page * per_page
+    projection = {field: 1 for fields in DISPLAY_FIELDS.values() for field in fields}
+    projection["score"] = {"$meta": "textScore"}
+    ranked, total = [], 0
+    for collection in collections:
+        text_filter = {"$text": {"$search": query}}
+        cursor = db[collection].find(text_filter, projection).sort([("score", {"$meta": "textScore"})]).limit(limit)
+        ranked.extend(_hit(collection, doc, doc["score"]) for doc in cursor)
+        total += db[collection].count_documents(text_filter)
+    return _merge(ranked, page, per_page), total
+
+class InvertedIndex:
+    """token -> {(collection, _id): weighted term frequency}, with the display docs alongside."""
+
+    def __init__(self, db, max_age=30):
+        self.db = db
+        self.max_age = max_age
+        self.postings = defaultdict(lambda: defaultdict(float))
+        self.docs = {}
+        self.fingerprint = None
+        self.built_at = 0.0
+
+    def _current_fingerprint(self):
+        fingerprint = []
+        for collection in SEARCH_FIELDS:
+            latest = self.db[collection].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+            fingerprint.append((self.db[collection].count_documents({}), latest and latest["_id"]))
+        return tuple(fingerprint)
+
+    def refresh(self, force=False):
+        fingerprint = self._current_fingerprint()
+        if not force and fingerprint == self.fingerprint and time.monotonic() - self.built_at < self.max_age:
+            return
+        postings = defaultdict(lambda: defaultdict(float))
+        docs = {}
+        for collection, weights in SEARCH_FIELDS.items():
+            fields = set(weights) | set(DISPLAY_FIELDS[collection])
+            for doc in self.db[collection].find({}, {field: 1 for field in fields}):
+                key = (collection, doc["_id"])
+                docs[key] = doc
+                for field, weight in weights.items():
+                    for token in tokenize(doc.get(field)):
+                        postings[token][key] += weight
+        self.postings, self.docs = postings, docs
+        self.fingerprint = fingerprint
+        self.built_at = time.monotonic()
+
+    def search(self, query, collections, page, per_page):
+        self.refresh()
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            for key, weight in self.postings.get(token, {}).items():
+                if key[0] in collections:
+                    scores[key] += weight
+        ranked = [_hit(key[0], self.docs[key], score) for key, score in scores.items()]
+        return _merge(ranked, page, per_page), len(ranked)
+
+class Searcher:
+    """Picks MongoDB $text search or the in-memory index ("auto", "mongo" or "memory")."""
+
+    def __init__(self, db, backend="auto", memory_max_age=30):
+        self.db = db
+        self.backend = backend
+        self.memory = InvertedIndex(db, max_age=memory_max_age)
+
+    def search(self, query, collections=None, page=1, per_page=20):
+        collections = [c for c in (collections or SEARCH_FIELDS) if c in SEARCH_FIELDS]
+        started = time.perf_counter()
+        if self.backend != "memory":
+            try:
+                hits, total = mongo_search(self.db, query, collections, page, per_page)
+                return hits, total, (time.perf_counter() - started) * 1000
+            except (NotImplementedError, TypeError):
+                # Mock clients without $text/textScore support: stay in memory from now on
+                if self.backend == "mongo":
+                    raise
+                self.backend = "memory"
+            except OperationFailure as e:
+                if self.backend == "mongo":
+                    raise
+                logger.warning("Text search failed (%s); run `flask create-indexes`. Using the in-memory index", e)
+        hits, total = self.memory.search(query, collections, page, per_page)
+        return hits, total, (time.perf_counter() - started) * 1000
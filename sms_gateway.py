@@ -0,0 +1,141 @@
+# SMS notifications through a pluggable backend
+#
+# One backend object per process holds the provider client and its HTTP session, so
+# connections are reused across bookings, and every call has an explicit timeout.
+# Sends run on a small thread pool, off the request: at most SMS_MAX_WORKERS at a
+# time and SMS_MAX_PENDING waiting, beyond which a message is dropped rather than
+# queued without bound. The outcome is written to the booking as
+#   sms: {status: sent|failed|dropped, backend, to, provider_id, error, at}
+# Backends: "twilio", "http" (a JSON-over-HTTPS provider; subclass HttpBackend and
+# override payload()/message_id() for another provider's format) and "stub", which
+# only logs and remembers the messages, for development and tests.
+import logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+class SmsError(Exception):
+    pass
+
+class TwilioBackend:
+    name = "twilio"
+
+    def __init__(self, sid, token, sender, timeout=10):
+        self.sid, self.token, self.sender, self.timeout = sid, token, sender, timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from twilio.http.http_client import TwilioHttpClient
+                from twilio.rest import Client
+                self._client = Client(self.sid, self.token, http_client=TwilioHttpClient(timeout=self.timeout))
+            return self._client
+
+    def send(self, to, body):
+        from twilio.base.exceptions import TwilioException
+        try:
+            return self.client().messages.create(body=body, from_=self.sender, to=to).sid
+        except TwilioException as e:
+            raise SmsError(str(e)) from e
+
+class HttpBackend:
+    name = "http"
+
+    def __init__(self, url, api_key, sender, timeout=10):
+        import requests
+        self.url, self.sender, self.timeout = url, sender, timeout
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = api_key or ""
+
+    def payload(self, to, body):
+        return {"sender": self.sender, "to": to, "message": body}
+
+    def message_id(self, data):
+        return data.get("request_id") or data.get("id")
+
+    def send(self, to, body):
+        import requests
+        try:
+            response = self.session.post(self.url, json=self.payload(to, body), timeout=self.timeout)
+            response.raise_for_status()
+            return self.message_id(response.json())
+        except (requests.RequestException, ValueError) as e:
+            raise SmsError(str(e)) from e
+
+class StubBackend:
+    name = "stub"
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, to, body):
+        self.sent.append({"to": to, "body": body})
+        logger.info("SMS (stub) to %s: %s", to, body)
+        return f"stub-{len(self.sent)}"
+
+def make_backend(name, config):
+    """The configured backend; "" picks Twilio when its credentials are set, else none."""
+    name = name or ("twilio" if config.TWILIO_SID else "")
+    if name == "twilio":
+        return TwilioBackend(config.TWILIO_SID, config.TWILIO_AUTH_TOKEN, config.TWILIO_PHONE, config.SMS_TIMEOUT)
+    if name == "http":
+        return HttpBackend(config.SMS_HTTP_URL, config.SMS_HTTP_API_KEY, config.SMS_SENDER_ID, config.SMS_TIMEOUT)
+    if name == "stub":
+        return StubBackend()
+    if name in ("", "off"):
+        return None
+    raise ValueError(f"Unknown SMS_BACKEND: {name}")
+
+class SmsGateway:
+    def __init__(self, db, backend, max_workers=2, max_pending=50):
+        self.db = db
+        self.backend = backend
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sms")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def _record(self, booking_id, to, status, provider_id=None, error=None):
+        if booking_id is None:
+            return
+        sms = {"status": status, "backend": self.backend.name, "to": to, "provider_id": provider_id,
+               "error": error, "at": datetime.now(timezone.utc)}
+        try:
+            self.db.bookings.update_one({"_id": booking_id}, {"$set": {"sms": sms}}) # type: ignore
+        except PyMongoError:
+            logger.exception("Failed to record SMS status for booking %s", booking_id)
+
+    def _deliver(self, to, body, booking_id):
+        try:
+            provider_id = self.backend.send(to, body)
+        except Exception as e:
+            logger.exception("Failed to send SMS to %s", to)
+            self._record(booking_id, to, "failed", error=str(e))
+        else:
+            self._record(booking_id, to, "sent", provider_id=provider_id)
+        finally:
+            self._slots.release()
+
+    def send(self, to, body, booking_id=None):
+        """Queue a message; returns False when disabled or when too many are already waiting."""
+        if not self.enabled or not to:
+            return False
+        if not self._slots.acquire(blocking=False):
+            logger.warning("SMS queue full, dropping message to %s", to)
+            self._record(booking_id, to, "dropped", error="queue full")
+            return False
+        self._pool.submit(self._deliver, to, body, booking_id)
+        return True
+
+    def send_now(self, to, body):
+        """Send in the calling thread (CLI); raises SmsError on failure."""
+        return self.backend.send(to, body)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
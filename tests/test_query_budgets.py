@@ -0,0 +1,52 @@
+from datetime import date, timedelta
+import pytest
+import query_budget
+
+def seed_gallery(db):
+    db.categories.insert_one({"key": "rooms", "title": "Rooms", "image_count": 2, "sample": []})
+    db.gallery_images.insert_many([
+        {"category_key": "rooms", "image": f"room{i}.jpg", "position": i} for i in range(2)
+    ])
+
+def booking_form(**changes):
+    check_in = date.today() + timedelta(days=10)
+    form = {"name": "Ana", "phone": "+359888000000", "email": "ana@example.com",
+            "check_in": check_in.isoformat(), "check_out": (check_in + timedelta(days=2)).isoformat(),
+            "guests": "2", "note": ""}
+    form.update(changes)
+    return form
+
+def counts():
+    return query_budget.listener.last().counts
+
+def test_gallery_within_budget(client, db):
+    seed_gallery(db)
+    assert client.get("/gallery").status_code == 200
+    assert counts()["reads"] == 1
+    assert counts()["writes"] == 0
+
+def test_gallery_category_within_budget(client, db):
+    seed_gallery(db)
+    response = client.get("/gallery/rooms")
+    assert response.status_code == 200
+    assert b"room1.jpg" in response.data
+    assert counts()["reads"] == 2
+    assert counts()["writes"] == 0
+
+def test_booking_within_budget(client, db):
+    assert client.post("/booking", data=booking_form()).status_code == 302
+    assert db.bookings.count_documents({}) == 1
+    assert counts()["writes.bookings"] == 1
+    assert counts()["writes"] == 3
+    assert counts()["reads"] == 0
+
+def test_over_budget_raises(client, db, monkeypatch):
+    monkeypatch.setitem(query_budget.ROUTE_BUDGETS, ("GET", "gallery"), {"reads": 0})
+    with pytest.raises(query_budget.QueryBudgetExceeded, match="reads 1 > 0"):
+        client.get("/gallery")
+
+def test_enforce_only_reports_outside_testing(app, client, db, monkeypatch, caplog):
+    monkeypatch.setitem(query_budget.ROUTE_BUDGETS, ("GET", "gallery"), {"reads": 0})
+    monkeypatch.setitem(app.config, "TESTING", False)
+    assert client.get("/gallery").status_code == 200
+    assert "Query budget exceeded for GET /gallery" in caplog.text
@@ -0,0 +1,198 @@
+# Streaming, size-bounded multipart uploads
+#
+# Werkzeug's multipart parser asks Request._get_file_stream() for a container per
+# file part and writes the body into it chunk by chunk. UploadRequest hands it an
+# UploadSink instead, which sniffs magic bytes on the first chunk, enforces the
+# per-file cap as bytes arrive and, for views decorated with @stream_to_gridfs,
+# writes straight into GridFS so the file is never buffered by the worker. GridFS
+# sinks also hash the bytes on the way (sha256) for photo_fingerprints.py.
+import hashlib, tempfile, time
+from functools import wraps
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import cached_property, secure_filename
+import config
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+SNIFF_BYTES = max(len(magic) for magic, _ in IMAGE_SIGNATURES)
+
+def sniff_image(head):
+    for magic, mimetype in IMAGE_SIGNATURES:
+        if head.startswith(magic):
+            return mimetype
+    return None
+
+class UploadSink:
+    """Write target for one uploaded file part."""
+
+    def __init__(self, filename, max_bytes):
+        self.filename = secure_filename(filename or "")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.mimetype = None
+        self.rejected = None
+        self.finished = False
+        self._head = b""
+        self._started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def write(self, data):
+        if self.rejected or not data:
+            return
+        if self.mimetype is None:
+            self._head += data
+            if len(self._head) < SNIFF_BYTES:
+                return
+            self.mimetype = sniff_image(self._head)
+            if self.mimetype is None:
+                self.reject("not a JPEG, PNG or GIF image")
+                return
+            data, self._head = self._head, b""
+            self._open()
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"{self.filename} is larger than {self.max_bytes // (1024 * 1024)} MB.")
+        self._write(data)
+
+    def seek(self, offset, whence=0):
+        # The parser rewinds the container once the part is complete
+        if not self.finished:
+            self.finish()
+        return self._seek(offset, whence)
+
+    def finish(self):
+        self.finished = True
+        if self.rejected:
+            return
+        if self.mimetype is None:
+            # Part ended before SNIFF_BYTES arrived
+            if self._head and sniff_image(self._head):
+                self.reject("file is truncated")
+            else:
+                self.reject("empty file" if not self._head else "not a JPEG, PNG or GIF image")
+            return
+        self._finish()
+        self.elapsed = time.perf_counter() - self._started
+        current_app.logger.info(
+            "Upload %s stored: %d bytes in %.1f ms (%.1f KiB/s)",
+            self.filename, self.size, self.elapsed * 1000, self.throughput / 1024
+        )
+
+    @property
+    def throughput(self):
+        return self.size / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def stored(self):
+        return self.finished and not self.rejected
+
+    def reject(self, reason):
+        self.rejected = reason
+        self.discard()
+
+    # Storage hooks
+    def _open(self): pass
+    def _write(self, data): pass
+    def _finish(self): pass
+    def _seek(self, offset, whence): return 0
+    def discard(self): pass
+
+class GridFSSink(UploadSink):
+    def __init__(self, fs, filename, max_bytes):
+        super().__init__(filename, max_bytes)
+        self.fs = fs
+        self.file_id = None
+        self._grid_in = None
+        self._hash = hashlib.sha256()
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def _open(self):
+        self._grid_in = self.fs.new_file(filename=self.filename, contentType=self.mimetype)
+
+    def _write(self, data):
+        self._hash.update(data)
+        self._grid_in.write(data) # type: ignore
+
+    def _finish(self):
+        self._grid_in.close() # type: ignore
+        self.file_id = self._grid_in._id # type: ignore
+
+    def discard(self):
+        if self._grid_in is None:
+            return
+        if self.file_id is not None:
+            self.fs.delete(self.file_id)
+            self.file_id = None
+        else:
+            self._grid_in.abort()
+        self._grid_in = None
+
+class SpooledSink(UploadSink):
+    # For views that post-process the file themselves; spills to disk past 1 MB
+    def _open(self):
+        self._file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+
+    def _write(self, data):
+        self._file.write(data)
+
+    def _seek(self, offset, whence):
+        return self._file.seek(offset, whence) if hasattr(self, "_file") else 0
+
+    def read(self, size=-1):
+        return self._file.read(size) if self.stored else b""
+
+    def tell(self):
+        return self._file.tell() if hasattr(self, "_file") else 0
+
+    def discard(self):
+        if hasattr(self, "_file"):
+            self._file.close()
+            del self._file
+
+def stream_to_gridfs(fs):
+    """Mark a view so its file uploads are written directly into `fs`."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return view(*args, **kwargs)
+        wrapper.upload_gridfs = fs # type: ignore
+        return wrapper
+    return decorator
+
+class UploadRequest(Request):
+    max_form_memory_size = config.MAX_FORM_MEMORY_BYTES
+
+    @cached_property
+    def upload_sinks(self):
+        return []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_bytes = config.MAX_UPLOAD_FILE_BYTES
+        if content_length and content_length > max_bytes:
+            self.discard_uploads()
+            raise RequestEntityTooLarge(f"{filename} is larger than {max_bytes // (1024 * 1024)} MB.")
+        view = current_app.view_functions.get(self.endpoint) # type: ignore
+        fs = getattr(view, "upload_gridfs", None)
+        sink = GridFSSink(fs, filename, max_bytes) if fs is not None else SpooledSink(filename, max_bytes)
+        self.upload_sinks.append(sink)
+        return sink
+
+    def _load_form_data(self):
+        try:
+            super()._load_form_data()
+        except RequestEntityTooLarge:
+            # Nothing from a rejected request may stay behind in GridFS
+            self.discard_uploads()
+            raise
+
+    def discard_uploads(self):
+        for sink in self.upload_sinks:
+            sink.discard()